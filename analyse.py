@@ -1,115 +1,241 @@
 # analyse.py
 
 import pandas as pd
+import threading
+import time
+from collections.abc import Mapping
 from datetime import datetime, timedelta
+from utils.analysis.compact import compact_frame
+from utils.analysis.product_cube import ProductCube
+from utils.analysis.product_index import ProductIndex
+from utils.analysis.time_buckets import TimeBucketIndex
 
-def analyze_data(invoices_df):
+ITEM_COLUMNS = ['datetime', 'ten_hang', 'so_luong', 'thanh_tien', 'nhom', 'loai']
+
+def flatten_items(invoices_df):
     """
-    Thực hiện phân tích toàn diện, đảm bảo tất cả các kiểu dữ liệu số
-    được chuyển đổi sang kiểu gốc của Python để tương thích với JSON.
+    Làm phẳng 'chi_tiet' của mọi hóa đơn thành một bảng chi tiết, mỗi dòng kèm thời điểm hóa đơn.
+    Bảng dùng bố cục gọn: tên/nhóm/loại là categorical, số lượng và thành tiền là số nguyên nhỏ nhất đủ chứa.
     """
-    if invoices_df.empty:
-        return {}
+    all_items = []
+    details_column = invoices_df['chi_tiet'] if 'chi_tiet' in invoices_df.columns else [[]] * len(invoices_df)
+    for invoice_datetime, details in zip(invoices_df['datetime'], details_column):
+        if not isinstance(details, list):
+            continue
+        for item in details:
+            all_items.append((
+                invoice_datetime,
+                item.get('ten_hang'),
+                item.get('so_luong', 0),
+                item.get('thanh_tien', 0),
+                item.get('nhom', 'Không xác định'),
+                item.get('loai', 'Chưa phân loại')
+            ))
+    items_df = pd.DataFrame(all_items, columns=ITEM_COLUMNS)
+    items_df['datetime'] = pd.to_datetime(items_df['datetime'])
+    return compact_frame(items_df)
+
+VIETNAMESE_DAYS_MAP = {
+    'Monday': 'Thứ Hai', 'Tuesday': 'Thứ Ba', 'Wednesday': 'Thứ Tư',
+    'Thursday': 'Thứ Năm', 'Friday': 'Thứ Sáu', 'Saturday': 'Thứ Bảy', 'Sunday': 'Chủ Nhật'
+}
+DAY_ORDER_VIETNAMESE = ['Thứ Hai', 'Thứ Ba', 'Thứ Tư', 'Thứ Năm', 'Thứ Sáu', 'Thứ Bảy', 'Chủ Nhật']
+
+class AnalysisSections(Mapping):
+    """
+    Kết quả phân tích dạng dict nhưng mỗi mục chỉ được tính ở lần truy cập đầu tiên rồi ghi nhớ lại.
+    Các mục dùng chung một bảng chi tiết đã làm phẳng, một ProductCube và một TimeBucketIndex,
+    bản thân chúng cũng chỉ được dựng khi có mục cần đến.
+    Có thể truyền sẵn các bảng tổng hợp hoặc cả các mục đã tính (ví dụ từ shared memory).
+    """
+    SECTIONS = ('overall_metrics', 'dashboard_data', 'product_analysis', 'reports_analysis', 'product_hierarchy')
+    # True nếu các lô đã nạp được lưu bền vững cùng dữ liệu (không cần phát lại log khi khởi động)
+    persistent = False
+
+    def __init__(self, invoices_df, product_cube=None, time_index=None, sections=None, release_details=False):
+        self._invoices_df = invoices_df
+        # True khi bảng hóa đơn thuộc riêng đối tượng này (data_loader): cột chi_tiet (list các dict,
+        # chiếm phần lớn bộ nhớ) được bỏ tại chỗ ngay khi đã làm phẳng thành bảng chi tiết
+        self._release_details = release_details
+        self._pending_invoices = []
+        self._items_df = None
+        self._pending_items = []
+        self._product_cube = product_cube
+        self._time_index = time_index
+        self._product_index = None
+        self._sections = dict(sections or {})
+        self._empty = not self._sections and (invoices_df is None or invoices_df.empty)
+        # Thời gian (giây) của lần tính gần nhất cho từng mục, để theo dõi hiệu năng
+        self.compute_seconds = {}
+        # Server Flask chạy đa luồng: tránh hai request cùng tính một mục
+        self._lock = threading.RLock()
+
+    # --- Các bảng dùng chung ---
+    @property
+    def invoices_df(self):
+        with self._lock:
+            if self._pending_invoices:
+                self._invoices_df = pd.concat([self._invoices_df, *self._pending_invoices], ignore_index=True)
+                self._pending_invoices = []
+            return self._invoices_df
+
+    @property
+    def items_df(self):
+        with self._lock:
+            if self._items_df is None:
+                self._items_df = flatten_items(self.invoices_df)
+                if self._release_details and 'chi_tiet' in self._invoices_df.columns:
+                    self._invoices_df.drop(columns='chi_tiet', inplace=True)
+            elif self._pending_items:
+                # Nối các categorical khác tập giá trị sẽ ra cột chuỗi thường, nên thu gọn lại
+                self._items_df = compact_frame(pd.concat([self._items_df, *self._pending_items], ignore_index=True))
+            self._pending_items = []
+            return self._items_df
+
+    @property
+    def product_cube(self):
+        with self._lock:
+            if self._product_cube is None:
+                self._product_cube = ProductCube.from_items(self.items_df)
+            return self._product_cube
+
+    @property
+    def time_index(self):
+        with self._lock:
+            if self._time_index is None:
+                self._time_index = TimeBucketIndex.from_invoices(self.invoices_df)
+            return self._time_index
+
+    @property
+    def product_index(self):
+        """Chỉ mục phân trang/tìm kiếm trên mục product_analysis."""
+        with self._lock:
+            if self._product_index is None:
+                self._product_index = ProductIndex(self['product_analysis'])
+            return self._product_index
+
+    # --- Giao diện Mapping ---
+    def __getitem__(self, key):
+        if self._empty or key not in self.SECTIONS:
+            raise KeyError(key)
+        with self._lock:
+            if key not in self._sections:
+                start = time.perf_counter()
+                self._sections[key] = getattr(self, f'_compute_{key}')()
+                self.compute_seconds[key] = time.perf_counter() - start
+            return self._sections[key]
+
+    def __iter__(self):
+        return iter(() if self._empty else self.SECTIONS)
+
+    def __len__(self):
+        return 0 if self._empty else len(self.SECTIONS)
+
+    def computed_sections(self):
+        """Tên các mục đã được tính."""
+        return [key for key in self.SECTIONS if key in self._sections]
+
+    def top_products(self, n):
+        """n sản phẩm đầu của product_analysis (doanh thu giảm dần)."""
+        return self.get('product_analysis', [])[:n]
+
+    def invoice_count(self):
+        """Số hóa đơn đang được phân tích (kể cả các lô đã nạp thêm)."""
+        if self._invoices_df is None:
+            return self.get('overall_metrics', {}).get('total_invoices', 0)
+        with self._lock:
+            return len(self._invoices_df) + sum(len(batch) for batch in self._pending_invoices)
+
+    # --- Nạp thêm hóa đơn ---
+    def apply_batch(self, batch_df):
+        """
+        Gộp một lô hóa đơn mới (cùng định dạng với invoices_df) vào các bảng tổng hợp đã dựng
+        mà không tính lại từ đầu: cộng lô vào TimeBucketIndex và ProductCube, cập nhật tại chỗ
+        overall_metrics; các mục còn lại được tính lại từ bảng tổng hợp ở lần truy cập sau.
+        Bảng hóa đơn và bảng chi tiết chỉ được nối thêm khi có mục thực sự cần đến.
+        """
+        if self._invoices_df is None:
+            raise ValueError("Không thể nạp thêm hóa đơn vào snapshot chỉ đọc")
+        if batch_df.empty:
+            return
+        with self._lock:
+            details_released = self._release_details and self._items_df is not None
+            self._pending_invoices.append(batch_df.drop(columns='chi_tiet', errors='ignore') if details_released else batch_df)
+            self._merge_batch(batch_df)
+
+    def _merge_batch(self, batch_df):
+        """Cộng lô vào các bảng tổng hợp đã dựng và bỏ các mục đã ghi nhớ (trừ overall_metrics)."""
+        batch_items = flatten_items(batch_df)
+        with self._lock:
+            if self._time_index is not None:
+                self._time_index = self._time_index.merge(TimeBucketIndex.from_invoices(batch_df))
+            if self._product_cube is not None:
+                self._product_cube = self._product_cube.merge(ProductCube.from_items(batch_items))
+            if self._items_df is not None:
+                self._pending_items.append(batch_items)
+
+            overall_metrics = self._sections.get('overall_metrics')
+            self._sections = {}
+            self._product_index = None
+            self._empty = False
+            if overall_metrics is not None:
+                self._sections['overall_metrics'] = self._update_overall_metrics(overall_metrics, batch_df)
+
+    def _update_overall_metrics(self, overall_metrics, batch_df):
+        return {
+            "total_invoices": overall_metrics["total_invoices"] + int(len(batch_df)),
+            "total_revenue": overall_metrics["total_revenue"] + int(batch_df['tong_tien_hoa_don'].sum()),
+            "current_month_revenue": self.time_index.month_to_date_revenue()
+        }
 
     # --- Các chỉ số tổng quan ---
-    total_invoices = len(invoices_df)
-    overall_total_revenue = invoices_df['tong_tien_hoa_don'].sum()
-    
-    latest_date = invoices_df['datetime'].max()
-    current_month_start = latest_date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    current_month_df = invoices_df[invoices_df['datetime'] >= current_month_start]
-    current_month_revenue = current_month_df['tong_tien_hoa_don'].sum()
+    def _compute_overall_metrics(self):
+        invoices_df = self.invoices_df
+        latest_date = invoices_df['datetime'].max()
+        current_month_start = latest_date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        current_month_df = invoices_df[invoices_df['datetime'] >= current_month_start]
+        return {
+            "total_invoices": int(len(invoices_df)),
+            "total_revenue": int(invoices_df['tong_tien_hoa_don'].sum()),
+            "current_month_revenue": int(current_month_df['tong_tien_hoa_don'].sum())
+        }
 
+    # --- Phân tích theo thời gian cho Dashboard chính ---
+    def _compute_dashboard_data(self):
+        time_index = self.time_index
+        latest_date_normalized = time_index.last_day
+        return {
+            "today": time_index.period(latest_date_normalized, 1),
+            "yesterday": time_index.period(latest_date_normalized - timedelta(days=1), 1),
+            "last7days": time_index.period(latest_date_normalized - timedelta(days=6), 7)
+        }
 
     # --- Phân tích sản phẩm ---
-    all_items = []
-    for index, row in invoices_df.iterrows():
-        for item in row.get('chi_tiet', []):
-            all_items.append({
-                'ten_hang': item.get('ten_hang'),
-                'so_luong': item.get('so_luong', 0),
-                'thanh_tien': item.get('thanh_tien', 0),
-                'nhom': item.get('nhom', 'Không xác định'), 
-                'loai': item.get('loai', 'Chưa phân loại')
-            })
-    items_df = pd.DataFrame(all_items)
-    
-    product_summary = items_df.groupby('ten_hang').agg(
-        total_quantity=('so_luong', 'sum'),
-        total_revenue=('thanh_tien', 'sum')
-    ).reset_index().sort_values(by='total_revenue', ascending=False)
-    
-    product_summary['total_quantity'] = product_summary['total_quantity'].astype(int)
-    product_summary['total_revenue'] = product_summary['total_revenue'].astype(int)
+    def _compute_product_analysis(self):
+        return self.product_cube.product_summary().to_dict(orient='records')
 
     # --- HIERARCHICAL PRODUCT ANALYSIS ---
-    product_hierarchy = {}
-    if not items_df.empty:
-        for nhom_name, nhom_df in items_df.groupby('nhom'):
-            product_hierarchy[nhom_name] = {
-                'total_revenue': int(nhom_df['thanh_tien'].sum()),
-                'categories': {}
-            }
-            for loai_name, loai_df in nhom_df.groupby('loai'):
-                top_products = loai_df.groupby('ten_hang')['thanh_tien'].sum().nlargest(5)
-                
-                product_hierarchy[nhom_name]['categories'][loai_name] = {
-                    'total_revenue': int(loai_df['thanh_tien'].sum()),
-                    'top_products': top_products.astype(int).to_dict()
-                }
+    def _compute_product_hierarchy(self):
+        return self.product_cube.hierarchy(top=5)
 
     # --- Phân tích cho trang Reports ---
-    df_reports = invoices_df.copy()
-    vietnamese_days_map = {
-        'Monday': 'Thứ Hai', 'Tuesday': 'Thứ Ba', 'Wednesday': 'Thứ Tư',
-        'Thursday': 'Thứ Năm', 'Friday': 'Thứ Sáu', 'Saturday': 'Thứ Bảy', 'Sunday': 'Chủ Nhật'
-    }
-    day_order_vietnamese = ['Thứ Hai', 'Thứ Ba', 'Thứ Tư', 'Thứ Năm', 'Thứ Sáu', 'Thứ Bảy', 'Chủ Nhật']
-    df_reports['weekday_english'] = df_reports['datetime'].dt.day_name()
-    df_reports['weekday_vietnamese'] = df_reports['weekday_english'].map(vietnamese_days_map)
-    weekday_sales = df_reports.groupby('weekday_vietnamese')['tong_tien_hoa_don'].sum()
-    weekday_sales = weekday_sales.reindex(day_order_vietnamese, fill_value=0)
-    df_reports['month'] = df_reports['datetime'].dt.strftime('%Y-%m')
-    monthly_sales = df_reports.groupby('month')['tong_tien_hoa_don'].sum()
-    item_distribution = items_df.groupby('loai')['thanh_tien'].sum()
+    def _compute_reports_analysis(self):
+        # Thứ trong tuần và tháng lấy từ mã số nguyên của TimeBucketIndex, không sao chép bảng hóa đơn
+        weekday_totals = self.time_index.weekday_totals()
+        return {
+            'weekday_sales': {day: int(total) for day, total in zip(DAY_ORDER_VIETNAMESE, weekday_totals)},
+            'monthly_sales': {month: int(total) for month, total in self.time_index.monthly_totals().items()},
+            'item_distribution': self.product_cube.item_distribution().astype(int).to_dict()
+        }
 
-    # --- Phân tích theo thời gian cho Dashboard chính ---
-    latest_date_normalized = latest_date.normalize()
-    today_df = invoices_df[invoices_df['datetime'].dt.normalize() == latest_date_normalized]
-    yesterday_df = invoices_df[invoices_df['datetime'].dt.normalize() == (latest_date_normalized - timedelta(days=1))]
-    last7days_start = latest_date_normalized - timedelta(days=6)
-    last7days_df = invoices_df[(invoices_df['datetime'] >= last7days_start) & (invoices_df['datetime'] < latest_date_normalized + timedelta(days=1))]
-
-    def process_period(df, start_date, num_days):
-        result = {'total': int(df['tong_tien_hoa_don'].sum()), 'byHour': [0]*24, 'byDay': {}}
-        hourly_sum = df.groupby(df['datetime'].dt.hour)['tong_tien_hoa_don'].sum()
-        for hour, total in hourly_sum.items():
-            result['byHour'][int(hour)] = int(total)
-        for i in range(num_days):
-            day = start_date + timedelta(days=i)
-            result['byDay'][day.strftime('%Y-%m-%d')] = 0
-        daily_sum = df.groupby(df['datetime'].dt.date)['tong_tien_hoa_don'].sum()
-        for date, total in daily_sum.items():
-            result['byDay'][date.strftime('%Y-%m-%d')] = int(total)
-        return result
-
-    # --- Tổng hợp tất cả kết quả ---
-    return {
-        "overall_metrics": {
-            "total_invoices": int(total_invoices),
-            "total_revenue": int(overall_total_revenue),
-            "current_month_revenue": int(current_month_revenue)
-        },
-        "dashboard_data": {
-            "today": process_period(today_df, latest_date_normalized, 1),
-            "yesterday": process_period(yesterday_df, latest_date_normalized - timedelta(days=1), 1),
-            "last7days": process_period(last7days_df, last7days_start, 7)
-        },
-        "product_analysis": product_summary.to_dict(orient='records'),
-        "reports_analysis": {
-            'weekday_sales': weekday_sales.astype(int).to_dict(),
-            'monthly_sales': monthly_sales.astype(int).to_dict(),
-            'item_distribution': item_distribution.astype(int).to_dict()
-        },
-        "product_hierarchy": product_hierarchy
-    }
\ No newline at end of file
+def analyze_data(invoices_df, product_cube=None, time_index=None):
+    """
+    Thực hiện phân tích toàn diện, đảm bảo tất cả các kiểu dữ liệu số
+    được chuyển đổi sang kiểu gốc của Python để tương thích với JSON.
+    Có thể truyền sẵn product_cube (ProductCube) và time_index (TimeBucketIndex)
+    để không phải dựng lại các bảng tổng hợp.
+    Dùng AnalysisSections trực tiếp nếu chỉ cần một vài mục.
+    """
+    if invoices_df.empty:
+        return {}
+    return dict(AnalysisSections(invoices_df, product_cube=product_cube, time_index=time_index))
@@ -0,0 +1,214 @@
+"""
+Tạo lại báo cáo lịch sử cho cả một khoảng thời gian, mỗi ngày/tuần/tháng một báo cáo.
+
+Dữ liệu của cả khoảng được lấy từ n8n đúng một lần (hoặc đọc từ tệp --payload), tiền xử lý
+một lần rồi chia theo kỳ trong bộ nhớ. Mỗi kỳ là một tác vụ trong process pool: tính số liệu,
+vẽ biểu đồ vào thư mục riêng của kỳ và tạo báo cáo Word. Không gọi LLM và không gửi email.
+
+Tiến độ được ghi vào <output>/progress.json sau mỗi kỳ hoàn tất, nên chạy lại cùng lệnh sẽ
+bỏ qua các kỳ đã có báo cáo hoặc không có dữ liệu (dùng --force để tạo lại tất cả).
+
+    python backfill.py --from 2024-08-01 --to 2025-07-31 --granularity day --workers 8
+    python backfill.py --from 2025-01-01 --to 2025-06-30 --granularity month --payload payload.json
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from main_v3_test import APPROXIMATE_STATS, calculate_comprehensive_stats, fetch_data, render_charts
+from preprocessing import preprocessing_data
+from utils.tracing.tracer import span, summary_table, tracer
+
+GRANULARITIES = ('day', 'week', 'month')
+DEFAULT_OUTPUT_DIR = os.path.join('reports', 'backfill')
+PROGRESS_FILE = 'progress.json'
+
+
+def period_of(day: date, granularity: str) -> Tuple[str, date, date]:
+    """(khóa, ngày đầu, ngày cuối) của kỳ chứa day; tuần bắt đầu từ thứ Hai (tuần ISO)."""
+    if granularity == 'day':
+        return day.isoformat(), day, day
+    if granularity == 'week':
+        start = day - timedelta(days=day.weekday())
+        year, week, _ = day.isocalendar()
+        return f"{year}-W{week:02d}", start, start + timedelta(days=6)
+    start = day.replace(day=1)
+    end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return start.strftime('%Y-%m'), start, end
+
+
+def split_periods(from_date: date, to_date: date, granularity: str) -> List[Tuple[str, date, date]]:
+    """Các kỳ phủ [from_date, to_date], kỳ đầu/cuối được cắt theo khoảng."""
+    periods, day = [], from_date
+    while day <= to_date:
+        key, start, end = period_of(day, granularity)
+        periods.append((key, max(start, from_date), min(end, to_date)))
+        day = end + timedelta(days=1)
+    return periods
+
+
+def report_filename(key: str, start: date, granularity: str) -> str:
+    if granularity == 'day':
+        return f"Báo cáo ngày {start.strftime('%d-%m-%Y')}.docx"
+    if granularity == 'week':
+        return f"Báo cáo tuần {key}.docx"
+    return f"Báo cáo tháng {start.strftime('%m-%Y')}.docx"
+
+
+def group_rows(rows: List[Dict[str, Any]], granularity: str) -> Tuple[Dict[str, List[Dict[str, Any]]], int]:
+    """Chia các dòng đã tiền xử lý theo kỳ; trả về ({khóa: dòng}, số dòng không có ngày hợp lệ)."""
+    by_period: Dict[str, List[Dict[str, Any]]] = {}
+    undated = 0
+    for row in rows:
+        try:
+            day = date.fromisoformat(row.get('date') or '')
+        except ValueError:
+            undated += 1
+            continue
+        by_period.setdefault(period_of(day, granularity)[0], []).append(row)
+    return by_period, undated
+
+
+def build_period_report(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Tác vụ của một kỳ (chạy trong tiến trình con): số liệu -> biểu đồ -> báo cáo Word."""
+    from utils.report.docx_builder import render_report
+
+    started = time.perf_counter()
+    calculations = calculate_comprehensive_stats(job['rows'], approximate=job['approximate'])
+    computed = time.perf_counter()
+    chart_paths = render_charts(calculations, job['charts_dir'])
+    charted = time.perf_counter()
+    render_report(calculations, chart_paths, job['report_path'])
+    return {
+        'key': job['key'],
+        'report_path': job['report_path'],
+        'rows': len(job['rows']),
+        'total_revenue': calculations['revenue_summary']['total_revenue'],
+        'seconds': {
+            'calculations': round(computed - started, 3),
+            'charts': round(charted - computed, 3),
+            'report': round(time.perf_counter() - charted, 3),
+        },
+    }
+
+
+def load_progress(path: str) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_progress(path: str, progress: Dict[str, Any]):
+    """Ghi tiến độ qua tệp tạm rồi đổi tên, để dừng giữa chừng cũng không làm hỏng tệp."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(progress, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def is_finished(entry: Dict[str, Any]) -> bool:
+    """Kỳ không cần chạy lại: đã có báo cáo (tệp còn tồn tại) hoặc không có dữ liệu."""
+    if entry.get('status') == 'empty':
+        return True
+    return entry.get('status') == 'done' and os.path.exists(entry.get('report_path', ''))
+
+
+def backfill(from_date: date, to_date: date, granularity: str, output_dir: str = DEFAULT_OUTPUT_DIR,
+             workers: Optional[int] = None, payload: Optional[Any] = None, force: bool = False,
+             approximate: bool = APPROXIMATE_STATS) -> Dict[str, Any]:
+    """Tạo báo cáo cho mọi kỳ trong khoảng; trả về nội dung progress.json sau khi chạy."""
+    os.makedirs(output_dir, exist_ok=True)
+    progress_path = os.path.join(output_dir, PROGRESS_FILE)
+    params = {'from': from_date.isoformat(), 'to': to_date.isoformat(), 'granularity': granularity}
+    progress = {} if force else load_progress(progress_path)
+    if progress.get('params') != params:
+        progress = {'params': params, 'periods': {}}
+    done = progress['periods']
+
+    periods = split_periods(from_date, to_date, granularity)
+    pending = [p for p in periods if not is_finished(done.get(p[0], {}))]
+    print(f"🗓️ {len(periods)} kỳ ({granularity}) từ {from_date} đến {to_date}: "
+          f"{len(periods) - len(pending)} đã xong, {len(pending)} cần tạo.")
+    if not pending:
+        return progress
+
+    if payload is None:
+        payload = fetch_data(from_date.isoformat(), to_date.isoformat())
+    with span("preprocessing_data") as s:
+        rows = preprocessing_data(payload)
+        by_period, undated = group_rows(rows, granularity)
+        s.set(rows=len(rows), undated=undated)
+    if undated:
+        print(f"⚠️ Bỏ qua {undated:,} dòng không có ngày hợp lệ.")
+
+    jobs = []
+    for key, start, end in pending:
+        period_rows = by_period.get(key, [])
+        if not period_rows:
+            done[key] = {'status': 'empty', 'start': start.isoformat(), 'end': end.isoformat()}
+            continue
+        jobs.append({
+            'key': key,
+            'rows': period_rows,
+            'approximate': approximate,
+            'charts_dir': os.path.join(output_dir, 'charts', key),
+            'report_path': os.path.join(output_dir, report_filename(key, start, granularity)),
+        })
+    save_progress(progress_path, progress)
+
+    with span("backfill.pool", periods=len(jobs), workers=workers) as s:
+        failed = 0
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(build_period_report, job): job['key'] for job in jobs}
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failed += 1
+                    done[key] = {'status': 'failed', 'error': str(e)}
+                    print(f"❌ {key}: {e}")
+                else:
+                    done[key] = dict(result, status='done', finished_at=datetime.now().isoformat(timespec='seconds'))
+                    print(f"✅ {key}: {result['rows']:,} dòng -> {result['report_path']}")
+                save_progress(progress_path, progress)
+        s.set(failed=failed)
+    return progress
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tạo lại báo cáo lịch sử theo ngày/tuần/tháng song song.")
+    parser.add_argument('--from', dest='from_date', required=True, type=date.fromisoformat, help="YYYY-MM-DD")
+    parser.add_argument('--to', dest='to_date', required=True, type=date.fromisoformat, help="YYYY-MM-DD")
+    parser.add_argument('--granularity', choices=GRANULARITIES, default='day')
+    parser.add_argument('--workers', type=int, default=None, help="Số tiến trình (mặc định: số CPU)")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument('--payload', help="Tệp JSON payload n8n đã tải sẵn thay vì gọi webhook")
+    parser.add_argument('--force', action='store_true', help="Bỏ qua tiến độ cũ, tạo lại mọi kỳ")
+    args = parser.parse_args()
+    if args.to_date < args.from_date:
+        parser.error("--to phải không sớm hơn --from")
+
+    payload = None
+    if args.payload:
+        with open(args.payload, encoding='utf-8') as f:
+            payload = json.load(f)
+
+    with span("backfill", granularity=args.granularity, workers=args.workers) as root:
+        progress = backfill(args.from_date, args.to_date, args.granularity, args.output, args.workers,
+                            payload, args.force)
+    statuses = [period['status'] for period in progress['periods'].values()]
+    print(f"\n🎉 Xong: {statuses.count('done')} báo cáo, {statuses.count('empty')} kỳ không có dữ liệu, "
+          f"{statuses.count('failed')} lỗi. Tiến độ: {os.path.join(args.output, PROGRESS_FILE)}")
+    print(summary_table(tracer.collect(root.trace_id)))
+    if 'failed' in statuses:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Kiểm tra thời gian khởi động (cold import) của CLI báo cáo bằng `python -X importtime`.
+
+Thất bại (exit 1) nếu:
+- thời gian import main_v3_test (tốt nhất trong --runs lần) vượt --budget-ms;
+- một thư viện nặng chỉ dùng trong node (langgraph, langchain, matplotlib, python-docx, ...) bị import lúc khởi động;
+- việc import tạo thư mục charts/ hoặc reports/.
+
+    python -m benchmarks.import_budget
+    python -m benchmarks.import_budget --budget-ms 200 --module main_v3_test
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BUDGET_MS = 250
+HEAVY_MODULES = ('langgraph', 'langchain_core', 'langchain_google_genai', 'matplotlib', 'seaborn', 'docx',
+                 'PIL', 'requests', 'pandas')
+LAZY_DIRECTORIES = ('charts', 'reports')
+LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def import_profile(module: str) -> Tuple[List[Tuple[int, int, int, str]], List[str]]:
+    """Chạy import trong tiến trình mới (thư mục tạm làm cwd); trả về (self_us, cumulative_us, depth, tên) và các thư mục mới."""
+    with tempfile.TemporaryDirectory() as cwd:
+        env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                cwd=cwd, env=env, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise SystemExit(f"Không import được {module}:\n{result.stderr[-2000:]}")
+        created = [name for name in LAZY_DIRECTORIES if os.path.exists(os.path.join(cwd, name))]
+    entries = []
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((int(self_us), int(cumulative_us), len(indent) // 2, name))
+    return entries, created
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kiểm tra ngân sách thời gian import của CLI báo cáo.")
+    parser.add_argument('--module', default='main_v3_test')
+    parser.add_argument('--budget-ms', type=float, default=float(os.getenv('IMPORT_BUDGET_MS', DEFAULT_BUDGET_MS)))
+    parser.add_argument('--runs', type=int, default=5, help="Lấy lần nhanh nhất để giảm nhiễu")
+    args = parser.parse_args()
+
+    best_ms, best_entries, created = None, [], []
+    for _ in range(args.runs):
+        entries, created = import_profile(args.module)
+        total_ms = next(cumulative for _, cumulative, _, name in entries if name == args.module) / 1000
+        if best_ms is None or total_ms < best_ms:
+            best_ms, best_entries = total_ms, entries
+
+    # Các import trực tiếp của module (độ sâu 1) tốn thời gian nhất
+    direct: Dict[str, int] = {}
+    for _, cumulative, depth, name in best_entries:
+        if depth == 1:
+            direct[name] = direct.get(name, 0) + cumulative
+    print(f"import {args.module}: {best_ms:.1f} ms (ngân sách {args.budget_ms:.0f} ms, tốt nhất trong {args.runs} lần)")
+    for name, cumulative in sorted(direct.items(), key=lambda kv: kv[1], reverse=True)[:10]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    problems = []
+    if best_ms > args.budget_ms:
+        problems.append(f"vượt ngân sách: {best_ms:.1f} ms > {args.budget_ms:.0f} ms")
+    imported = {name.split('.')[0] for _, _, _, name in best_entries}
+    eager = sorted(imported & set(HEAVY_MODULES))
+    if eager:
+        problems.append(f"thư viện nặng bị import lúc khởi động: {', '.join(eager)}")
+    if created:
+        problems.append(f"import tạo thư mục: {', '.join(created)}")
+    for problem in problems:
+        print(f"❌ {problem}")
+    if problems:
+        sys.exit(1)
+    print("✅ Đạt ngân sách khởi động.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Báo cáo bộ nhớ (bytes / hóa đơn) của bảng hóa đơn và bảng chi tiết theo bố cục cũ và bố cục gọn.
+
+- Cũ: bảng hóa đơn như pd.read_json trả về, giữ cột chi_tiet (list các dict); bảng chi tiết với
+  ten_hang/nhom/loai là chuỗi và số lượng/thành tiền int64.
+- Gọn (utils/analysis/compact.py): chi_tiet được bỏ sau khi làm phẳng; tên/nhóm/loại là categorical,
+  cột số nguyên thu về kiểu nhỏ nhất.
+
+Dữ liệu được sinh và đo theo từng khối rồi cộng lại (bộ nhớ của bảng cộng tính theo số dòng),
+nên đo được 1 triệu hóa đơn mà không cần giữ cả hai bố cục trong RAM cùng lúc.
+
+    python -m benchmarks.memory_report --invoices 1000000
+"""
+import argparse
+import io
+import json
+import sys
+import time
+
+import pandas as pd
+
+from analyse import flatten_items
+from benchmarks.synthetic import generate_invoices
+from utils.analysis.compact import CATEGORY_COLUMNS, compact_frame
+
+CHUNK_INVOICES = 100_000
+
+
+def frame_bytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def object_bytes(values) -> int:
+    """Kích thước các list/dict lồng nhau (như chi_tiet), mỗi đối tượng dùng chung chỉ tính một lần."""
+    seen, total, stack = set(), 0, list(values)
+    while stack:
+        value = stack.pop()
+        if id(value) in seen:
+            continue
+        seen.add(id(value))
+        total += sys.getsizeof(value)
+        if isinstance(value, dict):
+            stack.extend(value.keys())
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+    return total
+
+
+def legacy_items(items_df: pd.DataFrame) -> pd.DataFrame:
+    """Bảng chi tiết theo bố cục cũ (chuỗi, int64/float64) để so sánh."""
+    legacy = items_df.copy()
+    for column in CATEGORY_COLUMNS:
+        legacy[column] = legacy[column].astype(legacy[column].cat.categories.dtype)
+    for column in ('so_luong', 'thanh_tien'):
+        legacy[column] = legacy[column].astype('float64' if legacy[column].dtype.kind == 'f' else 'int64')
+    return legacy
+
+
+def measure_chunk(num_invoices: int, seed: int) -> dict:
+    text = json.dumps(generate_invoices(num_invoices, seed=seed), ensure_ascii=False)
+    # Đọc như data_loader để các chuỗi trong chi_tiet là đối tượng riêng như khi tải tệp thật
+    invoices_df = pd.read_json(io.StringIO(text))
+    invoices_df['datetime'] = pd.to_datetime(invoices_df['datetime'])
+    del text
+
+    items_df = flatten_items(invoices_df)
+    before_invoices = frame_bytes(invoices_df.drop(columns='chi_tiet')) + object_bytes(invoices_df['chi_tiet'])
+    before_items = frame_bytes(legacy_items(items_df))
+
+    invoices_df.drop(columns='chi_tiet', inplace=True)
+    after_invoices = frame_bytes(compact_frame(invoices_df))
+    after_items = frame_bytes(items_df)
+    return {
+        'invoices': num_invoices,
+        'items': len(items_df),
+        'before': {'invoices_df': before_invoices, 'items_df': before_items},
+        'after': {'invoices_df': after_invoices, 'items_df': after_items},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bộ nhớ theo hóa đơn của bố cục bảng cũ và bố cục gọn.")
+    parser.add_argument('--invoices', type=int, default=1_000_000)
+    parser.add_argument('--chunk', type=int, default=CHUNK_INVOICES)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    totals = {'invoices': 0, 'items': 0,
+              'before': {'invoices_df': 0, 'items_df': 0}, 'after': {'invoices_df': 0, 'items_df': 0}}
+    for index, offset in enumerate(range(0, args.invoices, args.chunk)):
+        chunk = measure_chunk(min(args.chunk, args.invoices - offset), seed=42 + index)
+        totals['invoices'] += chunk['invoices']
+        totals['items'] += chunk['items']
+        for layout in ('before', 'after'):
+            for table, size in chunk[layout].items():
+                totals[layout][table] += size
+        print(f"   {totals['invoices']:,} / {args.invoices:,} hóa đơn", end='\r', flush=True)
+
+    n = totals['invoices']
+    print(f"\n{n:,} hóa đơn, {totals['items']:,} dòng chi tiết (đo trong {time.perf_counter() - start:.0f}s)\n")
+    print(f"{'Bảng':<14} {'Cũ (MB)':>10} {'Gọn (MB)':>10} {'Cũ B/HĐ':>10} {'Gọn B/HĐ':>10} {'Giảm':>7}")
+    rows = list(totals['before']) + ['tổng']
+    for table in rows:
+        before = sum(totals['before'].values()) if table == 'tổng' else totals['before'][table]
+        after = sum(totals['after'].values()) if table == 'tổng' else totals['after'][table]
+        print(f"{table:<14} {before / 1e6:>10.1f} {after / 1e6:>10.1f} {before / n:>10.0f} {after / n:>10.0f}"
+              f" {1 - after / before:>7.1%}")
+
+
+if __name__ == '__main__':
+    main()
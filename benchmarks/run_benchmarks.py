@@ -0,0 +1,211 @@
+"""
+Đo hiệu năng các đường xử lý chính trên dữ liệu giả lập ở nhiều quy mô và lưu kết quả JSON
+để so sánh giữa các lần chạy (phát hiện hồi quy).
+
+    python -m benchmarks.run_benchmarks --scales 10k,100k
+    python -m benchmarks.run_benchmarks --scales 1m --repeat 1 --label before-refactor
+    python -m benchmarks.run_benchmarks --scales 10k --compare benchmarks/results/before-refactor.json
+
+Các phép đo: analyze_data (phân tích đầy đủ, chưa có cache), preprocessing_data và
+calculate_comprehensive_stats (chính xác và xấp xỉ) trên payload n8n, retrieve_knowledge,
+và các endpoint Flask (lần đầu: tính + tuần tự hóa; lần sau: phục vụ từ cache).
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import pandas as pd
+
+from benchmarks.synthetic import generate_invoices, generate_n8n_payload
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+ENDPOINTS = [
+    '/api/dashboard-data',
+    '/api/dashboard-period?days=30',
+    '/api/product-analysis',
+    '/api/product-analysis?limit=50&sort=-total_quantity&q=ca',
+    '/api/reports-analysis',
+    '/api/product-hierarchy',
+]
+KNOWLEDGE_ENTRIES = 2_000
+KNOWLEDGE_QUESTION = "Phân tích doanh thu theo khung giờ và sản phẩm bán chạy trong tuần"
+REGRESSION_RATIO = 1.2
+
+
+def measure(func: Callable[[], Any], repeat: int, setup: Optional[Callable[[], Any]] = None) -> Dict[str, float]:
+    """Thời gian (giây) của func qua repeat lần chạy; setup (không tính giờ) chạy trước mỗi lần."""
+    timings = []
+    for _ in range(repeat):
+        argument = setup() if setup else None
+        start = time.perf_counter()
+        func(argument) if setup else func()
+        timings.append(time.perf_counter() - start)
+    return {'min': min(timings), 'median': statistics.median(timings), 'runs': repeat}
+
+
+def _invoices_df(invoices: List[Dict[str, Any]]) -> pd.DataFrame:
+    df = pd.DataFrame(invoices)
+    df['datetime'] = pd.to_datetime(df['datetime'])
+    return df
+
+
+def bench_analysis(invoices_df: pd.DataFrame, repeat: int) -> Dict[str, Any]:
+    from analyse import analyze_data
+    return {'analyze_data': measure(lambda: analyze_data(invoices_df), repeat)}
+
+
+def bench_stats(num_orders: int, repeat: int) -> Dict[str, Any]:
+    from preprocessing import preprocessing_data
+    from main_v3_test import calculate_comprehensive_stats
+
+    payload = generate_n8n_payload(num_orders)
+    rows = preprocessing_data(payload)
+    return {
+        'preprocessing_data': measure(lambda: preprocessing_data(payload), repeat),
+        'calculate_comprehensive_stats': measure(lambda: calculate_comprehensive_stats(rows, approximate=False), repeat),
+        'calculate_comprehensive_stats_approximate': measure(
+            lambda: calculate_comprehensive_stats(rows, approximate=True), repeat),
+    }
+
+
+def bench_knowledge(repeat: int) -> Dict[str, Any]:
+    from utils.knowledge import knowledge_base
+
+    words = KNOWLEDGE_QUESTION.split() + ['khách', 'món', 'giá', 'khuyến', 'mãi', 'tồn', 'kho', 'nhân', 'viên']
+    entries = [
+        {'id': i + 1, 'text': ' '.join(words[(i * 7 + j) % len(words)] for j in range(12)), 'tags': []}
+        for i in range(KNOWLEDGE_ENTRIES)
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'knowledge.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, ensure_ascii=False)
+        original, knowledge_base.KNOWLEDGE_FILE = knowledge_base.KNOWLEDGE_FILE, path
+        try:
+            return {'retrieve_knowledge': measure(lambda: knowledge_base.retrieve_knowledge(KNOWLEDGE_QUESTION), repeat)}
+        finally:
+            knowledge_base.KNOWLEDGE_FILE = original
+
+
+def bench_endpoints(invoices_df: pd.DataFrame, repeat: int) -> Dict[str, Any]:
+    import index
+    from analyse import AnalysisSections
+
+    client = index.app.test_client()
+
+    def fresh_data():
+        index.invoices_df, index.analyzed_data = invoices_df, AnalysisSections(invoices_df)
+        index.response_cache.invalidate()
+
+    def get(url):
+        response = client.get(url)
+        assert response.status_code == 200, f"{url}: {response.status_code}"
+
+    results = {}
+    for url in ENDPOINTS:
+        results[f'GET {url} (cold)'] = measure(lambda _: get(url), repeat, setup=fresh_data)
+        results[f'GET {url} (cached)'] = measure(lambda: get(url), max(repeat, 5))
+    return results
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: Dict[str, Any], baseline_path: str) -> int:
+    """In bảng so sánh median với một lần chạy trước; trả về số phép đo chậm hơn ngưỡng."""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)['results']
+    regressions = 0
+    print(f"\nSo sánh với {baseline_path} (median, hồi quy nếu chậm hơn {REGRESSION_RATIO}x):")
+    for scale, benches in results.items():
+        for name, timing in benches.items():
+            before = baseline.get(scale, {}).get(name)
+            if not before:
+                continue
+            ratio = timing['median'] / before['median'] if before['median'] else float('inf')
+            flag = '  ⚠️ chậm hơn' if ratio > REGRESSION_RATIO else ''
+            regressions += bool(flag)
+            print(f"  [{scale}] {name:<70} {before['median'] * 1000:10.2f} ms -> {timing['median'] * 1000:10.2f} ms"
+                  f"  ({ratio:.2f}x){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark các đường xử lý chính trên dữ liệu giả lập.")
+    parser.add_argument('--scales', default='10k,100k', help=f"Danh sách quy mô, trong {', '.join(SCALES)}")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', default='analysis,stats,knowledge,endpoints',
+                        help="Nhóm phép đo: analysis, stats, knowledge, endpoints")
+    parser.add_argument('--label', default=None, help="Tên tệp kết quả (mặc định theo thời gian)")
+    parser.add_argument('--compare', default=None, help="Tệp kết quả trước đó để so sánh")
+    args = parser.parse_args()
+
+    # Không để index.py theo dõi tệp hay ghi log nạp hóa đơn vào thư mục dự án khi đo
+    os.environ.setdefault('DATA_RELOAD_SECONDS', '0')
+    os.environ.setdefault('INGEST_LOG', os.path.join(tempfile.gettempdir(), 'benchmark_ingest.jsonl'))
+
+    groups = set(args.only.split(','))
+    results: Dict[str, Dict[str, Any]] = {}
+    if 'knowledge' in groups:
+        results['knowledge'] = bench_knowledge(args.repeat)
+    for scale in args.scales.split(','):
+        size = SCALES[scale]
+        print(f"⏱️  Quy mô {scale} ({size:,} hóa đơn)...")
+        results[scale] = {}
+        if groups & {'analysis', 'endpoints'}:
+            start = time.perf_counter()
+            invoices_df = _invoices_df(generate_invoices(size))
+            print(f"   Sinh dữ liệu: {time.perf_counter() - start:.1f}s")
+            if 'analysis' in groups:
+                results[scale].update(bench_analysis(invoices_df, args.repeat))
+            if 'endpoints' in groups:
+                results[scale].update(bench_endpoints(invoices_df, args.repeat))
+            del invoices_df
+        if 'stats' in groups:
+            results[scale].update(bench_stats(size, args.repeat))
+
+    for scale, benches in results.items():
+        print(f"\n[{scale}]")
+        for name, timing in benches.items():
+            print(f"  {name:<70} min {timing['min'] * 1000:10.2f} ms   median {timing['median'] * 1000:10.2f} ms")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    label = args.label or datetime.now().strftime('%Y%m%d-%H%M%S')
+    output = {
+        'meta': {
+            'label': label,
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'git_revision': git_revision(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'pandas': pd.__version__,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    path = os.path.join(RESULTS_DIR, f'{label}.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(output, f, ensure_ascii=False, indent=2)
+    print(f"\n✅ Đã lưu kết quả vào {path}")
+
+    if args.compare:
+        regressions = compare(results, args.compare)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""
+Sinh dữ liệu bán hàng F&B giả lập, tất định theo seed, ở cả hai định dạng:
+- hóa đơn 'chi_tiet' như invoices.json (đầu vào của analyse.py / index.py);
+- đơn hàng n8n có 'products' (đầu vào của preprocessing_data / main_v3_test.py).
+
+    python -m benchmarks.synthetic --invoices 100000 --out invoices_synthetic.json
+    python -m benchmarks.synthetic --invoices 100000 --format n8n --out orders_synthetic.json
+"""
+import argparse
+import json
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+MENU_CATALOG = {
+    ('Đồ uống', 'Cà phê'): ['Cà phê đen', 'Cà phê sữa', 'Bạc xỉu', 'Cappuccino', 'Latte', 'Americano', 'Cà phê muối'],
+    ('Đồ uống', 'Trà'): ['Trà đào', 'Trà vải', 'Trà chanh', 'Trà sữa', 'Trà xanh', 'Trà ô long'],
+    ('Đồ uống', 'Sinh tố'): ['Sinh tố bơ', 'Sinh tố xoài', 'Sinh tố dâu', 'Nước cam', 'Nước ép dưa hấu'],
+    ('Thức ăn', 'Cơm'): ['Cơm gà', 'Cơm sườn', 'Cơm chiên', 'Cơm bò lúc lắc', 'Cơm tấm'],
+    ('Thức ăn', 'Bún - Phở'): ['Phở bò', 'Phở gà', 'Bún chả', 'Bún bò Huế', 'Hủ tiếu'],
+    ('Thức ăn', 'Bánh'): ['Bánh mì', 'Bánh flan', 'Bánh croissant', 'Bánh tiramisu', 'Bánh bông lan'],
+}
+SIZES = ['', ' (M)', ' (L)', ' đặc biệt', ' size nhỏ']
+# Trọng số theo giờ trong ngày: cao điểm trưa và tối như một quán F&B
+HOUR_WEIGHTS = np.array([0, 0, 0, 0, 0, 0, 2, 5, 7, 6, 5, 8, 10, 9, 5, 4, 5, 7, 10, 10, 8, 5, 2, 0], dtype=float)
+
+
+def make_menu(menu_size: int = 60, seed: int = 42) -> List[Dict[str, Any]]:
+    """Danh sách món (ten_hang, nhom, loai, don_gia) có tên duy nhất, kèm độ phổ biến kiểu Zipf."""
+    rng = np.random.default_rng(seed)
+    base = [(name, nhom, loai) for (nhom, loai), names in MENU_CATALOG.items() for name in names]
+    menu = []
+    for i in range(menu_size):
+        name, nhom, loai = base[i % len(base)]
+        variant = i // len(base)
+        if variant:
+            name = f"{name}{SIZES[variant % len(SIZES)]}" + (f" #{variant}" if variant >= len(SIZES) else '')
+        menu.append({
+            'ten_hang': name,
+            'nhom': nhom,
+            'loai': loai,
+            'don_gia': int(rng.integers(15, 90)) * 1000,
+        })
+    order = rng.permutation(menu_size)
+    popularity = 1.0 / (np.arange(1, menu_size + 1) ** 1.1)
+    for rank, index in enumerate(order):
+        menu[index]['popularity'] = popularity[rank]
+    return menu
+
+
+def _draw(num_invoices: int, menu_size: int, max_items: int, days: int, end: str, seed: int):
+    """Rút ngẫu nhiên thời điểm, số dòng và món của mọi hóa đơn một lần bằng NumPy."""
+    rng = np.random.default_rng(seed)
+    menu = make_menu(menu_size, seed)
+    popularity = np.array([item['popularity'] for item in menu])
+    popularity /= popularity.sum()
+
+    end_day = pd.Timestamp(end).normalize()
+    day_offsets = rng.integers(0, days, num_invoices)
+    hours = rng.choice(24, num_invoices, p=HOUR_WEIGHTS / HOUR_WEIGHTS.sum())
+    seconds = rng.integers(0, 3600, num_invoices)
+    timestamps = (end_day - pd.to_timedelta(days - 1 - day_offsets, unit='D')
+                  + pd.to_timedelta(hours * 3600 + seconds, unit='s'))
+    order = np.argsort(timestamps.values, kind='stable')
+    timestamps = timestamps[order]
+
+    line_counts = rng.integers(1, max_items + 1, num_invoices)
+    products = rng.choice(menu_size, int(line_counts.sum()), p=popularity)
+    quantities = rng.choice([1, 1, 1, 2, 2, 3], int(line_counts.sum()))
+    return menu, timestamps, line_counts, products, quantities
+
+
+def generate_invoices(num_invoices: int, menu_size: int = 60, max_items: int = 4, days: int = 90,
+                      end: str = '2025-08-22', seed: int = 42) -> List[Dict[str, Any]]:
+    """Hóa đơn định dạng 'chi_tiet' (như invoices.json), sắp xếp theo thời gian."""
+    menu, timestamps, line_counts, products, quantities = _draw(num_invoices, menu_size, max_items, days, end, seed)
+    datetimes = timestamps.strftime('%Y-%m-%d %H:%M:%S')
+    invoices, line = [], 0
+    for i in range(num_invoices):
+        details = []
+        for _ in range(line_counts[i]):
+            item = menu[products[line]]
+            quantity = int(quantities[line])
+            details.append({
+                'ten_hang': item['ten_hang'],
+                'so_luong': quantity,
+                'don_gia': item['don_gia'],
+                'thanh_tien': quantity * item['don_gia'],
+                'nhom': item['nhom'],
+                'loai': item['loai'],
+            })
+            line += 1
+        invoices.append({
+            'id_hoa_don': f"HD{i + 1:07d}",
+            'datetime': datetimes[i],
+            'chi_tiet': details,
+            'tong_tien_hoa_don': sum(detail['thanh_tien'] for detail in details),
+        })
+    return invoices
+
+
+def generate_n8n_payload(num_orders: int, menu_size: int = 60, max_items: int = 4, days: int = 90,
+                         end: str = '2025-08-22', seed: int = 42) -> Dict[str, Any]:
+    """Đơn hàng định dạng n8n ('products', 'calcTotalMoney', 'createdDateTime') như webhook trả về."""
+    menu, timestamps, line_counts, products, quantities = _draw(num_orders, menu_size, max_items, days, end, seed)
+    datetimes = timestamps.strftime('%Y-%m-%dT%H:%M:%S')
+    orders, line = [], 0
+    for i in range(num_orders):
+        order_products, total = [], 0
+        for _ in range(line_counts[i]):
+            item = menu[products[line]]
+            quantity = int(quantities[line])
+            # Webhook trả giá dạng chuỗi, số lượng dạng số
+            order_products.append({'productName': item['ten_hang'], 'price': str(item['don_gia']), 'quantity': quantity})
+            total += quantity * item['don_gia']
+            line += 1
+        orders.append({
+            'id': 100000 + i,
+            'calcTotalMoney': total,
+            'createdDateTime': datetimes[i],
+            'products': order_products,
+        })
+    return {'data': orders}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sinh dữ liệu bán hàng F&B giả lập.")
+    parser.add_argument('--invoices', type=int, default=10_000, help="Số hóa đơn / đơn hàng")
+    parser.add_argument('--menu-size', type=int, default=60)
+    parser.add_argument('--max-items', type=int, default=4, help="Số dòng tối đa mỗi hóa đơn")
+    parser.add_argument('--days', type=int, default=90, help="Số ngày dữ liệu, kết thúc tại --end")
+    parser.add_argument('--end', default='2025-08-22')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--format', choices=['chi_tiet', 'n8n'], default='chi_tiet')
+    parser.add_argument('--out', required=True)
+    args = parser.parse_args()
+
+    generate = generate_invoices if args.format == 'chi_tiet' else generate_n8n_payload
+    data = generate(args.invoices, menu_size=args.menu_size, max_items=args.max_items,
+                    days=args.days, end=args.end, seed=args.seed)
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    print(f"✅ Đã ghi {args.invoices:,} {'hóa đơn' if args.format == 'chi_tiet' else 'đơn hàng'} vào {args.out}")
+
+
+if __name__ == '__main__':
+    main()
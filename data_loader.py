@@ -0,0 +1,83 @@
+import os
+import pandas as pd
+from analyse import AnalysisSections
+from utils.analysis.compact import compact_frame
+from utils.analysis.shards import PartialAnalysis, analyze_stores, find_store_paths, load_tabular_shard
+from utils.importers.tabular import TABULAR_EXTENSIONS
+
+# Bộ máy phân tích: 'pandas' (mặc định, toàn bộ dữ liệu trong bộ nhớ) hoặc 'sqlite' (tệp ANALYTICS_DB)
+ANALYTICS_ENGINE = os.getenv('ANALYTICS_ENGINE', 'pandas')
+ANALYTICS_DB = os.getenv('ANALYTICS_DB', 'analytics.db')
+
+def find_invoice_path():
+    # *** CHANGE: Prioritize loading the new data files first ***
+    if os.path.exists('invoices_realistic.json'):
+        return 'invoices_realistic.json'
+    if os.path.exists('invoices_updated.json'):
+        return 'invoices_updated.json'
+    if os.path.exists('invoices.json'):
+        return 'invoices.json'
+    elif os.path.exists('reports/invoices.json'):
+        return 'reports/invoices.json'
+    # Tệp xuất trực tiếp từ máy POS
+    for extension in TABULAR_EXTENSIONS:
+        if os.path.exists(f'invoices{extension}'):
+            return f'invoices{extension}'
+    return None
+
+def load_sqlite_data():
+    """Phân tích bằng SQL trên tệp SQLite; lần đầu nhập từ tệp hóa đơn (JSON hoặc Excel/CSV)."""
+    from utils.analysis.sql_engine import open_sqlite_analysis
+    try:
+        analysis = open_sqlite_analysis(ANALYTICS_DB, find_invoice_path())
+        print(f"Đang phân tích từ cơ sở dữ liệu SQLite: {ANALYTICS_DB}")
+        return pd.DataFrame(), analysis
+    except Exception as e:
+        print(f"Lỗi khi mở cơ sở dữ liệu {ANALYTICS_DB}: {e}")
+        return pd.DataFrame(), {}
+
+def load_store_data(store_paths):
+    """Chuỗi nhiều cửa hàng: tổng hợp song song từng tệp cửa hàng rồi cộng dồn thành số liệu cả chuỗi."""
+    try:
+        print(f"Đang tải dữ liệu của {len(store_paths)} cửa hàng: {', '.join(store_paths)}")
+        return pd.DataFrame(), analyze_stores(store_paths)
+    except Exception as e:
+        print(f"Lỗi khi tải dữ liệu các cửa hàng: {e}")
+        return pd.DataFrame(), {}
+
+def load_tabular_data(invoice_path):
+    """Tệp Excel/CSV được đọc theo lô và cộng dồn thành bảng tổng hợp, không giữ bảng hóa đơn trong bộ nhớ."""
+    try:
+        print(f"Đang nhập dữ liệu từ: {invoice_path}")
+        return pd.DataFrame(), PartialAnalysis(load_tabular_shard(invoice_path))
+    except Exception as e:
+        print(f"Lỗi khi nhập dữ liệu từ {invoice_path}: {e}")
+        return pd.DataFrame(), {}
+
+def load_and_prepare_data():
+    if ANALYTICS_ENGINE == 'sqlite':
+        return load_sqlite_data()
+    store_paths = find_store_paths()
+    if store_paths:
+        return load_store_data(store_paths)
+    invoice_path = find_invoice_path()
+    if not invoice_path:
+        print("Lỗi: không tìm thấy tệp hóa đơn JSON!")
+        return pd.DataFrame(), {}
+    if invoice_path.lower().endswith(TABULAR_EXTENSIONS):
+        return load_tabular_data(invoice_path)
+    try:
+        print(f"Đang tải dữ liệu từ: {invoice_path}")
+        df = pd.read_json(invoice_path)
+        if 'datetime' not in df.columns:
+             print("Lỗi: Cột 'datetime' không có trong file JSON.")
+             return pd.DataFrame(), {}
+        df['datetime'] = pd.to_datetime(df['datetime'])
+        compact_frame(df)
+        # Các mục phân tích được tính khi có request đầu tiên cần đến; bảng hóa đơn thuộc riêng
+        # AnalysisSections nên chi_tiet được bỏ sau khi làm phẳng
+        all_analyzed_data = AnalysisSections(df, release_details=True)
+        return df, all_analyzed_data
+    except Exception as e:
+        print(f"Lỗi khi tải dữ liệu từ {invoice_path}: {e}")
+        return pd.DataFrame(), {}
@@ -1,102 +1,411 @@
-from flask import Flask, jsonify, json, render_template
+from flask import Flask, Response, jsonify, json, render_template, request, stream_with_context
 from flask_cors import CORS
 import pandas as pd
 import os
-from analyse import analyze_data
+import threading
+import time
+from data_loader import find_invoice_path, load_and_prepare_data
+from utils.analysis.shared_snapshot import SNAPSHOT_ENV, attach_snapshot
+from utils.api.response_cache import ResponseCache, payload_response
+from utils.api.page_cache import PageCache
+from utils.analysis.product_index import DEFAULT_SORT, SORT_OPTIONS
+from utils.api.live_feed import LiveFeed, format_event
+from utils.api.ingest import InvoiceIngestor, normalize_invoice, read_log
+from utils.api import metrics
+from analyse import AnalysisSections
+
+PRODUCT_PAGE_SIZE = 50
+MAX_PRODUCT_PAGE_SIZE = 500
+LIVE_TOP_PRODUCTS = 5
+ANALYSIS_TOP_PRODUCTS = 10
+DEFAULT_ANALYSIS_QUESTION = ("Phân tích dữ liệu kinh doanh và đưa ra các nhận định quan trọng "
+                             "về hiệu suất sản phẩm và xu hướng theo thời gian.")
+# Chu kỳ (giây) kiểm tra tệp hóa đơn thay đổi để tải lại dữ liệu; 0 để tắt
+DATA_RELOAD_SECONDS = float(os.getenv("DATA_RELOAD_SECONDS", "5"))
+# Log bền vững của các hóa đơn nhận qua POST /api/invoices, được nạp lại mỗi khi khởi động
+INGEST_LOG = os.getenv("INGEST_LOG", "ingested_invoices.jsonl")
+INGEST_TIMEOUT_SECONDS = 10
 
 app = Flask(__name__, template_folder='templates')
 CORS(app)
+page_cache = PageCache(template_folder='templates')
+request_metrics = metrics.RequestMetrics(app)
 
 # --- Helper Functions ---
-def find_invoice_path():
-    # *** CHANGE: Prioritize loading the new data files first ***
-    if os.path.exists('invoices_realistic.json'):
-        return 'invoices_realistic.json'
-    if os.path.exists('invoices_updated.json'):
-        return 'invoices_updated.json'
-    if os.path.exists('invoices.json'):
-        return 'invoices.json'
-    elif os.path.exists('reports/invoices.json'):
-        return 'reports/invoices.json'
-    else:
-        return None
-
 def get_sidebar_html(active_page=''):
-    try:
-        with open('templates/_sidebar.html', 'r', encoding='utf-8') as f:
-            content = f.read()
-        placeholders = {'sales': '{{ sales_active }}', 'products': '{{ products_active }}', 'reports': '{{ reports_active }}'}
-        for page, placeholder in placeholders.items():
-            content = content.replace(placeholder, 'active' if page == active_page else '')
-        return content
-    except FileNotFoundError:
+    content = page_cache.sidebar(active_page)
+    if content is None:
         return "<p>Error: Sidebar template not found.</p>"
+    return content
+
+def render_page(template_name, active_page):
+    """Trả trang HTML đã render sẵn trong bộ nhớ, kèm ETag/nén và header cache."""
+    payload = page_cache.page(
+        template_name, active_page,
+        lambda sidebar: render_template(template_name, sidebar=sidebar)
+    )
+    return payload_response(payload, 'text/html', 'public, max-age=60')
 
 # --- Tải và chuẩn bị dữ liệu ---
-def load_and_prepare_data():
-    invoice_path = find_invoice_path()
-    if not invoice_path:
-        print("Lỗi: không tìm thấy tệp hóa đơn JSON!")
-        return pd.DataFrame(), {}
-    try:
-        print(f"Đang tải dữ liệu từ: {invoice_path}")
-        df = pd.read_json(invoice_path)
-        if 'datetime' not in df.columns:
-             print("Lỗi: Cột 'datetime' không có trong file JSON.")
-             return pd.DataFrame(), {}
-        df['datetime'] = pd.to_datetime(df['datetime'])
-        all_analyzed_data = analyze_data(df)
-        return df, all_analyzed_data
-    except Exception as e:
-        print(f"Lỗi khi tải dữ liệu từ {invoice_path}: {e}")
-        return pd.DataFrame(), {}
+def load_snapshot():
+    """
+    Worker của serve.py gắn vào snapshot phân tích trong shared memory do tiến trình master tạo;
+    khi chạy độc lập thì tự tải và phân tích dữ liệu như bình thường.
+    """
+    shm_name = os.environ.get(SNAPSHOT_ENV)
+    if shm_name:
+        global snapshot_shm
+        analyzed, snapshot_shm = attach_snapshot(shm_name)
+        print(f"Đã gắn vào snapshot phân tích dùng chung: {shm_name}")
+        return pd.DataFrame(), analyzed
+    return load_data()
+
+def load_data():
+    """Tải tệp hóa đơn rồi gộp thêm các hóa đơn đã nhận qua API trong log."""
+    df, analyzed = load_and_prepare_data()
+    if getattr(analyzed, 'persistent', False):
+        return df, analyzed
+    ingested = read_log(INGEST_LOG)
+    if not ingested.empty:
+        print(f"Nạp lại {len(ingested):,} hóa đơn từ {INGEST_LOG}")
+        if isinstance(analyzed, AnalysisSections):
+            analyzed.apply_batch(ingested)
+        else:
+            analyzed = AnalysisSections(ingested)
+    return df, analyzed
+
+def timed_load(loader):
+    """Chạy loader() và ghi lại thời gian tải, số hóa đơn cho /metrics."""
+    global last_load
+    start = time.perf_counter()
+    df, analyzed = loader()
+    rows = analyzed.invoice_count() if isinstance(analyzed, AnalysisSections) else len(df)
+    last_load = {"seconds": time.perf_counter() - start, "rows": rows, "finished_at": time.time()}
+    return df, analyzed
+
+snapshot_shm = None
+last_load = {}
+invoices_df, analyzed_data = timed_load(load_snapshot)
+# Thời điểm dữ liệu đang phục vụ thay đổi lần cuối (tải lại hoặc nạp thêm hóa đơn)
+data_updated_at = time.time()
+# Phản hồi JSON đã tuần tự hóa/nén sẵn cho snapshot dữ liệu hiện tại
+response_cache = ResponseCache()
+# Luồng SSE đẩy phần thay đổi của dashboard tới trình duyệt
+dashboard_feed = LiveFeed()
+
+def dashboard_state():
+    """Trạng thái dashboard được theo dõi bởi luồng SSE."""
+    if not analyzed_data:
+        return None
+    return {
+        "overall_metrics": analyzed_data.get("overall_metrics", {}),
+        "dashboard_data": analyzed_data.get("dashboard_data", {}),
+        "top_products": analyzed_data.top_products(LIVE_TOP_PRODUCTS),
+    }
+
+def publish_dashboard():
+    state = dashboard_state()
+    if state is not None:
+        dashboard_feed.publish(state)
 
-invoices_df, analyzed_data = load_and_prepare_data()
+def data_changed():
+    """Bỏ các phản hồi đã cache và đẩy phần thay đổi tới các client đang theo dõi."""
+    global data_updated_at
+    data_updated_at = time.time()
+    response_cache.invalidate()
+    # Trạng thái chỉ được dựng khi đã có client theo dõi, tránh tính trước các mục phân tích
+    if dashboard_feed.state is not None:
+        publish_dashboard()
+
+def reload_data():
+    """Tải lại toàn bộ dữ liệu (tệp hóa đơn + log), ví dụ khi tệp hóa đơn được thay thế."""
+    global invoices_df, analyzed_data
+    # Giữ khóa của bộ nạp để không lô nào vừa ghi log vừa được gộp vào dữ liệu mới
+    with ingestor.lock:
+        previous = analyzed_data
+        invoices_df, analyzed_data = timed_load(load_data)
+        data_changed()
+    # Bộ máy SQLite: đóng kết nối của bản dữ liệu cũ thay vì để rò rỉ qua mỗi lần tải lại
+    close = getattr(previous, 'close', None)
+    if close is not None and previous is not analyzed_data:
+        close()
+
+def apply_ingested(batch_df):
+    """Gộp một lô hóa đơn vừa nhận vào dữ liệu đang phục vụ."""
+    global analyzed_data
+    if isinstance(analyzed_data, AnalysisSections):
+        analyzed_data.apply_batch(batch_df)
+    else:
+        analyzed_data = AnalysisSections(batch_df)
+    data_changed()
+
+def watch_invoice_file(interval):
+    """Luồng nền: tải lại khi tệp hóa đơn được thay thế hoặc ghi thêm."""
+    def mtime():
+        path = find_invoice_path()
+        return (path, os.path.getmtime(path)) if path else None
+    last_seen = mtime()
+    while True:
+        time.sleep(interval)
+        try:
+            current = mtime()
+        except OSError:
+            continue
+        if current != last_seen:
+            last_seen = current
+            print(f"Tệp hóa đơn thay đổi, đang tải lại: {current[0] if current else None}")
+            reload_data()
+
+# Snapshot dùng chung của serve.py là cố định nên chỉ nhận hóa đơn mới và theo dõi tệp khi chạy độc lập
+ingestor = None if snapshot_shm else InvoiceIngestor(INGEST_LOG, apply_ingested)
+if not snapshot_shm and DATA_RELOAD_SECONDS > 0:
+    threading.Thread(target=watch_invoice_file, args=(DATA_RELOAD_SECONDS,), daemon=True).start()
 
 # --- Các Route cho trang HTML ---
 @app.route('/', methods=['GET'])
 def sales_page():
-    sidebar_content = get_sidebar_html(active_page='sales')
-    return render_template('index.html', sidebar=sidebar_content)
+    return render_page('index.html', active_page='sales')
 
 @app.route('/products', methods=['GET'])
 def products_page():
-    sidebar_content = get_sidebar_html(active_page='products')
-    return render_template('products.html', sidebar=sidebar_content)
+    return render_page('products.html', active_page='products')
 
 @app.route('/reports', methods=['GET'])
 def reports_page():
-    sidebar_content = get_sidebar_html(active_page='reports')
-    return render_template('reports.html', sidebar=sidebar_content)
+    return render_page('reports.html', active_page='reports')
 
 # --- API Endpoints ---
+def requested_analysis():
+    """Phân tích của cửa hàng ?store=<mã> nếu có, mặc định là toàn bộ dữ liệu (cả chuỗi)."""
+    store = request.args.get('store')
+    if store is None:
+        return analyzed_data
+    return getattr(analyzed_data, 'stores', {}).get(store)
+
+def no_data_response():
+    store = request.args.get('store')
+    if store is not None and store not in getattr(analyzed_data, 'stores', {}):
+        return jsonify({"error": f"Không có cửa hàng: {store}"}), 404
+    return jsonify({"error": "Không có dữ liệu"}), 500
+
+def respond_section(analysis, key, default):
+    """
+    Trả nguyên một mục phân tích. Với snapshot dùng chung của serve.py, bytes đã tuần tự hóa/nén
+    sẵn trong shared memory được gửi thẳng, worker không giữ bản sao nào của mục.
+    """
+    shared_payload = getattr(analysis, 'shared_payload', None)
+    if shared_payload is not None:
+        return payload_response(shared_payload(key), 'application/json', 'no-cache')
+    return response_cache.respond(lambda: analysis.get(key, default))
+
+@app.route('/api/stores', methods=['GET'])
+def list_stores():
+    """Các cửa hàng (khi chạy theo chuỗi) kèm chỉ số tổng quan của từng cửa hàng."""
+    stores = getattr(analyzed_data, 'stores', {})
+    return response_cache.respond(lambda: [
+        {"store": store_id, **analysis.get("overall_metrics", {})} for store_id, analysis in stores.items()
+    ])
+
 @app.route('/api/dashboard-data', methods=['GET'])
 def get_dashboard_data():
-    if not analyzed_data:
-        return jsonify({"error": "Không có dữ liệu"}), 500
-    response_data = {
-        "overall_metrics": analyzed_data.get("overall_metrics", {}),
-        "dashboard_data": analyzed_data.get("dashboard_data", {})
-    }
-    return jsonify(response_data)
+    analysis = requested_analysis()
+    if not analysis:
+        return no_data_response()
+    return response_cache.respond(lambda: {
+        "overall_metrics": analysis.get("overall_metrics", {}),
+        "dashboard_data": analysis.get("dashboard_data", {})
+    })
+
+@app.route('/api/invoices', methods=['POST'])
+def ingest_invoices():
+    """
+    Nhận một hóa đơn hoặc một danh sách hóa đơn theo định dạng 'chi_tiet'.
+    Trả về 201 khi lô chứa chúng đã được ghi bền vững vào log; hóa đơn có id_hoa_don đã nạp
+    trước đó được bỏ qua (đếm trong 'duplicates'), nên client gửi lại sau lỗi/timeout là an toàn.
+    """
+    if ingestor is None:
+        return jsonify({"error": "Không nhận hóa đơn khi chạy nhiều worker với snapshot dùng chung"}), 503
+    if getattr(analyzed_data, 'stores', None):
+        return jsonify({"error": "Không nhận hóa đơn khi dữ liệu được chia theo cửa hàng"}), 503
+    payload = request.get_json(silent=True)
+    raw_invoices = payload if isinstance(payload, list) else [payload]
+    try:
+        invoices = [normalize_invoice(raw) for raw in raw_invoices]
+        if not invoices:
+            raise ValueError("Danh sách hóa đơn rỗng")
+    except ValueError as e:
+        return jsonify({"error": f"Hóa đơn không hợp lệ: {e}"}), 400
+    try:
+        added = ingestor.submit(invoices).result(timeout=INGEST_TIMEOUT_SECONDS)
+    except Exception as e:
+        return jsonify({"error": f"Không thể nạp hóa đơn: {e}"}), 500
+    return jsonify({"accepted": len(invoices), "duplicates": len(invoices) - added}), 201
+
+@app.route('/api/dashboard-stream', methods=['GET'])
+def dashboard_stream():
+    """
+    Server-Sent Events: sự kiện 'snapshot' chứa toàn bộ trạng thái, sau đó mỗi sự kiện 'delta'
+    chỉ chứa phần đã thay đổi (ví dụ giờ hiện tại của hôm nay, tổng doanh thu, top sản phẩm).
+    """
+    if dashboard_feed.state is None:
+        publish_dashboard()
+    events = dashboard_feed.events(request.headers.get('Last-Event-ID'))
+    return Response(stream_with_context(events), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+@app.route('/api/dashboard-period', methods=['GET'])
+def dashboard_period():
+    """
+    Doanh thu của một cửa sổ bất kỳ: ?days=N ngày kết thúc trước ngày mới nhất ?offset=M ngày.
+    Ví dụ days=30 (30 ngày qua) hoặc days=7&offset=7 (tuần trước, để so sánh tuần với tuần).
+    """
+    analysis = requested_analysis()
+    if not analysis:
+        return no_data_response()
+    try:
+        days = int(request.args.get('days', 7))
+        offset = int(request.args.get('offset', 0))
+        if days < 1 or days > 366 or offset < 0:
+            raise ValueError("days phải trong khoảng 1-366, offset không âm")
+    except ValueError as e:
+        return jsonify({"error": f"Tham số không hợp lệ: {e}"}), 400
+    time_index = analysis.time_index
+    end_day = time_index.last_day - pd.Timedelta(days=offset)
+    return response_cache.respond(lambda: time_index.period(end_day - pd.Timedelta(days=days - 1), days))
 
 @app.route('/api/product-analysis', methods=['GET'])
 def product_analysis():
-    if not analyzed_data:
-        return jsonify({"error": "Không có dữ liệu"}), 500
-    return jsonify(analyzed_data.get("product_analysis", []))
+    analysis = requested_analysis()
+    if not analysis:
+        return no_data_response()
+    if not any(key in request.args for key in ('limit', 'offset', 'sort', 'q')):
+        return respond_section(analysis, "product_analysis", [])
+    # Phân trang/sắp xếp/tìm kiếm phía server để phản hồi luôn nhỏ dù danh mục lớn
+    try:
+        limit = int(request.args.get('limit', PRODUCT_PAGE_SIZE))
+        offset = int(request.args.get('offset', 0))
+        if not 1 <= limit <= MAX_PRODUCT_PAGE_SIZE or offset < 0:
+            raise ValueError(f"limit phải trong khoảng 1-{MAX_PRODUCT_PAGE_SIZE}, offset không âm")
+        sort = request.args.get('sort', DEFAULT_SORT)
+        if sort not in SORT_OPTIONS:
+            raise ValueError(f"sort phải là một trong: {', '.join(SORT_OPTIONS)}")
+    except ValueError as e:
+        return jsonify({"error": f"Tham số không hợp lệ: {e}"}), 400
+    q = request.args.get('q')
+    return response_cache.respond(
+        lambda: analysis.product_index.query(limit=limit, offset=offset, sort=sort, q=q)
+    )
 
 @app.route('/api/reports-analysis', methods=['GET'])
 def reports_analysis():
-    if not analyzed_data:
-        return jsonify({"error": "Không có dữ liệu"}), 500
-    return jsonify(analyzed_data.get("reports_analysis", {}))
+    analysis = requested_analysis()
+    if not analysis:
+        return no_data_response()
+    return respond_section(analysis, "reports_analysis", {})
 
 @app.route('/api/product-hierarchy', methods=['GET'])
 def product_hierarchy():
-    if not analyzed_data:
-        return jsonify({"error": "Không có dữ liệu"}), 500
-    return jsonify(analyzed_data.get("product_hierarchy", {}))
+    analysis = requested_analysis()
+    if not analysis:
+        return no_data_response()
+    top = request.args.get('top')
+    start = request.args.get('from')
+    end = request.args.get('to')
+    if top is None and start is None and end is None:
+        return respond_section(analysis, "product_hierarchy", {})
+    # Truy vấn theo khoảng ngày / top-N bất kỳ trực tiếp trên khối tổng hợp, không tính lại toàn bộ
+    try:
+        top = int(top) if top is not None else 5
+        if top < 1:
+            raise ValueError("top phải lớn hơn 0")
+        start = pd.Timestamp(start) if start else None
+        end = pd.Timestamp(end) if end else None
+    except ValueError as e:
+        return jsonify({"error": f"Tham số không hợp lệ: {e}"}), 400
+    return response_cache.respond(lambda: analysis.product_cube.hierarchy(top=top, start=start, end=end))
+
+def analysis_calculations(analysis):
+    """Các mục phân tích đã tính của dashboard, làm số liệu đầu vào cho LLM thay cho payload n8n."""
+    return {
+        "overall_metrics": analysis.get("overall_metrics", {}),
+        "dashboard_data": analysis.get("dashboard_data", {}),
+        "top_products_by_revenue": analysis.top_products(ANALYSIS_TOP_PRODUCTS),
+        "reports_analysis": analysis.get("reports_analysis", {}),
+    }
+
+@app.route('/api/analysis-stream', methods=['GET'])
+def analysis_stream():
+    """
+    Server-Sent Events: LLM viết bản phân tích cho dữ liệu hiện tại (?store=<mã> cho một cửa hàng,
+    ?question=... để hỏi khác). Mỗi sự kiện 'token' là đoạn văn bản vừa sinh, kết thúc bằng
+    'done' chứa toàn bộ bản phân tích, hoặc 'error'.
+    """
+    analysis = requested_analysis()
+    if not analysis:
+        return no_data_response()
+    store = request.args.get('store')
+    inputs = {
+        "question": request.args.get('question') or DEFAULT_ANALYSIS_QUESTION,
+        "calculations": analysis_calculations(analysis),
+        "context": f"Số liệu tổng hợp của dashboard ({f'cửa hàng {store}' if store else 'toàn bộ dữ liệu'}).",
+    }
+
+    def events():
+        from main_v3_test import stream_analysis
+
+        text = []
+        try:
+            for event in stream_analysis(inputs, draft_only=True):
+                if event["type"] == "token" and event["node"] == "analyst":
+                    text.append(event["text"])
+                    yield format_event("token", {"text": event["text"]})
+            yield format_event("done", {"analysis": "".join(text)})
+        except Exception as e:
+            yield format_event("error", {"error": str(e)})
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+# --- Số liệu vận hành ---
+def cache_metrics():
+    caches = {"response": response_cache, "page": page_cache}
+    hit_ratio = [((("cache", name),), cache.hits / (cache.hits + cache.misses))
+                 for name, cache in caches.items() if cache.hits + cache.misses]
+    return (
+        metrics.family('dashboard_cache_hits_total', 'counter', 'Số lần phục vụ từ bộ nhớ đệm.',
+                       [((("cache", name),), cache.hits) for name, cache in caches.items()])
+        + metrics.family('dashboard_cache_misses_total', 'counter', 'Số lần phải tính/render lại.',
+                         [((("cache", name),), cache.misses) for name, cache in caches.items()])
+        + metrics.family('dashboard_cache_hit_ratio', 'gauge', 'Tỉ lệ hit của bộ nhớ đệm từ khi khởi động.', hit_ratio)
+    )
+
+def data_metrics():
+    analysis = analyzed_data
+    compute_seconds = getattr(analysis, 'compute_seconds', {})
+    return (
+        metrics.gauge('dashboard_data_load_duration_seconds', 'Thời gian của lần tải dữ liệu gần nhất.',
+                      last_load.get("seconds"))
+        + metrics.gauge('dashboard_data_load_rows', 'Số hóa đơn của lần tải dữ liệu gần nhất.', last_load.get("rows"))
+        + metrics.gauge('dashboard_data_load_timestamp_seconds', 'Thời điểm tải dữ liệu gần nhất (Unix time).',
+                        last_load.get("finished_at"))
+        + metrics.gauge('dashboard_data_snapshot_age_seconds', 'Số giây từ lần dữ liệu đang phục vụ thay đổi gần nhất.',
+                        time.time() - data_updated_at)
+        + metrics.gauge('dashboard_data_invoices', 'Số hóa đơn đang được phục vụ (kể cả đã nạp qua API).',
+                        analysis.invoice_count() if isinstance(analysis, AnalysisSections) else None)
+        + metrics.family('dashboard_analysis_compute_seconds', 'gauge',
+                         'Thời gian tính gần nhất của từng mục phân tích (tính khi có request đầu tiên cần đến).',
+                         [((("section", section),), seconds) for section, seconds in compute_seconds.items()])
+    )
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Số liệu vận hành theo định dạng văn bản Prometheus."""
+    body = metrics.render(request_metrics.render() + data_metrics() + cache_metrics() + metrics.process_metrics())
+    return Response(body, content_type=metrics.CONTENT_TYPE)
 
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
\ No newline at end of file
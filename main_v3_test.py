@@ -1,26 +1,21 @@
-import requests
+import functools
 import json
 import os
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.base import MIMEBase
-from email import encoders
+import sys
 from dotenv import load_dotenv
-from typing import TypedDict, List, Dict, Any, Optional
-from langgraph.graph import StateGraph, END
-from langchain_core.messages import SystemMessage, HumanMessage
-from langchain_core.tools import tool
-from langchain_google_genai import ChatGoogleGenerativeAI
+from typing import TypedDict, List, Dict, Any, Iterator, Optional
 from datetime import datetime
-import matplotlib.pyplot as plt
-import seaborn as sns
-from docx import Document
-from docx.shared import Inches
+# Các thư viện nặng (requests, langchain, langgraph, matplotlib, python-docx) chỉ được
+# import trong hàm/node dùng đến, để lệnh chỉ cần tiền xử lý hoặc thoát sớm khởi động nhanh
 
 # Import các hàm từ các file khác
 from preprocessing import preprocessing_data, safe_convert_to_number
 from utils.knowledge.knowledge_base import retrieve_knowledge # Mới
+from utils.mail.smtp_sender import MailQueue, OutgoingMail, mailer_from_env
+from utils.analysis.sketches import CountMinSketch, HyperLogLog, SpaceSaving
+from utils.llm.fact_check import check_report, critique_from_issues
+from utils.llm.prompt_cache import LLM_CACHE_BYPASS, get_prompt_cache, model_name, prompt_key
+from utils.tracing.tracer import span, summary_table, traced, tracer
 
 # Tải biến môi trường (bao gồm cả cấu hình LangSmith)
 load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
@@ -30,9 +25,16 @@ N8N_URL = 'https://aizen.auto.123host.asia/webhook/9057a9e7-1f29-4474-a501-730a2
 CHARTS_DIR = 'charts'
 REPORTS_DIR = 'reports'
 MAX_REFLECTIONS = 3 # Giới hạn số lần tự cải thiện để tránh lặp vô hạn
+# Tệp SQLite lưu state của graph sau mỗi node, theo run id, để chạy tiếp lượt bị lỗi/bị dừng
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", "checkpoints.db")
+FACT_CHECK_TOLERANCE = 0.005 # Sai lệch tương đối cho phép khi đối chiếu số liệu trong bản nháp
+# Chế độ xấp xỉ cho dữ liệu lớn: đếm phân biệt bằng HyperLogLog, top sản phẩm bằng Space-Saving/Count-Min
+APPROXIMATE_STATS = os.getenv("APPROXIMATE_STATS", "0") == "1"
+SKETCH_HLL_P = 12      # 4 KB mỗi bộ đếm, sai số chuẩn ~1.6%
+SKETCH_TOP_K = 64      # Số bộ đếm Space-Saving, sai số <= tổng / 64
+SKETCH_EXACT_PRODUCTS = 10_000  # Số sản phẩm phân biệt được cộng chính xác trước khi dùng sketch
 
-os.makedirs(CHARTS_DIR, exist_ok=True)
-os.makedirs(REPORTS_DIR, exist_ok=True)
+_mail_queue = None
 
 def extract_json_from_string(text: str) -> Optional[Dict]:
     """
@@ -52,10 +54,10 @@ def extract_json_from_string(text: str) -> Optional[Dict]:
         return None
     
 # --- State của LangGraph (Mở rộng) ---
-class Reflection:
-    def __init__(self, analysis: str, critique: str):
-        self.analysis = analysis
-        self.critique = critique
+class Reflection(TypedDict):
+    # dict thường để lịch sử lưu được vào checkpoint (JSON/msgpack) khi chạy tiếp một lượt bị dừng
+    analysis: str
+    critique: str
 
 class AnalysisState(TypedDict, total=False):
     question: str
@@ -69,9 +71,27 @@ class AnalysisState(TypedDict, total=False):
     knowledge: List[str] # Mới: Lưu kiến thức được truy xuất
     reflection_history: List[Reflection] # Mới: Lịch sử các lần tự cải thiện
     current_score: int
+    fact_check_passed: bool # Bản nháp mới nhất có qua bước kiểm tra số liệu không
+
+class lazy_tool:
+    """
+    Như @tool của langchain_core nhưng tool chỉ được dựng ở lần dùng đầu tiên (.invoke, .name, ...),
+    vì import langchain_core.tools mất gần một giây lúc khởi động.
+    """
+
+    def __init__(self, func):
+        functools.update_wrapper(self, func)
+        self._func = func
+        self._tool = None
+
+    def __getattr__(self, name):
+        if self._tool is None:
+            from langchain_core.tools import tool
+            self._tool = tool(self._func)
+        return getattr(self._tool, name)
 
 # --- Các hàm tính toán (Giữ nguyên từ file của bạn) ---
-@tool
+@lazy_tool
 def calculate_total_revenue(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
     """Calculate total revenue from order data"""
     total_revenue = 0
@@ -92,9 +112,94 @@ def calculate_total_revenue(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
         "average_order_value": total_revenue / len(unique_orders) if unique_orders else 0
     }
 
-@tool
-def calculate_product_stats(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
-    """Calculate product statistics including top products by quantity and revenue"""
+def _sketch_number(value: float) -> Any:
+    return int(value) if float(value).is_integer() else value
+
+def _rank_products(product_stats: Dict[str, Dict[str, Any]], top: int = 5) -> Dict[str, Any]:
+    """Top sản phẩm theo số lượng và doanh thu từ tổng chính xác của từng sản phẩm."""
+    def entries(field):
+        ranked = sorted(product_stats.items(), key=lambda x: x[1][field], reverse=True)[:top]
+        return [
+            {
+                "product_name": name,
+                "total_quantity": stats['total_quantity'],
+                "total_revenue": stats['total_revenue'],
+                "order_count": stats['order_count']
+            }
+            for name, stats in ranked
+        ]
+
+    return {
+        "top_products_by_quantity": entries('total_quantity'),
+        "top_products_by_revenue": entries('total_revenue')
+    }
+
+def _approximate_product_stats(rows: List[Dict[str, Any]], top: int = 5) -> Dict[str, Any]:
+    """
+    Top sản phẩm với bộ nhớ cố định. Tổng của từng sản phẩm được cộng chính xác trong bộ đệm tối đa
+    SKETCH_EXACT_PRODUCTS sản phẩm; bộ đệm đầy thì các tổng được đổ vào Space-Saving (xếp hạng) và
+    Count-Min (các chỉ số còn lại), sản phẩm nặng trước, rồi làm lại. Bộ đệm chưa đầy lần nào thì kết quả là chính xác.
+    """
+    product_stats: Dict[str, Dict[str, Any]] = {}
+    sketches: List[Any] = []
+
+    def flush():
+        if not sketches:
+            sketches.extend([SpaceSaving(SKETCH_TOP_K), SpaceSaving(SKETCH_TOP_K),
+                             CountMinSketch(), CountMinSketch(), CountMinSketch()])
+        by_quantity, by_revenue, quantities, revenues, order_counts = sketches
+        for name, stats in sorted(product_stats.items(), key=lambda x: x[1]['total_quantity'], reverse=True):
+            by_quantity.add(name, stats['total_quantity'])
+            quantities.add(name, stats['total_quantity'])
+            order_counts.add(name, stats['order_count'])
+        for name, stats in sorted(product_stats.items(), key=lambda x: x[1]['total_revenue'], reverse=True):
+            by_revenue.add(name, stats['total_revenue'])
+            revenues.add(name, stats['total_revenue'])
+        product_stats.clear()
+
+    for row in rows:
+        product_name = row.get('productName', 'Unknown')
+        quantity = safe_convert_to_number(row.get('quantity'))
+        price = safe_convert_to_number(row.get('price'))
+
+        stats = product_stats.get(product_name)
+        if stats is None:
+            if len(product_stats) >= SKETCH_EXACT_PRODUCTS:
+                flush()
+            stats = product_stats[product_name] = {'total_quantity': 0, 'total_revenue': 0, 'order_count': 0}
+        stats['total_quantity'] += quantity
+        stats['total_revenue'] += quantity * price
+        stats['order_count'] += 1
+
+    if not sketches:
+        return _rank_products(product_stats, top)
+    flush()
+    by_quantity, by_revenue, quantities, revenues, order_counts = sketches
+
+    def entries(ranking, field):
+        result = []
+        for name, count, _ in ranking.top(top):
+            entry = {
+                "product_name": name,
+                "total_quantity": _sketch_number(quantities.estimate(name)),
+                "total_revenue": _sketch_number(revenues.estimate(name)),
+                "order_count": int(order_counts.estimate(name))
+            }
+            entry[field] = _sketch_number(count)
+            result.append(entry)
+        return result
+
+    return {
+        "top_products_by_quantity": entries(by_quantity, "total_quantity"),
+        "top_products_by_revenue": entries(by_revenue, "total_revenue")
+    }
+
+@lazy_tool
+def calculate_product_stats(rows: List[Dict[str, Any]], approximate: bool = False) -> Dict[str, Any]:
+    """Calculate product statistics including top products by quantity and revenue.
+    approximate=True uses bounded-memory sketches (Space-Saving, Count-Min) instead of exact per-product totals."""
+    if approximate:
+        return _approximate_product_stats(rows)
     product_stats = {}
     
     for row in rows:
@@ -113,43 +218,13 @@ def calculate_product_stats(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
         product_stats[product_name]['total_revenue'] += quantity * price
         product_stats[product_name]['order_count'] += 1
     
-    # Sort by quantity and revenue
-    top_by_quantity = sorted(
-        product_stats.items(), 
-        key=lambda x: x[1]['total_quantity'], 
-        reverse=True
-    )[:5]
-    
-    top_by_revenue = sorted(
-        product_stats.items(), 
-        key=lambda x: x[1]['total_revenue'], 
-        reverse=True
-    )[:5]
-    
-    return {
-        "top_products_by_quantity": [
-            {
-                "product_name": name,
-                "total_quantity": stats['total_quantity'],
-                "total_revenue": stats['total_revenue'],
-                "order_count": stats['order_count']
-            }
-            for name, stats in top_by_quantity
-        ],
-        "top_products_by_revenue": [
-            {
-                "product_name": name,
-                "total_quantity": stats['total_quantity'],
-                "total_revenue": stats['total_revenue'],
-                "order_count": stats['order_count']
-            }
-            for name, stats in top_by_revenue
-        ]
-    }
+    return _rank_products(product_stats)
 
-@tool
-def calculate_daily_stats(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
-    """Calculate daily statistics from order data"""
+@lazy_tool
+def calculate_daily_stats(rows: List[Dict[str, Any]], approximate: bool = False) -> Dict[str, Any]:
+    """Calculate daily statistics from order data.
+    approximate=True counts distinct orders/products with HyperLogLog instead of sets."""
+    distinct = (lambda: HyperLogLog(SKETCH_HLL_P)) if approximate else set
     daily_stats = {}
     
     for row in rows:
@@ -165,8 +240,8 @@ def calculate_daily_stats(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
             daily_stats[date] = {
                 'total_quantity': 0,
                 'total_revenue': 0,
-                'unique_orders': set(),
-                'unique_products': set()
+                'unique_orders': distinct(),
+                'unique_products': distinct()
             }
         
         daily_stats[date]['total_quantity'] += quantity
@@ -183,9 +258,11 @@ def calculate_daily_stats(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
     
     return daily_stats
 
-@tool
-def calculate_hourly_stats(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
-    """Calculate hourly statistics from order data"""
+@lazy_tool
+def calculate_hourly_stats(rows: List[Dict[str, Any]], approximate: bool = False) -> Dict[str, Any]:
+    """Calculate hourly statistics from order data.
+    approximate=True counts distinct orders/products with HyperLogLog instead of sets."""
+    distinct = (lambda: HyperLogLog(SKETCH_HLL_P)) if approximate else set
     hourly_stats = {}
     time_period_stats = {}
     
@@ -205,8 +282,8 @@ def calculate_hourly_stats(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
             hourly_stats[hour] = {
                 'total_quantity': 0,
                 'total_revenue': 0,
-                'unique_orders': set(),
-                'unique_products': set()
+                'unique_orders': distinct(),
+                'unique_products': distinct()
             }
         
         hourly_stats[hour]['total_quantity'] += quantity
@@ -219,8 +296,8 @@ def calculate_hourly_stats(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
             time_period_stats[time_period] = {
                 'total_quantity': 0,
                 'total_revenue': 0,
-                'unique_orders': set(),
-                'unique_products': set()
+                'unique_orders': distinct(),
+                'unique_products': distinct()
             }
         
         if time_period:
@@ -278,12 +355,12 @@ def calculate_hourly_stats(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
         ]
     }
 
-def calculate_comprehensive_stats(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+def calculate_comprehensive_stats(rows: List[Dict[str, Any]], approximate: bool = APPROXIMATE_STATS) -> Dict[str, Any]:
     """Calculate all statistics using the calculator tools"""
     revenue_stats = calculate_total_revenue.invoke({"rows": rows})
-    product_stats = calculate_product_stats.invoke({"rows": rows})
-    daily_stats = calculate_daily_stats.invoke({"rows": rows})
-    hourly_stats = calculate_hourly_stats.invoke({"rows": rows})
+    product_stats = calculate_product_stats.invoke({"rows": rows, "approximate": approximate})
+    daily_stats = calculate_daily_stats.invoke({"rows": rows, "approximate": approximate})
+    hourly_stats = calculate_hourly_stats.invoke({"rows": rows, "approximate": approximate})
     
     return {
         "revenue_summary": revenue_stats,
@@ -298,6 +375,49 @@ def calculate_comprehensive_stats(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
         }
     }
 
+def chat_model(**kwargs: Any) -> Any:
+    """Mô hình chat Gemini; langchain_google_genai chỉ được import khi node LLM đầu tiên chạy."""
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(api_key=os.getenv("GOOGLE_API_KEY"), **kwargs)
+
+def invoke_llm(llm: Any, messages: List[Any], span_name: str, use_cache: bool = True) -> Any:
+    """
+    Gọi LLM trong một span: ghi model, độ dài prompt, số token và độ dài câu trả lời.
+    Lời gọi trùng khớp hoàn toàn với lần trước (cùng model, temperature, messages) được trả từ
+    bộ nhớ đệm (utils/llm/prompt_cache.py); LLM_CACHE_BYPASS=1 hoặc use_cache=False để luôn gọi LLM.
+    """
+    prompt_chars = sum(len(m.content) for m in messages if isinstance(m.content, str))
+    cache = get_prompt_cache() if use_cache else None
+    key = prompt_key(llm, messages) if cache is not None else None
+    with span(span_name, model=getattr(llm, "model", None), temperature=getattr(llm, "temperature", None),
+              prompt_chars=prompt_chars) as s:
+        if cache is not None and not LLM_CACHE_BYPASS:
+            response = cache.get(key)
+            if response is not None:
+                # Không ghi số token: lần này không tốn token nào
+                s.set(cache="hit", **{"llm.output_chars": len(response.content)})
+                emit_cached_tokens(response)
+                return response
+        response = llm.invoke(messages)
+        s.record_llm_usage(response)
+        if cache is not None:
+            s.set(cache="bypass" if LLM_CACHE_BYPASS else "miss")
+            cache.put(key, response, model_name(llm))
+        return response
+
+def emit_cached_tokens(response: Any):
+    """
+    Câu trả lời lấy từ bộ nhớ đệm không đi qua LLM nên không có sự kiện 'messages' của graph;
+    gửi cả câu trả lời thành một sự kiện token (stream_mode 'custom') để người đang stream vẫn nhận được.
+    """
+    try:
+        from langgraph.config import get_config, get_stream_writer
+        writer, node = get_stream_writer(), get_config().get("metadata", {}).get("langgraph_node")
+    except RuntimeError:
+        return  # Không chạy trong graph
+    if isinstance(response.content, str) and response.content:
+        writer({"type": "token", "node": node, "text": response.content})
+
 # --- Các hàm Node của LangGraph ---
 # Hàm tiện ích để fetch data (giữ nguyên)
 def fetch_data(from_date: str, to_date: str) -> Dict[str, Any]:
@@ -306,20 +426,32 @@ def fetch_data(from_date: str, to_date: str) -> Dict[str, Any]:
         "fromDate": from_date,
         "toDate": to_date
     }
+    import requests
+
     headers = {'Content-Type': 'application/json'}
-    response = requests.post(N8N_URL, data=json.dumps(data), headers=headers)
-    response.raise_for_status()
-    return response.json()
+    with span("fetch_data", from_date=from_date, to_date=to_date) as s:
+        response = requests.post(N8N_URL, data=json.dumps(data), headers=headers)
+        s.set(http_status=response.status_code, response_bytes=len(response.content))
+        response.raise_for_status()
+        return response.json()
 
+@traced("node.preprocess")
 def preprocess_node(state: AnalysisState) -> Dict[str, Any]:
     """Node tiền xử lý dùng payload đã được truyền vào (không gọi API)."""
     print("🔄 Bắt đầu tiền xử lý và tính toán từ payload đã cung cấp...")
     payload = state.get("payload")
+    if payload is None and state.get("calculations"):
+        # Số liệu đã tính sẵn (ví dụ từ dashboard): không có dòng dữ liệu thô để xử lý
+        print("✅ Dùng số liệu đã tính sẵn.")
+        return {"rows": [], "context": state.get("context", "")}
     if payload is None:
         raise ValueError("Thiếu payload đầu vào. Hãy truyền payload từ N8N vào app.invoke.")
     
-    rows = preprocessing_data(payload)
-    calculations = calculate_comprehensive_stats(rows)
+    with span("preprocessing_data") as s:
+        rows = preprocessing_data(payload)
+        s.set(rows=len(rows))
+    with span("calculate_comprehensive_stats", approximate=APPROXIMATE_STATS):
+        calculations = calculate_comprehensive_stats(rows)
     
     context_data = {
         "raw_data_sample": rows[:5],
@@ -331,6 +463,7 @@ def preprocess_node(state: AnalysisState) -> Dict[str, Any]:
     print("✅ Tiền xử lý hoàn tất.")
     return {"payload": payload, "rows": rows, "context": context_json, "calculations": calculations}
 
+@traced("node.retrieve_knowledge")
 def retrieve_knowledge_node(state: AnalysisState) -> Dict[str, Any]:
     """Node để truy xuất kiến thức liên quan."""
     print("🧠 Đang truy xuất kiến thức từ cơ sở tri thức...")
@@ -338,6 +471,7 @@ def retrieve_knowledge_node(state: AnalysisState) -> Dict[str, Any]:
     knowledge = retrieve_knowledge(question)
     return {"knowledge": knowledge, "reflection_history": []}
 
+@traced("node.analyst")
 def llm_analyst_node(state: AnalysisState) -> Dict[str, Any]:
     """Node LLM để tạo bản phân tích (bản nháp)."""
     print("✍️ LLM Analyst đang tạo bản nháp báo cáo...")
@@ -347,8 +481,9 @@ def llm_analyst_node(state: AnalysisState) -> Dict[str, Any]:
     history = state.get("reflection_history", [])
     calculations = state.get("calculations", {})
     
-    google_api_key = os.getenv("GOOGLE_API_KEY")
-    llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0.3, api_key=google_api_key)
+    from langchain_core.messages import SystemMessage, HumanMessage
+
+    llm = chat_model(model="gemini-2.5-flash", temperature=0.3)
     
     knowledge_prompt = "\n\n**Gợi ý từ chuyên gia (Mentor):**\n" + "\n".join(f"- {k}" for k in knowledge) if knowledge else ""
     
@@ -379,25 +514,47 @@ def llm_analyst_node(state: AnalysisState) -> Dict[str, Any]:
             "6. Đánh giá chất lượng dữ liệu\n"
             "7. Insight và khuyến nghị\n\n"
             "Sử dụng định dạng markdown để trình bày báo cáo một cách rõ ràng và chuyên nghiệp."
+            f"{knowledge_prompt}"
+            f"{history_prompt}"
         )),
     ]
     
-    response = llm.invoke(messages)
+    # Bản viết lại không đọc bộ nhớ đệm: phản hồi có thể giống lần trước và câu trả lời đã lưu
+    # chính là bản nháp vừa bị trả lại
+    response = invoke_llm(llm, messages, "llm.analyst", use_cache=not history)
     print("✅ LLM Analyst đã hoàn thành bản nháp.")
     return {"analysis": response.content}
 
+@traced("node.fact_check")
+def fact_check_node(state: AnalysisState) -> Dict[str, Any]:
+    """Node kiểm tra số liệu trong bản nháp bằng quy tắc (không gọi LLM); bản sai bị trả lại ngay."""
+    print("🔎 Đang đối chiếu số liệu trong bản nháp...")
+    # Số liệu xấp xỉ (sketch) có sai số nên cho phép lệch nhiều hơn
+    tolerance = 0.05 if APPROXIMATE_STATS else FACT_CHECK_TOLERANCE
+    issues = check_report(state["analysis"], state.get("calculations", {}), tolerance)
+    if not issues:
+        print("✅ Số liệu khớp, chuyển cho LLM Critic đánh giá chất lượng.")
+        return {"fact_check_passed": True}
+
+    print(f"❌ Phát hiện {len(issues)} lỗi số liệu, trả lại cho Analyst mà không cần gọi LLM Critic.")
+    # Tạo list mới thay vì sửa tại chỗ state đã được lưu vào checkpoint
+    history = state.get("reflection_history", []) + [
+        Reflection(analysis=state["analysis"], critique=critique_from_issues(issues))]
+    return {"reflection_history": history, "current_score": 0, "fact_check_passed": False}
+
+@traced("node.critic")
 def llm_critic_node(state: AnalysisState) -> Dict[str, Any]:
     """Node LLM Critic để đánh giá bản phân tích (phiên bản nâng cao)."""
     print("🧐 LLM Critic đang đánh giá báo cáo...")
     analysis = state["analysis"]
     knowledge = state["knowledge"]
     
-    google_api_key = os.getenv("GOOGLE_API_KEY")
+    from langchain_core.messages import SystemMessage, HumanMessage
+
     # Bật chế độ JSON để tăng độ tin cậy
-    llm = ChatGoogleGenerativeAI(
+    llm = chat_model(
         model="gemini-2.5-flash", # Sửa lại tên model chính xác
         temperature=0.2, 
-        api_key=google_api_key,
         model_kwargs={"response_format": {"type": "json_object"}}
     )
     
@@ -407,6 +564,7 @@ def llm_critic_node(state: AnalysisState) -> Dict[str, Any]:
         SystemMessage(content=(
             "Bạn là một người quản lý/chuyên gia phân tích dữ liệu F&B cực kỳ khó tính. "
             "Nhiệm vụ của bạn là đánh giá một báo cáo và trả về một đối tượng JSON duy nhất. "
+            "Số liệu trong báo cáo đã được kiểm tra tự động, hãy tập trung đánh giá chất lượng nhận định và đề xuất. "
             "Không thêm bất kỳ văn bản nào khác ngoài đối tượng JSON."
         )),
         HumanMessage(content=(
@@ -420,7 +578,7 @@ def llm_critic_node(state: AnalysisState) -> Dict[str, Any]:
         )),
     ]
     
-    response = llm.invoke(messages)
+    response = invoke_llm(llm, messages, "llm.critic")
     
     # Sử dụng hàm trích xuất JSON thông minh
     result = extract_json_from_string(response.content)
@@ -434,13 +592,18 @@ def llm_critic_node(state: AnalysisState) -> Dict[str, Any]:
         score = 0 # Gán điểm thấp để yêu cầu làm lại
         critique = "Phản hồi từ Critic không đúng định dạng. Yêu cầu viết lại báo cáo rõ ràng hơn."
 
-    history = state.get("reflection_history", [])
-    history.append(Reflection(analysis=analysis, critique=critique))
+    history = state.get("reflection_history", []) + [Reflection(analysis=analysis, critique=critique)]
     
     # Cập nhật cả lịch sử và điểm số hiện tại
     return {"reflection_history": history, "current_score": score}
 
 # --- Logic điều kiện cho Graph ---
+def after_fact_check(state: AnalysisState) -> str:
+    """Bản nháp đúng số liệu mới được LLM Critic chấm điểm; bản sai quay lại Analyst."""
+    if state.get("fact_check_passed"):
+        return "critic"
+    return should_continue(state)
+
 def should_continue(state: AnalysisState) -> str:
     """Quyết định xem nên kết thúc hay cần cải thiện báo cáo."""
     history = state.get("reflection_history", [])
@@ -459,61 +622,66 @@ def should_continue(state: AnalysisState) -> str:
         return "reflect"
     
 # --- Các node còn lại (Tạo biểu đồ, báo cáo, gửi email) ---
+def render_charts(calculations: Dict[str, Any], charts_dir: str = CHARTS_DIR) -> Dict[str, str]:
+    """Vẽ biểu đồ doanh thu theo ngày và top sản phẩm vào charts_dir; trả về {tên: đường dẫn}."""
+    import matplotlib.pyplot as plt
+
+    os.makedirs(charts_dir, exist_ok=True)
+    chart_paths = {}
+    # Tạo biểu đồ doanh thu theo ngày
+    if "daily_breakdown" in calculations:
+        daily_data = calculations["daily_breakdown"]
+        dates = list(daily_data.keys())
+        revenues = [daily_data[date]["total_revenue"] for date in dates]
+
+        plt.figure(figsize=(12, 6))
+        plt.plot(dates, revenues, marker='o', linewidth=2, markersize=8)
+        plt.title("Doanh Thu Theo Ngày", fontsize=16, fontweight='bold')
+        plt.xlabel("Ngày", fontsize=12)
+        plt.ylabel("Doanh Thu (VNĐ)", fontsize=12)
+        plt.xticks(rotation=45)
+        plt.grid(True, alpha=0.3)
+        plt.tight_layout()
+
+        chart_path = os.path.join(charts_dir, "daily_revenue.png")
+        plt.savefig(chart_path, dpi=300, bbox_inches='tight')
+        plt.close()
+        chart_paths["daily_revenue"] = chart_path
+
+    # Tạo biểu đồ top sản phẩm
+    if "product_analysis" in calculations:
+        product_data = calculations["product_analysis"]["top_products_by_revenue"][:5]
+        products = [item["product_name"] for item in product_data]
+        revenues = [item["total_revenue"] for item in product_data]
+
+        plt.figure(figsize=(10, 6))
+        bars = plt.bar(products, revenues, color='skyblue', alpha=0.8)
+        plt.title("Top 5 Sản Phẩm Theo Doanh Thu", fontsize=16, fontweight='bold')
+        plt.xlabel("Sản Phẩm", fontsize=12)
+        plt.ylabel("Doanh Thu (VNĐ)", fontsize=12)
+        plt.xticks(rotation=45, ha='right')
+        plt.grid(True, alpha=0.3, axis='y')
+
+        # Thêm giá trị trên mỗi cột
+        for bar, revenue in zip(bars, revenues):
+            plt.text(bar.get_x() + bar.get_width()/2, bar.get_height() + max(revenues)*0.01,
+                    f'{revenue:,.0f}', ha='center', va='bottom', fontweight='bold')
+
+        plt.tight_layout()
+
+        chart_path = os.path.join(charts_dir, "top_products.png")
+        plt.savefig(chart_path, dpi=300, bbox_inches='tight')
+        plt.close()
+        chart_paths["top_products"] = chart_path
+
+    return chart_paths
+
+@traced("node.create_charts")
 def create_charts_node(state: AnalysisState) -> Dict[str, Any]:
     """Node để tạo biểu đồ từ dữ liệu."""
     print("📊 Đang tạo biểu đồ...")
-    rows = state["rows"]
-    calculations = state["calculations"]
-    
-    chart_paths = {}
-    
     try:
-        # Tạo biểu đồ doanh thu theo ngày
-        if "daily_breakdown" in calculations:
-            daily_data = calculations["daily_breakdown"]
-            dates = list(daily_data.keys())
-            revenues = [daily_data[date]["total_revenue"] for date in dates]
-            
-            plt.figure(figsize=(12, 6))
-            plt.plot(dates, revenues, marker='o', linewidth=2, markersize=8)
-            plt.title("Doanh Thu Theo Ngày", fontsize=16, fontweight='bold')
-            plt.xlabel("Ngày", fontsize=12)
-            plt.ylabel("Doanh Thu (VNĐ)", fontsize=12)
-            plt.xticks(rotation=45)
-            plt.grid(True, alpha=0.3)
-            plt.tight_layout()
-            
-            chart_path = os.path.join(CHARTS_DIR, "daily_revenue.png")
-            plt.savefig(chart_path, dpi=300, bbox_inches='tight')
-            plt.close()
-            chart_paths["daily_revenue"] = chart_path
-        
-        # Tạo biểu đồ top sản phẩm
-        if "product_analysis" in calculations:
-            product_data = calculations["product_analysis"]["top_products_by_revenue"][:5]
-            products = [item["product_name"] for item in product_data]
-            revenues = [item["total_revenue"] for item in product_data]
-            
-            plt.figure(figsize=(10, 6))
-            bars = plt.bar(products, revenues, color='skyblue', alpha=0.8)
-            plt.title("Top 5 Sản Phẩm Theo Doanh Thu", fontsize=16, fontweight='bold')
-            plt.xlabel("Sản Phẩm", fontsize=12)
-            plt.ylabel("Doanh Thu (VNĐ)", fontsize=12)
-            plt.xticks(rotation=45, ha='right')
-            plt.grid(True, alpha=0.3, axis='y')
-            
-            # Thêm giá trị trên mỗi cột
-            for bar, revenue in zip(bars, revenues):
-                plt.text(bar.get_x() + bar.get_width()/2, bar.get_height() + max(revenues)*0.01,
-                        f'{revenue:,.0f}', ha='center', va='bottom', fontweight='bold')
-            
-            plt.tight_layout()
-            
-            chart_path = os.path.join(CHARTS_DIR, "top_products.png")
-            plt.savefig(chart_path, dpi=300, bbox_inches='tight')
-            plt.close()
-            chart_paths["top_products"] = chart_path
-        
+        chart_paths = render_charts(state["calculations"])
         print("✅ Tạo biểu đồ hoàn tất.")
         return {"chart_paths": chart_paths}
         
@@ -521,92 +689,35 @@ def create_charts_node(state: AnalysisState) -> Dict[str, Any]:
         print(f"❌ Lỗi khi tạo biểu đồ: {e}")
         return {"chart_paths": {}}
 
+@traced("node.create_report")
 def create_report_node(state: AnalysisState) -> Dict[str, Any]:
     """Node để tạo báo cáo Word."""
     print("📝 Đang tạo báo cáo Word...")
+    from utils.report.docx_builder import render_report
+
+    os.makedirs(REPORTS_DIR, exist_ok=True)
     analysis = state["analysis"]
     calculations = state["calculations"]
     chart_paths = state.get("chart_paths", {})
     
     try:
-        doc = Document()
-        
-        # Tiêu đề
-        title = doc.add_heading("Báo Cáo Phân Tích Dữ Liệu F&B", 0)
-        title.alignment = 1  # Căn giữa
-        
-        # Thông tin thời gian
-        doc.add_paragraph(f"Ngày tạo: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
-        doc.add_paragraph("")
-        
-        # Tóm tắt
-        doc.add_heading("Tóm Tắt", level=1)
-        summary = doc.add_paragraph()
-        summary.add_run("Báo cáo này trình bày kết quả phân tích dữ liệu kinh doanh ngành F&B, bao gồm:")
-        summary.add_run("\n• Phân tích doanh thu và đơn hàng")
-        summary.add_run("\n• Top sản phẩm bán chạy")
-        summary.add_run("\n• Phân tích theo thời gian")
-        summary.add_run("\n• Các khuyến nghị kinh doanh")
-        
-        # Thống kê tổng quan
-        doc.add_heading("Thống Kê Tổng Quan", level=1)
-        if "revenue_summary" in calculations:
-            revenue_data = calculations["revenue_summary"]
-            doc.add_paragraph(f"• Tổng doanh thu: {revenue_data.get('total_revenue', 0):,.0f} VNĐ")
-            doc.add_paragraph(f"• Tổng số đơn hàng: {revenue_data.get('total_orders', 0):,}")
-            doc.add_paragraph(f"• Giá trị đơn hàng trung bình: {revenue_data.get('average_order_value', 0):,.0f} VNĐ")
-        
-        # Phân tích sản phẩm
-        doc.add_heading("Phân Tích Sản Phẩm", level=1)
-        if "product_analysis" in calculations:
-            product_data = calculations["product_analysis"]
-            
-            doc.add_heading("Top 5 Sản Phẩm Theo Số Lượng", level=2)
-            for i, product in enumerate(product_data.get("top_products_by_quantity", [])[:5], 1):
-                doc.add_paragraph(f"{i}. {product['product_name']}: {product['total_quantity']:,} đơn vị")
-            
-            doc.add_heading("Top 5 Sản Phẩm Theo Doanh Thu", level=2)
-            for i, product in enumerate(product_data.get("top_products_by_revenue", [])[:5], 1):
-                doc.add_paragraph(f"{i}. {product['product_name']}: {product['total_revenue']:,.0f} VNĐ")
-        
-        # Phân tích theo thời gian
-        doc.add_heading("Phân Tích Theo Thời Gian", level=1)
-        if "time_analysis" in calculations:
-            time_data = calculations["time_analysis"]
-            
-            doc.add_heading("Giờ Cao Điểm", level=2)
-            for hour_data in time_data.get("busiest_hours", [])[:5]:
-                doc.add_paragraph(f"• Giờ {hour_data['hour']}: {hour_data['order_count']} đơn hàng")
-        
-        # Thêm biểu đồ
-        if chart_paths:
-            doc.add_heading("Biểu Đồ", level=1)
-            for chart_name, chart_path in chart_paths.items():
-                if os.path.exists(chart_path):
-                    doc.add_picture(chart_path, width=Inches(6))
-                    doc.add_paragraph(f"*{chart_name.replace('_', ' ').title()}*")
-        
-        # Kết luận và khuyến nghị
-        doc.add_heading("Kết Luận & Khuyến Nghị", level=1)
-        doc.add_paragraph("Dựa trên phân tích dữ liệu, chúng tôi đưa ra các khuyến nghị sau:")
-        doc.add_paragraph("• Tập trung vào các sản phẩm bán chạy")
-        doc.add_paragraph("• Tối ưu hóa thời gian phục vụ trong giờ cao điểm")
-        doc.add_paragraph("• Phát triển chiến lược marketing cho các khung giờ thấp")
-        
         # Lưu báo cáo
         today_str = datetime.now().strftime('%d-%m-%Y')
         report_filename = f"Báo cáo ngày {today_str}.docx"
 
         report_path = os.path.join(REPORTS_DIR, report_filename)
-        doc.save(report_path)
+        render_report(calculations, chart_paths, report_path)
         
         print("✅ Tạo báo cáo Word hoàn tất.")
         return {"report_path": report_path}
         
     except Exception as e:
+        # Để lỗi dừng graph: state đến node trước đã được lưu nên lần chạy lại với cùng run id
+        # chỉ cần tạo lại báo cáo, không gọi lại LLM
         print(f"❌ Lỗi khi tạo báo cáo: {e}")
-        return {"report_path": ""}
+        raise
 
+@traced("node.send_email")
 def send_email_node(state: AnalysisState) -> Dict[str, Any]:
     """Node để gửi email báo cáo."""
     print("📧 Đang gửi email báo cáo...")
@@ -615,22 +726,14 @@ def send_email_node(state: AnalysisState) -> Dict[str, Any]:
     
     try:
         # Cấu hình email (cần thiết lập trong .env)
-        smtp_server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
-        smtp_port = int(os.getenv("SMTP_PORT", "587"))
         email_user = os.getenv("EMAIL_USER", "")
-        email_password = os.getenv("EMAIL_PASSWORD", "")
         recipient_email = os.getenv("RECIPIENT_EMAIL", "")
+        mail_queue = get_mail_queue()
         
-        if not all([email_user, email_password, recipient_email]):
+        if mail_queue is None or not recipient_email:
             print("⚠️ Thiếu thông tin email, bỏ qua việc gửi email.")
             return {}
         
-        # Tạo email
-        msg = MIMEMultipart()
-        msg['From'] = email_user
-        msg['To'] = recipient_email
-        msg['Subject'] = f"Báo Cáo Phân Tích F&B - {datetime.now().strftime('%d/%m/%Y')}"
-        
         # Nội dung email
         body = f"""
         Xin chào,
@@ -644,45 +747,84 @@ def send_email_node(state: AnalysisState) -> Dict[str, Any]:
         Hệ thống phân tích tự động
         """
         
-        msg.attach(MIMEText(body, 'plain', 'utf-8'))
+        attachments = [report_path] if report_path and os.path.exists(report_path) else []
         
-        # Đính kèm file báo cáo
-        if report_path and os.path.exists(report_path):
-            with open(report_path, "rb") as attachment:
-                part = MIMEBase('application', 'octet-stream')
-                part.set_payload(attachment.read())
-            
-            encoders.encode_base64(part)
-            part.add_header(
-                'Content-Disposition',
-                f'attachment; filename= {os.path.basename(report_path)}'
-            )
-            msg.attach(part)
+        sent = mail_queue.submit(OutgoingMail(
+            sender=email_user,
+            recipients=[r.strip() for r in recipient_email.split(',') if r.strip()],
+            subject=f"Báo Cáo Phân Tích F&B - {datetime.now().strftime('%d/%m/%Y')}",
+            body=body,
+            attachments=attachments,
+        ))
         
-        # Gửi email
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(email_user, email_password)
-        text = msg.as_string()
-        server.sendmail(email_user, recipient_email, text)
-        server.quit()
-        
-        print("✅ Gửi email thành công.")
+        if not is_checkpointed_run():
+            # Không có checkpoint để chạy lại: gửi nền, graph không phải chờ SMTP
+            print("✅ Đã đưa email vào hàng đợi gửi.")
+            return {}
+        # Lượt có checkpoint: chờ kết quả gửi, lỗi SMTP làm dừng graph trước checkpoint của node này
+        # nên chạy lại cùng run id chỉ gửi lại email (main() cũng chờ hàng đợi khi kết thúc nên không chậm hơn)
+        sent.result()
+        print("✅ Đã gửi email thành công.")
         return {}
         
     except Exception as e:
         print(f"❌ Lỗi khi gửi email: {e}")
+        if is_checkpointed_run():
+            raise
         return {}
 
+def is_checkpointed_run() -> bool:
+    """Node đang chạy trong một lượt có run id (thread_id), tức là state được checkpoint và chạy tiếp được."""
+    try:
+        from langgraph.config import get_config
+        return get_config().get("configurable", {}).get("thread_id") is not None
+    except RuntimeError:
+        return False  # Không chạy trong graph
+
+def get_mail_queue() -> Optional[MailQueue]:
+    """Trả về hàng đợi gửi email dùng chung (một kết nối SMTP cho cả lượt chạy)."""
+    global _mail_queue
+    if _mail_queue is None:
+        mailer = mailer_from_env()
+        if mailer is not None:
+            _mail_queue = MailQueue(mailer)
+    return _mail_queue
+
+def flush_mail_queue():
+    """Chờ gửi hết các email trong hàng đợi rồi đóng kết nối SMTP."""
+    global _mail_queue
+    if _mail_queue is not None:
+        _mail_queue.close(wait=True)
+        _mail_queue = None
+
 # --- Xây dựng Graph hoàn chỉnh ---
 
-def build_analysis_graph() -> Any:
+def build_analysis_graph(draft_only: bool = False, checkpointer: Any = None) -> Any:
+    """
+    Graph đầy đủ: tiền xử lý -> kiến thức -> analyst <-> critic -> biểu đồ -> báo cáo -> email.
+    draft_only=True chỉ chạy tới bản nháp đầu tiên của analyst (dùng khi stream phân tích theo yêu cầu).
+    Có checkpointer thì state được lưu sau mỗi node theo thread_id (run id) của config.
+    """
+    from langgraph.graph import StateGraph, END
+
+    if draft_only:
+        graph = StateGraph(AnalysisState)
+        graph.add_node("preprocess", preprocess_node)
+        graph.add_node("retrieve_knowledge", retrieve_knowledge_node)
+        graph.add_node("analyst", llm_analyst_node)
+        graph.set_entry_point("preprocess")
+        graph.add_edge("preprocess", "retrieve_knowledge")
+        graph.add_edge("retrieve_knowledge", "analyst")
+        graph.add_edge("analyst", END)
+        return graph.compile(checkpointer=checkpointer)
+
     graph = StateGraph(AnalysisState)
     
     # Thêm các node
     graph.add_node("preprocess", preprocess_node)
     graph.add_node("retrieve_knowledge", retrieve_knowledge_node)
     graph.add_node("analyst", llm_analyst_node)
+    graph.add_node("fact_check", fact_check_node)
     graph.add_node("critic", llm_critic_node)
     graph.add_node("create_charts", create_charts_node)
     graph.add_node("create_report", create_report_node)
@@ -692,9 +834,18 @@ def build_analysis_graph() -> Any:
     graph.set_entry_point("preprocess")
     graph.add_edge("preprocess", "retrieve_knowledge")
     graph.add_edge("retrieve_knowledge", "analyst")
-    graph.add_edge("analyst", "critic")
+    graph.add_edge("analyst", "fact_check")
     
     # Thêm cạnh điều kiện
+    graph.add_conditional_edges(
+        "fact_check",
+        after_fact_check,
+        {
+            "critic": "critic", # Số liệu đúng: LLM Critic chấm điểm chất lượng
+            "reflect": "analyst", # Sai số liệu: viết lại với phản hồi đã sinh sẵn
+            "end": "create_charts"  # Hết số lần cải thiện: chấp nhận bản cuối
+        }
+    )
     graph.add_conditional_edges(
         "critic",
         should_continue,
@@ -708,22 +859,71 @@ def build_analysis_graph() -> Any:
     graph.add_edge("create_report", "send_email")
     graph.add_edge("send_email", END)
     
-    return graph.compile()
+    return graph.compile(checkpointer=checkpointer)
 
-def main(payload: Optional[Dict[str, Any]] = None):
-    print("🚀 Bắt đầu quy trình phân tích báo cáo tự động (phiên bản nâng cao)...")
-    payload = fetch_data("2025-08-17", "2025-08-22")
-    app = build_analysis_graph()
-    
-    question = "Phân tích dữ liệu kinh doanh và đưa ra các nhận định quan trọng về hiệu suất sản phẩm và xu hướng theo thời gian."
-    
-    # Chạy quy trình
-    if payload is not None:
-        app.invoke({"question": question, "payload": payload})
-    else:
-        app.invoke({"question": question})
+def stream_analysis(inputs: Optional[Dict[str, Any]], draft_only: bool = False, checkpointer: Any = None,
+                    config: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Chạy graph qua app.stream và trả dần các sự kiện ngay khi có (inputs=None cùng checkpointer và
+    config {"configurable": {"thread_id": run_id}} để chạy tiếp từ checkpoint cuối):
+    - {"type": "token", "node": ..., "text": ...}: một đoạn câu trả lời của LLM (analyst/critic) vừa nhận;
+    - {"type": "node", "node": ..., "update": {...}}: một node vừa chạy xong cùng phần state nó trả về.
+    """
+    app = build_analysis_graph(draft_only=draft_only, checkpointer=checkpointer)
+    for mode, chunk in app.stream(inputs, config, stream_mode=["messages", "custom", "updates"]):
+        if mode == "messages":
+            message, metadata = chunk
+            if isinstance(message.content, str) and message.content:
+                yield {"type": "token", "node": metadata.get("langgraph_node"), "text": message.content}
+        elif mode == "custom":
+            yield chunk
+        else:
+            for node, update in chunk.items():
+                yield {"type": "node", "node": node, "update": update or {}}
+
+def main(payload: Optional[Dict[str, Any]] = None, run_id: Optional[str] = None):
+    """
+    Chạy toàn bộ quy trình với run id (mặc định theo thời điểm bắt đầu). Nếu run id đã có checkpoint
+    chưa chạy xong (lỗi hoặc bị dừng), quy trình chạy tiếp từ node cuối đã hoàn tất: không lấy lại
+    dữ liệu và không gọi lại vòng analyst/critic đã xong. Lượt mới luôn lấy dữ liệu qua fetch_data.
+    """
+    import sqlite3
+    from contextlib import closing
+    from langgraph.checkpoint.sqlite import SqliteSaver
 
-    print("\n🎉 Quy trình đã hoàn tất thành công!")
+    print("🚀 Bắt đầu quy trình phân tích báo cáo tự động (phiên bản nâng cao)...")
+    run_id = run_id or datetime.now().strftime("%Y%m%d-%H%M%S")
+    config = {"configurable": {"thread_id": run_id}}
+    with closing(sqlite3.connect(CHECKPOINT_DB, check_same_thread=False)) as conn, \
+            span("main", run_id=run_id) as root:
+        checkpointer = SqliteSaver(conn)
+        saved = build_analysis_graph(checkpointer=checkpointer).get_state(config)
+        if saved.values and not saved.next:
+            print(f"✅ Lượt chạy {run_id} đã hoàn tất trước đó, không có gì để chạy tiếp.")
+            return
+        if saved.next:
+            print(f"⏯️ Chạy tiếp lượt {run_id} từ node: {', '.join(saved.next)}")
+            inputs = None
+        else:
+            payload = fetch_data("2025-08-17", "2025-08-22")
+            question = "Phân tích dữ liệu kinh doanh và đưa ra các nhận định quan trọng về hiệu suất sản phẩm và xu hướng theo thời gian."
+            inputs = {"question": question, "payload": payload}
+
+        # Chạy quy trình, in bản phân tích ngay khi LLM sinh ra từng đoạn
+        try:
+            for event in stream_analysis(inputs, checkpointer=checkpointer, config=config):
+                if event["type"] == "token" and event["node"] == "analyst":
+                    print(event["text"], end="", flush=True)
+                elif event["type"] == "node" and event["node"] == "analyst":
+                    print()
+        except Exception:
+            print(f"\n❌ Quy trình dừng do lỗi. Chạy lại với run id {run_id} để tiếp tục từ bước lỗi.")
+            raise
+        finally:
+            flush_mail_queue()
+    print(f"\n🎉 Quy trình đã hoàn tất thành công! (run id {run_id})")
+    print(f"\n⏱️ Thời gian theo từng bước (trace {root.trace_id}):")
+    print(summary_table(tracer.collect(root.trace_id)))
 
 if __name__ == "__main__":
     print("--- CHẠY THỬ NGHIỆM SCRIPT VỚI DỮ LIỆU THẬT ---")
@@ -756,4 +956,5 @@ if __name__ == "__main__":
     # ▲▲▲ PASTE YOUR REAL JSON DATA HERE ▲▲▲
 
     # The script will run with the data you just pasted
-    main(sample_payload_from_n8n)
+    # Truyền run id của lượt bị lỗi (python main_v3_test.py <run_id>) để chạy tiếp lượt đó
+    main(sample_payload_from_n8n, run_id=sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,106 @@
+"""
+Chạy dashboard ở chế độ production với nhiều worker.
+
+Tiến trình master tải và phân tích dữ liệu đúng một lần, ghi snapshot vào shared memory,
+rồi fork các worker cùng lắng nghe trên một socket. Mỗi worker import index.py và gắn vào
+snapshot ở chế độ chỉ đọc thay vì tự chạy load_and_prepare_data, nên khởi động gần như tức thì
+và bộ nhớ không tăng theo số worker.
+
+    python serve.py --workers 4 --port 5000
+
+File này cũng dùng được làm file cấu hình gunicorn (các hook bên dưới chạy trong master):
+
+    gunicorn -c serve.py index:app
+"""
+import argparse
+import multiprocessing as mp
+import os
+import signal
+import socket
+
+from data_loader import load_and_prepare_data
+from utils.analysis.shared_snapshot import SNAPSHOT_ENV, publish_snapshot
+
+# --- Cấu hình mặc định (cũng là cấu hình gunicorn) ---
+bind = os.getenv("BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+preload_app = False  # Worker phải tự import index.py để gắn vào shared memory
+
+_snapshot_shm = None
+
+
+def build_snapshot():
+    """Phân tích dữ liệu trong master và công bố snapshot qua shared memory."""
+    global _snapshot_shm
+    invoices_df, analyzed_data = load_and_prepare_data()
+    if not analyzed_data:
+        raise SystemExit("Không có dữ liệu để phục vụ.")
+    _snapshot_shm = publish_snapshot(analyzed_data)
+    os.environ[SNAPSHOT_ENV] = _snapshot_shm.name
+    print(f"✅ Đã công bố snapshot ({_snapshot_shm.size:,} bytes, {len(invoices_df):,} hóa đơn) tại {_snapshot_shm.name}")
+    return _snapshot_shm
+
+
+def release_snapshot():
+    global _snapshot_shm
+    if _snapshot_shm is not None:
+        _snapshot_shm.close()
+        _snapshot_shm.unlink()
+        _snapshot_shm = None
+
+
+# --- Hook cho gunicorn ---
+def on_starting(server):
+    build_snapshot()
+
+
+def on_exit(server):
+    release_snapshot()
+
+
+# --- Prefork server dùng werkzeug ---
+def _run_worker(fd: int, host: str, port: int):
+    from werkzeug.serving import make_server
+    import index
+
+    server = make_server(host, port, index.app, threaded=True, fd=fd)
+    signal.signal(signal.SIGTERM, lambda *args: os._exit(0))
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chạy dashboard production với nhiều worker dùng chung snapshot phân tích.")
+    parser.add_argument("--host", default=bind.rsplit(":", 1)[0])
+    parser.add_argument("--port", type=int, default=int(bind.rsplit(":", 1)[1]))
+    parser.add_argument("--workers", type=int, default=workers)
+    args = parser.parse_args()
+
+    build_snapshot()
+    sock = socket.create_server((args.host, args.port), reuse_port=False, backlog=128)
+    ctx = mp.get_context("fork")
+    processes = [
+        ctx.Process(target=_run_worker, args=(sock.fileno(), args.host, args.port), daemon=True)
+        for _ in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    print(f"🚀 Đang phục vụ tại http://{args.host}:{args.port} với {args.workers} worker")
+
+    def shutdown(*_):
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join(timeout=5)
+        sock.close()
+        release_snapshot()
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    for process in processes:
+        process.join()
+    shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import os
+import sys
+import tempfile
+from typing import Any, List
+
+import pytest
+
+# Cho phép import các module ở thư mục gốc (main_v3_test, utils, ...) khi chạy pytest từ bất kỳ đâu
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Payload n8n nhỏ: 2 đơn, tổng doanh thu 195.000
+N8N_PAYLOAD = {
+    "result": {
+        "data": [
+            {
+                "id": "order_001",
+                "calcTotalMoney": "150000",
+                "createdDateTime": "2025-08-22T14:10:00Z",
+                "products": [{"productName": "Trà Sữa Trân Châu", "price": "50000", "quantity": "3"}],
+            },
+            {
+                "id": "order_002",
+                "calcTotalMoney": "45000",
+                "createdDateTime": "2025-08-21T18:45:00Z",
+                "products": [
+                    {"productName": "Cà Phê Đen", "price": "20000", "quantity": "1"},
+                    {"productName": "Bánh Tiramisu", "price": "25000", "quantity": "1"},
+                ],
+            },
+        ]
+    }
+}
+WRONG_DRAFT = "## Tổng quan\n- Tổng doanh thu: 999.999.000 VNĐ\n"
+RIGHT_DRAFT = "## Tổng quan\n- Tổng doanh thu: 195.000 VNĐ\n"
+GOOD_CRITIQUE = '{"score": 9, "critique": "Tốt"}'
+
+
+@pytest.fixture
+def fake_llms(monkeypatch):
+    """
+    Thay Gemini bằng hai FakeListChatModel (analyst và critic) ghi lại messages của mỗi lần gọi;
+    kiến thức Mentor cố định và bộ nhớ đệm LLM tắt (trừ khi test tự bật).
+    """
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    import main_v3_test
+
+    class RecordingChatModel(FakeListChatModel):
+        prompts: List[Any] = []
+
+        def _call(self, messages, *args, **kwargs):
+            self.prompts.append([m.content for m in messages])
+            return super()._call(messages, *args, **kwargs)
+
+        def _stream(self, messages, *args, **kwargs):
+            self.prompts.append([m.content for m in messages])
+            yield from super()._stream(messages, *args, **kwargs)
+
+    def install(analyst_responses, critic_responses=(GOOD_CRITIQUE,)):
+        models = {
+            "analyst": RecordingChatModel(responses=list(analyst_responses), prompts=[]),
+            "critic": RecordingChatModel(responses=list(critic_responses), prompts=[]),
+        }
+        # Critic là lời gọi duy nhất bật chế độ JSON (model_kwargs)
+        monkeypatch.setattr(main_v3_test, "chat_model",
+                            lambda **kwargs: models["critic" if "model_kwargs" in kwargs else "analyst"])
+        return models
+
+    monkeypatch.setattr(main_v3_test, "retrieve_knowledge", lambda question: ["Luôn so sánh với tuần trước."])
+    monkeypatch.setattr(main_v3_test, "get_prompt_cache", lambda: None)
+    return install
+
+
+@pytest.fixture
+def report_nodes(monkeypatch):
+    """Thay các node biểu đồ/báo cáo/email bằng node ghi lại bản phân tích cuối cùng (không vẽ, không gửi)."""
+    import main_v3_test
+
+    reports = []
+    monkeypatch.setattr(main_v3_test, "create_charts_node", lambda state: {"chart_paths": {}})
+    monkeypatch.setattr(main_v3_test, "create_report_node",
+                        lambda state: reports.append(state["analysis"]) or {"report_path": "report.docx"})
+    monkeypatch.setattr(main_v3_test, "send_email_node", lambda state: {})
+    return reports
+
+
+@pytest.fixture
+def api_client(monkeypatch):
+    """
+    Flask test client của index.py phục vụ phân tích của bảng hóa đơn được truyền vào.
+    index.py được import với việc theo dõi tệp dữ liệu tắt và log nạp hóa đơn nằm ngoài thư mục dự án.
+    """
+    os.environ.setdefault('DATA_RELOAD_SECONDS', '0')
+    os.environ.setdefault('INGEST_LOG', os.path.join(tempfile.mkdtemp(), 'ingest.jsonl'))
+    import index
+    from analyse import AnalysisSections
+
+    def connect(invoices_df):
+        monkeypatch.setattr(index, "analyzed_data", AnalysisSections(invoices_df))
+        index.response_cache.invalidate()
+        return index.app.test_client()
+
+    yield connect
+    index.response_cache.invalidate()
@@ -0,0 +1,94 @@
+import json
+
+import pandas as pd
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+import main_v3_test
+from conftest import RIGHT_DRAFT
+from utils.llm.prompt_cache import PromptCache
+
+DRAFT_INPUTS = {
+    "question": "Phân tích doanh thu",
+    "calculations": {"revenue_summary": {"total_revenue": 195000, "total_orders": 2}},
+    "context": "Số liệu tổng hợp của dashboard.",
+}
+
+
+def token_events(events):
+    return [event for event in events if event["type"] == "token" and event["node"] == "analyst"]
+
+
+def test_stream_analysis_yields_tokens_as_generated(fake_llms):
+    fake_llms([RIGHT_DRAFT])
+    events = list(main_v3_test.stream_analysis(DRAFT_INPUTS, draft_only=True))
+
+    tokens = token_events(events)
+    assert len(tokens) > 1
+    assert "".join(event["text"] for event in tokens) == RIGHT_DRAFT
+    # Các token đến trước khi node analyst báo hoàn tất
+    analyst_done = next(i for i, event in enumerate(events) if event["type"] == "node" and event["node"] == "analyst")
+    assert events.index(tokens[-1]) < analyst_done
+    assert events[analyst_done]["update"]["analysis"] == RIGHT_DRAFT
+
+
+def test_cached_answer_is_one_custom_token(fake_llms, monkeypatch, tmp_path):
+    cache = PromptCache(str(tmp_path / "llm_cache.db"))
+    monkeypatch.setattr(main_v3_test, "get_prompt_cache", lambda: cache)
+    models = fake_llms([RIGHT_DRAFT])
+
+    list(main_v3_test.stream_analysis(DRAFT_INPUTS, draft_only=True))
+    events = list(main_v3_test.stream_analysis(DRAFT_INPUTS, draft_only=True))
+
+    assert len(models["analyst"].prompts) == 1
+    assert token_events(events) == [{"type": "token", "node": "analyst", "text": RIGHT_DRAFT}]
+
+
+def sse_events(response):
+    """[(tên sự kiện, dữ liệu)] từ thân phản hồi text/event-stream."""
+    events = []
+    for block in response.get_data(as_text=True).split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line)
+        if "event" in fields:
+            events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+@pytest.fixture
+def stream_client(api_client):
+    return api_client(pd.DataFrame([{
+        'id_hoa_don': f'HD{i}',
+        'datetime': pd.Timestamp('2025-08-21 08:00') + pd.Timedelta(hours=5 * i),
+        'chi_tiet': [{'ten_hang': 'Cà Phê Đen', 'so_luong': 1, 'don_gia': 20000, 'thanh_tien': 20000}],
+        'tong_tien_hoa_don': 20000,
+    } for i in range(10)]))
+
+
+def test_sse_endpoint_streams_tokens_then_done(fake_llms, stream_client):
+    fake_llms([RIGHT_DRAFT])
+    response = stream_client.get("/api/analysis-stream")
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    events = sse_events(response)
+    names = [name for name, _ in events]
+    assert names.count("token") > 1
+    assert names[-1] == "done" and "token" not in names[names.index("done"):]
+    assert "".join(data["text"] for name, data in events if name == "token") == RIGHT_DRAFT
+    assert events[-1][1] == {"analysis": RIGHT_DRAFT}
+
+
+def test_sse_endpoint_reports_llm_errors(fake_llms, stream_client, monkeypatch):
+    class FailingChatModel(FakeListChatModel):
+        def _call(self, *args, **kwargs):
+            raise RuntimeError("Gemini quá tải")
+
+        def _stream(self, *args, **kwargs):
+            raise RuntimeError("Gemini quá tải")
+
+    fake_llms([RIGHT_DRAFT])
+    monkeypatch.setattr(main_v3_test, "chat_model", lambda **kwargs: FailingChatModel(responses=["x"]))
+    events = sse_events(stream_client.get("/api/analysis-stream"))
+
+    assert [name for name, _ in events] == ["error"]
+    assert "Gemini quá tải" in events[0][1]["error"]
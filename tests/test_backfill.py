@@ -0,0 +1,96 @@
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import pytest
+
+import backfill
+from conftest import N8N_PAYLOAD
+from preprocessing import preprocessing_data
+
+
+def test_split_periods_clips_first_and_last_period():
+    assert backfill.split_periods(date(2025, 8, 30), date(2025, 9, 1), 'day') == [
+        ('2025-08-30', date(2025, 8, 30), date(2025, 8, 30)),
+        ('2025-08-31', date(2025, 8, 31), date(2025, 8, 31)),
+        ('2025-09-01', date(2025, 9, 1), date(2025, 9, 1)),
+    ]
+    # 2025-08-20 là thứ Tư; tuần ISO bắt đầu từ thứ Hai
+    assert backfill.split_periods(date(2025, 8, 20), date(2025, 9, 2), 'week') == [
+        ('2025-W34', date(2025, 8, 20), date(2025, 8, 24)),
+        ('2025-W35', date(2025, 8, 25), date(2025, 8, 31)),
+        ('2025-W36', date(2025, 9, 1), date(2025, 9, 2)),
+    ]
+    assert backfill.split_periods(date(2024, 1, 15), date(2024, 3, 10), 'month') == [
+        ('2024-01', date(2024, 1, 15), date(2024, 1, 31)),
+        ('2024-02', date(2024, 2, 1), date(2024, 2, 29)),
+        ('2024-03', date(2024, 3, 1), date(2024, 3, 10)),
+    ]
+
+
+def test_group_rows_by_period_and_counts_undated():
+    rows = preprocessing_data(N8N_PAYLOAD) + [{'date': '', 'productName': 'X'}, {'productName': 'Y'}]
+    by_day, undated = backfill.group_rows(rows, 'day')
+    assert {key: len(period_rows) for key, period_rows in by_day.items()} == {'2025-08-22': 1, '2025-08-21': 2}
+    assert undated == 2
+
+    by_week, _ = backfill.group_rows(rows, 'week')
+    assert {key: len(period_rows) for key, period_rows in by_week.items()} == {'2025-W34': 3}
+
+
+@pytest.fixture
+def run_backfill(monkeypatch, tmp_path):
+    """Chạy `python backfill.py ... --payload` trong cùng tiến trình; báo cáo được thay bằng tệp rỗng."""
+    payload_path = tmp_path / 'payload.json'
+    payload_path.write_text(json.dumps(N8N_PAYLOAD), encoding='utf-8')
+    output = tmp_path / 'out'
+    built = []
+
+    def fake_report(job):
+        built.append(job['key'])
+        with open(job['report_path'], 'wb'):
+            pass
+        return {'key': job['key'], 'report_path': job['report_path'], 'rows': len(job['rows'])}
+
+    def fail_fetch(*args):
+        raise AssertionError("Không được gọi n8n khi đã có --payload")
+
+    monkeypatch.setattr(backfill, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    monkeypatch.setattr(backfill, 'build_period_report', fake_report)
+    monkeypatch.setattr(backfill, 'fetch_data', fail_fetch)
+
+    def run(*extra):
+        built.clear()
+        monkeypatch.setattr(sys, 'argv', ['backfill.py', '--from', '2025-08-20', '--to', '2025-08-22',
+                                          '--output', str(output), '--payload', str(payload_path), *extra])
+        backfill.main()
+        with open(output / backfill.PROGRESS_FILE, encoding='utf-8') as f:
+            return sorted(built), json.load(f)['periods']
+
+    return run
+
+
+def test_rerun_skips_done_and_empty_periods(run_backfill, monkeypatch):
+    built, periods = run_backfill()
+    assert built == ['2025-08-21', '2025-08-22']
+    assert {key: period['status'] for key, period in periods.items()} == {
+        '2025-08-20': 'empty', '2025-08-21': 'done', '2025-08-22': 'done'}
+
+    # Không còn kỳ nào cần tạo: không đọc lại payload, không tạo báo cáo
+    monkeypatch.setattr(backfill, 'preprocessing_data', lambda payload: pytest.fail("Không được xử lý lại dữ liệu"))
+    built, _ = run_backfill()
+    assert built == []
+
+
+def test_rerun_rebuilds_missing_report_and_force_rebuilds_all(run_backfill):
+    _, periods = run_backfill()
+    os.remove(periods['2025-08-21']['report_path'])
+
+    built, _ = run_backfill()
+    assert built == ['2025-08-21']
+
+    built, periods = run_backfill('--force')
+    assert built == ['2025-08-21', '2025-08-22']
+    assert periods['2025-08-20']['status'] == 'empty'
@@ -0,0 +1,100 @@
+from concurrent.futures import Future
+
+import pytest
+
+import main_v3_test
+from conftest import GOOD_CRITIQUE, N8N_PAYLOAD, RIGHT_DRAFT
+
+# Node gửi email gốc, giữ lại trước khi fixture report_nodes thay nó
+SEND_EMAIL_NODE = main_v3_test.send_email_node
+
+
+@pytest.fixture
+def run_env(monkeypatch, tmp_path, fake_llms, report_nodes):
+    """Checkpoint SQLite riêng cho mỗi test; fetch_data trả payload n8n nhỏ và đếm số lần gọi."""
+    fetches = []
+    monkeypatch.setattr(main_v3_test, "CHECKPOINT_DB", str(tmp_path / "checkpoints.db"))
+    monkeypatch.setattr(main_v3_test, "fetch_data", lambda *args: fetches.append(args) or N8N_PAYLOAD)
+    models = fake_llms([RIGHT_DRAFT], [GOOD_CRITIQUE])
+    return models, fetches, report_nodes
+
+
+def llm_calls(models):
+    return len(models["analyst"].prompts) + len(models["critic"].prompts)
+
+
+def test_resumes_after_failed_report_without_llm_calls(monkeypatch, run_env):
+    models, fetches, reports = run_env
+
+    def broken_report(state):
+        raise RuntimeError("ổ đĩa đầy")
+
+    monkeypatch.setattr(main_v3_test, "create_report_node", broken_report)
+    with pytest.raises(RuntimeError):
+        main_v3_test.main(run_id="r1")
+    assert llm_calls(models) == 2
+    assert len(fetches) == 1
+
+    monkeypatch.setattr(main_v3_test, "create_report_node",
+                        lambda state: reports.append(state["analysis"]) or {"report_path": "report.docx"})
+    main_v3_test.main(run_id="r1")
+    assert llm_calls(models) == 2
+    assert len(fetches) == 1
+    assert reports == [RIGHT_DRAFT]
+
+    # Lượt đã hoàn tất: không chạy lại node nào
+    main_v3_test.main(run_id="r1")
+    assert llm_calls(models) == 2
+    assert len(fetches) == 1
+    assert reports == [RIGHT_DRAFT]
+
+
+def test_email_failure_stops_run_and_resume_only_resends(monkeypatch, run_env):
+    models, fetches, reports = run_env
+    submitted = []
+
+    class FakeQueue:
+        def __init__(self, error=None):
+            self.error = error
+
+        def submit(self, mail):
+            submitted.append(mail)
+            future = Future()
+            if self.error:
+                future.set_exception(self.error)
+            else:
+                future.set_result(True)
+            return future
+
+    # Dùng node gửi email thật với hàng đợi giả
+    monkeypatch.setattr(main_v3_test, "send_email_node", SEND_EMAIL_NODE)
+    monkeypatch.setenv("RECIPIENT_EMAIL", "a@example.com")
+    monkeypatch.setattr(main_v3_test, "get_mail_queue", lambda: FakeQueue(OSError("SMTP sập")))
+    with pytest.raises(OSError):
+        main_v3_test.main(run_id="r2")
+    assert len(submitted) == 1
+
+    monkeypatch.setattr(main_v3_test, "get_mail_queue", lambda: FakeQueue())
+    main_v3_test.main(run_id="r2")
+    assert len(submitted) == 2
+    assert llm_calls(models) == 2
+    assert len(fetches) == 1
+    assert reports == [RIGHT_DRAFT]
+
+
+def test_email_is_sent_in_background_without_checkpointer(monkeypatch, fake_llms, report_nodes):
+    fake_llms([RIGHT_DRAFT], [GOOD_CRITIQUE])
+    pending = Future()
+
+    class PendingQueue:
+        def submit(self, mail):
+            return pending
+
+    # Future chưa xong: nếu node chờ kết quả thì graph sẽ treo
+    monkeypatch.setattr(main_v3_test, "send_email_node", SEND_EMAIL_NODE)
+    monkeypatch.setenv("RECIPIENT_EMAIL", "a@example.com")
+    monkeypatch.setattr(main_v3_test, "get_mail_queue", lambda: PendingQueue())
+    main_v3_test.build_analysis_graph().invoke({"question": "Phân tích doanh thu", "payload": N8N_PAYLOAD})
+
+    assert not pending.done()
+    assert report_nodes == [RIGHT_DRAFT]
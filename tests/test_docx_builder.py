@@ -0,0 +1,54 @@
+from datetime import datetime
+
+from docx import Document
+from PIL import Image
+
+from utils.report.docx_builder import IMAGE_DPI, IMAGE_WIDTH_INCHES, downsample_image, render_report
+
+CALCULATIONS = {
+    "revenue_summary": {"total_revenue": 195000, "total_orders": 2, "average_order_value": 97500},
+    "product_analysis": {
+        "top_products_by_quantity": [{"product_name": "Trà Sữa Trân Châu", "total_quantity": 3}],
+        "top_products_by_revenue": [{"product_name": "Bánh Tiramisu", "total_revenue": 25000}],
+    },
+    "time_analysis": {"busiest_hours": [{"hour": 14, "order_count": 7}]},
+}
+
+
+def save_png(path, width, height):
+    Image.new("RGB", (width, height), "white").save(path)
+    return str(path)
+
+
+def test_render_report_fills_placeholders(tmp_path):
+    chart = save_png(tmp_path / "revenue.png", 1800, 900)
+    report_path = render_report(CALCULATIONS, {"daily_revenue": chart}, str(tmp_path / "report.docx"),
+                                generated_at=datetime(2025, 8, 22, 14, 10))
+
+    doc = Document(report_path)
+    text = "\n".join(paragraph.text for paragraph in doc.paragraphs)
+    assert "{{" not in text
+    assert "Ngày tạo: 22/08/2025 14:10:00" in text
+    assert "• Tổng doanh thu: 195,000 VNĐ" in text
+    assert "• Giá trị đơn hàng trung bình: 97,500 VNĐ" in text
+    assert "1. Trà Sữa Trân Châu: 3 đơn vị" in text
+    assert "1. Bánh Tiramisu: 25,000 VNĐ" in text
+    assert "• Giờ 14: 7 đơn hàng" in text
+    assert "*Daily Revenue*" in text
+    assert len(doc.inline_shapes) == 1
+
+
+def test_render_report_without_charts_drops_chart_block(tmp_path):
+    doc = Document(render_report(CALCULATIONS, {}, str(tmp_path / "report.docx")))
+    assert "{{charts}}" not in "\n".join(paragraph.text for paragraph in doc.paragraphs)
+    assert len(doc.inline_shapes) == 0
+
+
+def test_downsample_image_caps_width(tmp_path):
+    target_width = int(IMAGE_WIDTH_INCHES * IMAGE_DPI)
+    with Image.open(downsample_image(save_png(tmp_path / "large.png", 3000, 1500))) as img:
+        assert img.size == (target_width, target_width // 2)
+
+    # Ảnh đã nhỏ hơn kích thước hiển thị thì giữ nguyên
+    with Image.open(downsample_image(save_png(tmp_path / "small.png", 400, 300))) as img:
+        assert img.size == (400, 300)
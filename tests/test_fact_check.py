@@ -0,0 +1,114 @@
+import pytest
+
+from utils.llm.fact_check import (TOLERANCE, check_busiest_hours, check_report, check_top_products,
+                                  check_totals, parse_numbers)
+
+# Cùng số liệu với payload n8n trong conftest: 2 đơn, tổng 195.000, trung bình 97.500
+CALCULATIONS = {
+    "revenue_summary": {"total_revenue": 195000, "total_orders": 2, "average_order_value": 97500},
+    "daily_breakdown": {
+        "2025-08-21": {"total_revenue": 45000, "order_count": 1},
+        "2025-08-22": {"total_revenue": 150000, "order_count": 1},
+    },
+    "time_analysis": {
+        "hourly_breakdown": {
+            "14": {"total_revenue": 150000, "order_count": 1},
+            "18": {"total_revenue": 45000, "order_count": 1},
+        },
+    },
+    "product_analysis": {
+        "top_products_by_quantity": [
+            {"product_name": "Trà Sữa Trân Châu", "total_quantity": 3, "total_revenue": 150000, "order_count": 1},
+            {"product_name": "Cà Phê Đen", "total_quantity": 1, "total_revenue": 20000, "order_count": 1},
+        ],
+        "top_products_by_revenue": [
+            {"product_name": "Trà Sữa Trân Châu", "total_quantity": 3, "total_revenue": 150000, "order_count": 1},
+            {"product_name": "Bánh Tiramisu", "total_quantity": 1, "total_revenue": 25000, "order_count": 1},
+        ],
+    },
+}
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("195.000", [(195000, False)]),
+    ("8,085,000", [(8085000, False)]),
+    ("97.500đ", [(97500, False)]),
+    ("97.500 ₫", [(97500, False)]),
+    ("195.000 vnđ", [(195000, False)]),
+    ("45.000 đồng", [(45000, False)]),
+    ("8,1 triệu", [(8100000, True)]),
+    ("250k", [(250000, True)]),
+    ("0,195 triệu", [(195000, True)]),
+    ("0.195", [(0.195, False)]),
+    ("tăng 12% và 76,9 %", []),
+    ("2 đơn", [(2, False)]),
+    ("ngày 22/08 lúc 14:30", []),
+])
+def test_parse_numbers(text, expected):
+    assert [(pytest.approx(value), rounded) for value, rounded in parse_numbers(text)] == expected
+
+
+@pytest.mark.parametrize("line", [
+    "- Tổng doanh thu: 195.000 VNĐ",
+    "- Tổng doanh thu: 0,195 triệu",
+    "- Giá trị đơn hàng trung bình: 97.500đ",
+    "- Tổng doanh thu tăng 12% so với kỳ trước",
+    "Tổng doanh thu ngày này chiếm 76,9%",
+    "- Tổng doanh thu ngày 22/08: 150.000 VNĐ",
+    "- Tổng số đơn: 2 đơn",
+    "- Sản phẩm chiếm 3% tổng doanh thu",
+])
+def test_check_totals_accepts_correct_lines(line):
+    assert check_totals(line, CALCULATIONS, TOLERANCE) == []
+
+
+@pytest.mark.parametrize("line, label", [
+    ("- Tổng doanh thu: 999.999.000 VNĐ", "Tổng doanh thu sai"),
+    ("- Giá trị đơn hàng trung bình: 90.000đ", "Giá trị đơn hàng trung bình sai"),
+    ("- Tổng số đơn hàng: 5", "Tổng số đơn hàng sai"),
+    ("- Tổng doanh thu ngày 22/08: 777.000 VNĐ", "Tổng doanh thu sai"),
+])
+def test_check_totals_flags_wrong_lines(line, label):
+    issues = check_totals(line, CALCULATIONS, TOLERANCE)
+    assert len(issues) == 1 and issues[0].startswith(label)
+
+
+def test_check_top_products():
+    products = CALCULATIONS["product_analysis"]
+    good = "## Top sản phẩm theo số lượng\n1. Trà Sữa Trân Châu: 3 ly, 150.000đ\n2. Cà Phê Đen: 1 ly\n"
+    assert check_top_products(good, products, TOLERANCE) == []
+
+    wrong_figure = "## Top sản phẩm theo số lượng\n1. Trà Sữa Trân Châu: 9 ly\n"
+    assert "Số liệu của \"Trà Sữa Trân Châu\" sai" in check_top_products(wrong_figure, products, TOLERANCE)[0]
+
+    not_in_top = "## Top sản phẩm theo doanh thu\n1. Cà Phê Đen: 20.000đ\n"
+    assert "\"Cà Phê Đen\" không nằm trong top 2 theo doanh thu" in check_top_products(not_in_top, products, TOLERANCE)[0]
+
+    unknown = "## Top sản phẩm theo số lượng\n1. Bánh Mì: 4 cái\n"
+    assert "\"bánh mì\" không nằm trong top" in check_top_products(unknown, products, TOLERANCE)[0]
+
+
+def test_check_busiest_hours():
+    time_analysis = {"hourly_breakdown": {"9": {"order_count": 3}, "14": {"order_count": 7}, "18": {"order_count": 7}}}
+    assert check_busiest_hours("## Giờ cao điểm\n- Đông nhất lúc 14h (7 đơn)\n", time_analysis) == []
+    assert check_busiest_hours("## Giờ cao điểm\n- Khung 18:00 đông khách nhất\n", time_analysis) == []
+    issues = check_busiest_hours("## Giờ cao điểm\n- Đông nhất vào 9 giờ sáng\n", time_analysis)
+    assert issues == ["Giờ đông khách nhất không phải 9h mà là 14h, 18h (7 đơn)."]
+    # Mục khác không bị đối chiếu
+    assert check_busiest_hours("## Tổng quan\n- Mở cửa từ 9 giờ\n", time_analysis) == []
+
+
+def test_check_report_accepts_correct_draft():
+    report = (
+        "## Tổng quan\n"
+        "- Tổng doanh thu: 195.000 VNĐ, tăng 12% so với kỳ trước\n"
+        "- Tổng số đơn: 2\n"
+        "- Giá trị đơn hàng trung bình: 97.500đ\n"
+        "- Tổng doanh thu ngày 22/08 chiếm 76,9%\n"
+        "## Top sản phẩm theo doanh thu\n"
+        "1. Trà Sữa Trân Châu: 150.000đ\n"
+        "2. Bánh Tiramisu: 25.000đ\n"
+        "## Giờ cao điểm\n"
+        "- 14h là giờ bán tốt nhất\n"
+    )
+    assert check_report(report, CALCULATIONS) == []
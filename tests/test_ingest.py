@@ -0,0 +1,67 @@
+import pandas as pd
+import pytest
+
+from utils.api.ingest import InvoiceIngestor, normalize_invoice, read_log
+
+
+def invoice(invoice_id, amount=30000):
+    return normalize_invoice({
+        'id_hoa_don': invoice_id,
+        'datetime': '2025-03-01 08:15:00',
+        'chi_tiet': [{'ten_hang': 'Cà phê sữa', 'so_luong': 1, 'don_gia': amount}],
+    })
+
+
+def ingest(log_path, invoices, apply=lambda batch: None):
+    ingestor = InvoiceIngestor(str(log_path), apply)
+    try:
+        return ingestor.submit(invoices).result(timeout=5)
+    finally:
+        ingestor.close()
+
+
+def test_batches_are_logged_and_replayed(tmp_path):
+    log_path = tmp_path / 'ingested.jsonl'
+    applied = []
+    assert ingest(log_path, [invoice('HD1'), invoice('HD2')], applied.append) == 2
+    assert list(applied[0]['id_hoa_don']) == ['HD1', 'HD2']
+    replayed = read_log(str(log_path))
+    assert list(replayed['id_hoa_don']) == ['HD1', 'HD2']
+    assert replayed['datetime'].iloc[0] == pd.Timestamp('2025-03-01 08:15:00')
+
+
+def test_torn_last_line_is_truncated_before_appending(tmp_path):
+    log_path = tmp_path / 'ingested.jsonl'
+    ingest(log_path, [invoice('HD1')])
+    # Tiến trình dừng giữa lúc ghi lô tiếp theo
+    with open(log_path, 'ab') as f:
+        f.write(b'{"id_hoa_don":"HD2","datet')
+
+    assert ingest(log_path, [invoice('HD3')]) == 1
+    assert list(read_log(str(log_path))['id_hoa_don']) == ['HD1', 'HD3']
+    assert open(log_path, 'rb').read().endswith(b'\n')
+
+
+def test_retried_invoices_are_not_counted_twice(tmp_path):
+    log_path = tmp_path / 'ingested.jsonl'
+    ingest(log_path, [invoice('HD1')])
+    # Gửi lại sau khi khởi động lại, kèm một hóa đơn trùng trong cùng lô
+    assert ingest(log_path, [invoice('HD1'), invoice('HD2'), invoice('HD2')]) == 1
+    assert list(read_log(str(log_path))['id_hoa_don']) == ['HD1', 'HD2']
+
+
+def test_apply_failure_after_logging_still_succeeds(tmp_path):
+    log_path = tmp_path / 'ingested.jsonl'
+
+    def failing_apply(batch):
+        raise RuntimeError("lỗi gộp")
+
+    assert ingest(log_path, [invoice('HD1')], failing_apply) == 1
+    # Client gửi lại: đã có trong log nên không bị ghi lần hai
+    assert ingest(log_path, [invoice('HD1')]) == 0
+    assert list(read_log(str(log_path))['id_hoa_don']) == ['HD1']
+
+
+def test_invalid_invoice_is_rejected():
+    with pytest.raises(ValueError):
+        normalize_invoice({'id_hoa_don': 'HD1', 'datetime': '2025-03-01', 'chi_tiet': []})
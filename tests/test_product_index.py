@@ -0,0 +1,110 @@
+import pandas as pd
+import pytest
+
+from utils.analysis.product_index import DEFAULT_SORT, SORT_OPTIONS, ProductIndex
+
+# Thứ tự gốc như analyze_data: doanh thu giảm dần
+RECORDS = [
+    {'ten_hang': 'Cà Phê Sữa Đá', 'total_quantity': 50, 'total_revenue': 1_500_000},
+    {'ten_hang': 'Trà đào cam sả', 'total_quantity': 30, 'total_revenue': 1_350_000},
+    {'ten_hang': 'Cà phê đen', 'total_quantity': 80, 'total_revenue': 1_200_000},
+    {'ten_hang': 'Capuchino', 'total_quantity': 5, 'total_revenue': 250_000},
+    {'ten_hang': 'Bánh mì', 'total_quantity': 10, 'total_revenue': 200_000},
+]
+
+
+def names(result):
+    return [item['ten_hang'] for item in result['items']]
+
+
+@pytest.fixture(scope='module')
+def product_index():
+    return ProductIndex(RECORDS)
+
+
+@pytest.mark.parametrize('sort, expected', [
+    (DEFAULT_SORT, ['Cà Phê Sữa Đá', 'Trà đào cam sả', 'Cà phê đen', 'Capuchino', 'Bánh mì']),
+    ('total_revenue', ['Bánh mì', 'Capuchino', 'Cà phê đen', 'Trà đào cam sả', 'Cà Phê Sữa Đá']),
+    ('-total_quantity', ['Cà phê đen', 'Cà Phê Sữa Đá', 'Trà đào cam sả', 'Bánh mì', 'Capuchino']),
+    ('total_quantity', ['Capuchino', 'Bánh mì', 'Trà đào cam sả', 'Cà Phê Sữa Đá', 'Cà phê đen']),
+    # Tên được so theo dạng bỏ dấu: "ca phe den" < "ca phe sua da" < "capuchino"
+    ('ten_hang', ['Bánh mì', 'Cà phê đen', 'Cà Phê Sữa Đá', 'Capuchino', 'Trà đào cam sả']),
+    ('-ten_hang', ['Trà đào cam sả', 'Capuchino', 'Cà Phê Sữa Đá', 'Cà phê đen', 'Bánh mì']),
+])
+def test_sort_keys(product_index, sort, expected):
+    assert names(product_index.query(sort=sort)) == expected
+
+
+def test_every_sort_option_is_covered():
+    assert set(SORT_OPTIONS) == {'total_revenue', '-total_revenue', 'total_quantity', '-total_quantity',
+                                 'ten_hang', '-ten_hang'}
+
+
+def test_invalid_sort(product_index):
+    with pytest.raises(ValueError):
+        product_index.query(sort='gia')
+
+
+def test_paging(product_index):
+    result = product_index.query(limit=2, offset=2, sort='-total_quantity')
+    assert result['total'] == 5
+    assert names(result) == ['Trà đào cam sả', 'Bánh mì']
+    assert names(product_index.query(limit=2, offset=4)) == ['Bánh mì']
+
+
+def test_short_query_matches_word_prefixes(product_index):
+    # Dưới 3 ký tự: chỉ khớp đầu từ ("ca" khớp "Cà", "cam", "Capuchino" nhưng không khớp giữa từ)
+    assert names(product_index.query(q='ca')) == ['Cà Phê Sữa Đá', 'Trà đào cam sả', 'Cà phê đen', 'Capuchino']
+    assert names(product_index.query(q='mi')) == ['Bánh mì']
+    assert names(product_index.query(q='an')) == []
+
+
+def test_long_query_uses_trigrams_and_substrings(product_index):
+    assert names(product_index.query(q='uchi')) == ['Capuchino']
+    assert names(product_index.query(q='phe den')) == ['Cà phê đen']
+    # Đủ trigram nhưng không phải chuỗi con thì không khớp
+    assert names(product_index.query(q='phe da')) == []
+    assert product_index.query(q='xyz')['total'] == 0
+
+
+def test_search_ignores_diacritics_and_case(product_index):
+    assert names(product_index.query(q='ca phe')) == ['Cà Phê Sữa Đá', 'Cà phê đen']
+    assert names(product_index.query(q='CÀ PHÊ ĐEN')) == ['Cà phê đen']
+    assert names(product_index.query(q='dao')) == ['Trà đào cam sả']
+
+
+def test_search_combines_with_sort_and_paging(product_index):
+    result = product_index.query(q='ca', sort='-total_quantity', limit=2)
+    assert result['total'] == 4
+    assert names(result) == ['Cà phê đen', 'Cà Phê Sữa Đá']
+
+
+@pytest.fixture
+def client(api_client):
+    return api_client(pd.DataFrame([{
+        'id_hoa_don': f'HD{i}',
+        'datetime': pd.Timestamp('2025-03-01 08:00') + pd.Timedelta(hours=i),
+        'chi_tiet': [{'ten_hang': f'Món {i}', 'so_luong': 1, 'don_gia': 1000 * (i + 1), 'thanh_tien': 1000 * (i + 1)}],
+        'tong_tien_hoa_don': 1000 * (i + 1),
+    } for i in range(600)]))
+
+
+def test_endpoint_caps_limit(client):
+    assert len(client.get('/api/product-analysis?limit=500').get_json()['items']) == 500
+    for query in ('limit=501', 'limit=0', 'offset=-1', 'sort=gia'):
+        response = client.get(f'/api/product-analysis?{query}')
+        assert response.status_code == 400, query
+
+
+def test_endpoint_pages_and_searches(client):
+    page = client.get('/api/product-analysis?limit=10&offset=0&sort=-total_revenue&q=mon 59').get_json()
+    assert page['total'] == 11  # "Món 59" và "Món 590" ... "Món 599"
+    assert [item['ten_hang'] for item in page['items']][:2] == ['Món 599', 'Món 598']
+    # Không có tham số nào: giữ định dạng cũ (cả danh sách)
+    assert len(client.get('/api/product-analysis').get_json()) == 600
+
+
+def test_products_page_requests_pages(client):
+    page = client.get('/products').get_data(as_text=True)
+    assert "fetch('/api/product-analysis?' + params.toString())" in page
+    assert "params.set('limit', PRODUCT_PAGE_SIZE)" in page
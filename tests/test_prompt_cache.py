@@ -0,0 +1,77 @@
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+import main_v3_test
+from conftest import N8N_PAYLOAD, RIGHT_DRAFT, WRONG_DRAFT
+from utils.llm import prompt_cache
+from utils.llm.prompt_cache import PromptCache
+
+
+def messages(question):
+    return [SystemMessage(content="Bạn là chuyên gia F&B."), HumanMessage(content=question)]
+
+
+def test_identical_calls_hit_and_different_calls_miss(tmp_path, fake_llms, monkeypatch):
+    cache = PromptCache(str(tmp_path / "llm_cache.db"))
+    monkeypatch.setattr(main_v3_test, "get_prompt_cache", lambda: cache)
+    llm = fake_llms(["bản 1", "bản 2"])["analyst"]
+
+    first = main_v3_test.invoke_llm(llm, messages("Doanh thu tuần này?"), "llm.test")
+    again = main_v3_test.invoke_llm(llm, messages("Doanh thu tuần này?"), "llm.test")
+    other = main_v3_test.invoke_llm(llm, messages("Doanh thu tháng này?"), "llm.test")
+
+    assert (first.content, again.content, other.content) == ("bản 1", "bản 1", "bản 2")
+    assert len(llm.prompts) == 2
+    stats = cache.stats()
+    assert (stats["entries"], stats["hits"]) == (2, 1)
+
+
+def test_use_cache_false_and_bypass_always_call_the_model(tmp_path, fake_llms, monkeypatch):
+    cache = PromptCache(str(tmp_path / "llm_cache.db"))
+    monkeypatch.setattr(main_v3_test, "get_prompt_cache", lambda: cache)
+    llm = fake_llms(["bản 1", "bản 2", "bản 3"])["analyst"]
+
+    main_v3_test.invoke_llm(llm, messages("Câu hỏi"), "llm.test")
+    assert main_v3_test.invoke_llm(llm, messages("Câu hỏi"), "llm.test", use_cache=False).content == "bản 2"
+    monkeypatch.setattr(main_v3_test, "LLM_CACHE_BYPASS", True)
+    assert main_v3_test.invoke_llm(llm, messages("Câu hỏi"), "llm.test").content == "bản 3"
+    assert len(llm.prompts) == 3
+
+
+def test_expired_entries_miss(tmp_path, monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(prompt_cache.time, "time", lambda: now[0])
+    cache = PromptCache(str(tmp_path / "llm_cache.db"), ttl_seconds=60)
+    cache.put("k", AIMessage("trả lời"))
+    now[0] += 30
+    assert cache.get("k").content == "trả lời"
+    now[0] += 31
+    assert cache.get("k") is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(prompt_cache.time, "time", lambda: now[0])
+    cache = PromptCache(str(tmp_path / "llm_cache.db"), max_bytes=10_000)
+    for key in ("a", "b", "c"):
+        now[0] += 1
+        cache.put(key, AIMessage(key * 3000))
+    now[0] += 1
+    cache.get("a")
+    now[0] += 1
+    cache.put("d", AIMessage("d" * 3000))
+    assert cache.get("b") is None
+    assert all(cache.get(key) is not None for key in ("a", "c", "d"))
+
+
+def test_reflection_retry_is_not_served_from_cache(tmp_path, fake_llms, report_nodes, monkeypatch):
+    cache = PromptCache(str(tmp_path / "llm_cache.db"))
+    monkeypatch.setattr(main_v3_test, "get_prompt_cache", lambda: cache)
+    models = fake_llms([WRONG_DRAFT, RIGHT_DRAFT])
+
+    app = main_v3_test.build_analysis_graph()
+    app.invoke({"question": "Phân tích doanh thu", "payload": N8N_PAYLOAD})
+
+    # Bản nháp đầu sai số liệu bị trả lại; bản viết lại phải là một lời gọi LLM mới
+    assert len(models["analyst"].prompts) == 2
+    assert report_nodes == [RIGHT_DRAFT]
+
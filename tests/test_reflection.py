@@ -0,0 +1,51 @@
+import main_v3_test
+from conftest import GOOD_CRITIQUE, N8N_PAYLOAD, RIGHT_DRAFT, WRONG_DRAFT
+from utils.llm.fact_check import check_report, critique_from_issues
+
+
+def analyst_state(history):
+    return {
+        "question": "Phân tích doanh thu",
+        "context": "{}",
+        "knowledge": ["Luôn so sánh với tuần trước."],
+        "calculations": {"revenue_summary": {"total_revenue": 195000, "total_orders": 2}},
+        "reflection_history": history,
+    }
+
+
+def test_analyst_prompt_includes_knowledge_and_last_critique(fake_llms):
+    models = fake_llms([RIGHT_DRAFT])
+    history = [
+        {"analysis": "bản 1", "critique": "Phản hồi cũ"},
+        {"analysis": WRONG_DRAFT, "critique": "Tổng doanh thu sai: phải là 195.000 VNĐ"},
+    ]
+
+    main_v3_test.llm_analyst_node(analyst_state(history))
+
+    prompt = models["analyst"].prompts[0][-1]
+    assert "Luôn so sánh với tuần trước." in prompt
+    assert "Tổng doanh thu sai: phải là 195.000 VNĐ" in prompt
+    assert "Phản hồi cũ" not in prompt
+
+
+def test_first_draft_prompt_has_no_critique(fake_llms):
+    models = fake_llms([RIGHT_DRAFT])
+    main_v3_test.llm_analyst_node(analyst_state([]))
+    assert "Phản hồi từ lần trước" not in models["analyst"].prompts[0][-1]
+
+
+def test_rejected_draft_critique_reaches_next_prompt(fake_llms, report_nodes):
+    models = fake_llms([WRONG_DRAFT, RIGHT_DRAFT], [GOOD_CRITIQUE])
+
+    app = main_v3_test.build_analysis_graph()
+    app.invoke({"question": "Phân tích doanh thu", "payload": N8N_PAYLOAD})
+
+    first_prompt, second_prompt = (prompt[-1] for prompt in models["analyst"].prompts)
+    calculations = {"revenue_summary": {"total_revenue": 195000, "total_orders": 2, "average_order_value": 97500}}
+    critique = critique_from_issues(check_report(WRONG_DRAFT, calculations))
+    assert "999.999.000" in critique
+    assert critique not in first_prompt
+    assert critique in second_prompt
+    # Bản nháp sai bị trả lại ngay (không qua LLM Critic), bản sửa được chấm và đưa vào báo cáo
+    assert len(models["critic"].prompts) == 1
+    assert report_nodes == [RIGHT_DRAFT]
@@ -0,0 +1,44 @@
+import threading
+
+from utils.api.response_cache import ResponseCache, dumps
+
+
+def test_reuses_payload_until_invalidated():
+    cache = ResponseCache()
+    calls = []
+
+    def producer():
+        calls.append(1)
+        return {"total": len(calls)}
+
+    first = cache.get("/api/x", producer)
+    assert cache.get("/api/x", producer) is first
+    cache.invalidate()
+    assert cache.get("/api/x", producer).bodies['identity'] == dumps({"total": 2})
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_payload_computed_during_invalidate_is_not_cached():
+    cache = ResponseCache()
+    started, release = threading.Event(), threading.Event()
+    data = {"version": "old"}
+
+    def slow_producer():
+        value = dict(data)
+        started.set()
+        release.wait(5)
+        return value
+
+    results = {}
+    worker = threading.Thread(target=lambda: results.setdefault("stale", cache.get("/api/x", slow_producer)))
+    worker.start()
+    started.wait(5)
+    # Dữ liệu được nạp lại trong lúc payload cũ đang được tính
+    data["version"] = "new"
+    cache.invalidate()
+    release.set()
+    worker.join(5)
+
+    assert results["stale"].bodies['identity'] == dumps({"version": "old"})
+    fresh = cache.get("/api/x", lambda: dict(data))
+    assert fresh.bodies['identity'] == dumps({"version": "new"})
@@ -0,0 +1,76 @@
+import json
+
+import pandas as pd
+import pytest
+
+from analyse import AnalysisSections
+from utils.analysis.shards import PartialAnalysis, ShardPartial
+from utils.analysis.shared_snapshot import attach_snapshot, publish_snapshot
+from utils.api.response_cache import CachedPayload, dumps
+
+
+def sample_invoices():
+    rows = []
+    for i in range(40):
+        rows.append({
+            'id_hoa_don': f'HD{i:03d}',
+            'datetime': pd.Timestamp('2025-03-01 07:00') + pd.Timedelta(hours=7 * i),
+            'chi_tiet': [
+                {'ten_hang': f'Món {i % 7}', 'so_luong': 1 + i % 3, 'don_gia': 25000, 'thanh_tien': 25000 * (1 + i % 3)},
+                {'ten_hang': 'Bánh mì', 'so_luong': 1, 'don_gia': 20000, 'thanh_tien': 20000},
+            ],
+            'tong_tien_hoa_don': 25000 * (1 + i % 3) + 20000,
+        })
+    return pd.DataFrame(rows)
+
+
+@pytest.fixture
+def published():
+    handles = []
+
+    def publish(analysis):
+        shm = publish_snapshot(analysis)
+        shared, attached = attach_snapshot(shm.name)
+        handles.append((shm, attached))
+        return shared
+
+    yield publish
+    for shm, attached in handles:
+        attached.close()
+        shm.close()
+        shm.unlink()
+
+
+def test_sections_match_and_payloads_are_pre_serialized(published):
+    analysis = AnalysisSections(sample_invoices())
+    shared = published(analysis)
+
+    for key in AnalysisSections.SECTIONS:
+        expected = CachedPayload(dumps(analysis[key]))
+        payload = shared.shared_payload(key)
+        assert all(isinstance(body, memoryview) for body in payload.bodies.values())
+        assert {encoding: bytes(body) for encoding, body in payload.bodies.items()} == expected.bodies
+        assert payload.etags == expected.etags
+    # Chưa mục nào phải parse trong worker
+    assert shared.computed_sections() == []
+
+    assert shared.top_products(5) == json.loads(dumps(analysis['product_analysis'][:5]))
+    assert shared['overall_metrics'] == json.loads(dumps(analysis['overall_metrics']))
+    assert shared.computed_sections() == ['overall_metrics']
+    assert shared.product_cube.hierarchy(top=3) == analysis.product_cube.hierarchy(top=3)
+    assert shared.time_index.period(shared.time_index.last_day, 1) == analysis.time_index.period(
+        analysis.time_index.last_day, 1)
+
+
+def test_store_analyses_are_published(published):
+    invoices = sample_invoices()
+    partials = {'q1': ShardPartial.from_invoices(invoices[:25]), 'q3': ShardPartial.from_invoices(invoices[25:])}
+    chain = PartialAnalysis(ShardPartial.combine(list(partials.values())),
+                            stores={store_id: PartialAnalysis(p) for store_id, p in partials.items()})
+    shared = published(chain)
+
+    assert sorted(shared.stores) == ['q1', 'q3']
+    for store_id, store in chain.stores.items():
+        payload = shared.stores[store_id].shared_payload('product_analysis')
+        assert bytes(payload.bodies['identity']) == dumps(store['product_analysis'])
+        assert shared.stores[store_id]['overall_metrics']['total_invoices'] == store['overall_metrics']['total_invoices']
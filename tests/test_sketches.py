@@ -0,0 +1,102 @@
+import math
+import random
+from collections import Counter
+
+import pytest
+
+from utils.analysis.sketches import CountMinSketch, HyperLogLog, SpaceSaving, _hash64, _hash64_array
+
+
+@pytest.fixture(scope='module')
+def stream():
+    """Luồng dòng (mã đơn, món, số lượng) giả lập, phân phối Zipf như dữ liệu F&B thực tế."""
+    rng = random.Random(42)
+    products = [f"Món {i}" for i in range(500)]
+    weights = [1 / (rank + 1) ** 1.2 for rank in range(len(products))]
+    return [(f"ORD{rng.randrange(60_000)}", rng.choices(products, weights)[0], rng.randint(1, 4))
+            for _ in range(100_000)]
+
+
+def merged(stream, make, add, chunks=4):
+    """Dựng sketch trên từng khối rồi cộng dồn, như khi gộp các cửa hàng."""
+    sketches = []
+    for i in range(chunks):
+        sketch = make()
+        for row in stream[i::chunks]:
+            add(sketch, row)
+        sketches.append(sketch)
+    result = sketches[0]
+    for sketch in sketches[1:]:
+        result = result.merge(sketch)
+    return result
+
+
+def exact_quantities(stream):
+    quantities = Counter()
+    for _, product, quantity in stream:
+        quantities[product] += quantity
+    return quantities
+
+
+def test_hyperloglog_relative_error(stream):
+    hll = merged(stream, lambda: HyperLogLog(12), lambda s, row: s.add(row[0]))
+    exact = len({order for order, _, _ in stream})
+    assert abs(hll.count() - exact) / exact < 3 * 1.04 / math.sqrt(hll.m)
+
+
+def test_hyperloglog_small_counts_are_exact():
+    hll = HyperLogLog(12)
+    for i in range(100):
+        hll.add(f"ORD{i}")
+        hll.add(f"ORD{i}")
+    assert hll.count() == 100
+
+
+def test_space_saving_top_k_matches_most_common(stream):
+    saver = merged(stream, lambda: SpaceSaving(64), lambda s, row: s.add(row[1], row[2]))
+    exact = exact_quantities(stream)
+    total = sum(exact.values())
+
+    assert [item for item, _, _ in saver.top(5)] == [item for item, _ in exact.most_common(5)]
+    for item, count, error in saver.top(5):
+        assert exact[item] <= count <= exact[item] + error
+        assert error <= total / saver.k
+
+
+def test_count_min_error_within_bound(stream):
+    sketch = merged(stream, lambda: CountMinSketch(2048, 4), lambda s, row: s.add(row[1], row[2]))
+    exact = exact_quantities(stream)
+    bound = math.e * sum(exact.values()) / sketch.width
+
+    for item, quantity in exact.items():
+        assert quantity <= sketch.estimate(item) <= quantity + bound
+
+
+def test_hyperloglog_exact_until_buffer_overflows():
+    hll = HyperLogLog(12)
+    for i in range(hll.sparse_limit):
+        hll.add(f"ORD{i}")
+        hll.add(f"ORD{i}")
+    assert hll.registers is None and hll.count() == hll.sparse_limit
+
+    hll.add("ORD-extra")
+    assert not hll.values and len(hll.registers) == hll.m
+    exact = hll.sparse_limit + 1
+    assert abs(hll.count() - exact) / exact < 3 * 1.04 / math.sqrt(hll.m)
+
+
+def test_hyperloglog_merges_sparse_and_dense(stream):
+    sparse, dense = HyperLogLog(12), HyperLogLog(12)
+    for order, _, _ in stream[:50]:
+        sparse.add(order)
+    for order, _, _ in stream[50:]:
+        dense.add(order)
+    exact = len({order for order, _, _ in stream})
+    for merged_hll in (sparse.merge(dense), dense.merge(sparse)):
+        assert abs(merged_hll.count() - exact) / exact < 3 * 1.04 / math.sqrt(merged_hll.m)
+    assert sparse.merge(HyperLogLog(12)).count() == len({order for order, _, _ in stream[:50]})
+
+
+def test_batch_hash_matches_scalar_hash():
+    values = ["Cà Phê Đen", "ORD1", 0, 1, -1, 2 ** 40, None, ("a", 1)]
+    assert [int(h) for h in _hash64_array(values, len(values))] == [_hash64(value) for value in values]
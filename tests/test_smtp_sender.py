@@ -0,0 +1,175 @@
+import email
+import os
+import socket
+import time
+from email import policy
+
+import pytest
+
+aiosmtpd_controller = pytest.importorskip("aiosmtpd.controller")
+
+from utils.mail import smtp_sender
+from utils.mail.smtp_sender import CHUNK_BYTES, MailQueue, OutgoingMail, SMTPMailer
+
+
+class RecordingHandler:
+    """Lưu lại mọi email nhận được cùng địa chỉ kết nối (peer) đã gửi nó."""
+
+    def __init__(self):
+        self.received = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received.append((session.peer, envelope))
+        return "250 OK"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(handler, port):
+    controller = aiosmtpd_controller.Controller(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+    return controller
+
+
+@pytest.fixture
+def smtp_server():
+    handler = RecordingHandler()
+    port = free_port()
+    controller = start_server(handler, port)
+    yield handler, port
+    controller.stop()
+
+
+def make_mailer(port, **kwargs):
+    return SMTPMailer("127.0.0.1", port, use_starttls=False, timeout=5, **kwargs)
+
+
+def parse(envelope):
+    return email.message_from_bytes(envelope.content, policy=policy.default)
+
+
+def test_delivers_body_and_recipients(smtp_server):
+    handler, port = smtp_server
+    mailer = make_mailer(port)
+    mailer.send(OutgoingMail("bot@example.com", ["a@example.com", "b@example.com"], "Báo cáo", "Xin chào"))
+    mailer.close()
+
+    assert len(handler.received) == 1
+    _, envelope = handler.received[0]
+    assert envelope.mail_from == "bot@example.com"
+    assert envelope.rcpt_tos == ["a@example.com", "b@example.com"]
+    message = parse(envelope)
+    assert message.get_body(("plain",)).get_content().strip() == "Xin chào"
+
+
+def test_utf8_subject(smtp_server):
+    handler, port = smtp_server
+    subject = "Báo cáo doanh thu ngày 19/10 – Cà phê sữa đá"
+    mailer = make_mailer(port)
+    mailer.send(OutgoingMail("bot@example.com", ["a@example.com"], subject, "Nội dung"))
+    mailer.close()
+
+    message = parse(handler.received[0][1])
+    assert message["Subject"] == subject
+
+
+def test_streamed_attachment_round_trip(smtp_server, tmp_path):
+    handler, port = smtp_server
+    # Lớn hơn vài khối đọc và không chia hết cho độ dài một dòng base64
+    data = os.urandom(CHUNK_BYTES * 2 + 123)
+    path = tmp_path / "Báo cáo tháng 10.docx"
+    path.write_bytes(data)
+
+    mailer = make_mailer(port)
+    mailer.send(OutgoingMail("bot@example.com", ["a@example.com"], "Báo cáo", "Đính kèm", [str(path)]))
+    mailer.close()
+
+    attachments = list(parse(handler.received[0][1]).iter_attachments())
+    assert len(attachments) == 1
+    assert attachments[0].get_filename() == "Báo cáo tháng 10.docx"
+    assert attachments[0].get_content() == data
+
+
+def test_reuses_one_connection(smtp_server):
+    handler, port = smtp_server
+    mailer = make_mailer(port)
+    for i in range(3):
+        mailer.send(OutgoingMail("bot@example.com", ["a@example.com"], f"Email {i}", "..."))
+    mailer.close()
+
+    assert len(handler.received) == 3
+    assert len({peer for peer, _ in handler.received}) == 1
+
+
+def test_reconnects_after_dropped_connection():
+    handler = RecordingHandler()
+    port = free_port()
+    controller = start_server(handler, port)
+    mailer = make_mailer(port)
+    try:
+        mailer.send(OutgoingMail("bot@example.com", ["a@example.com"], "Trước", "..."))
+        # Server khởi động lại: kết nối đang giữ bị đóng từ phía server
+        controller.stop()
+        controller = start_server(handler, port)
+        mailer.send(OutgoingMail("bot@example.com", ["a@example.com"], "Sau", "..."))
+    finally:
+        mailer.close()
+        controller.stop()
+
+    assert [parse(envelope)["Subject"] for _, envelope in handler.received] == ["Trước", "Sau"]
+    assert len({peer for peer, _ in handler.received}) == 2
+
+
+def test_queue_reports_send_result(smtp_server):
+    handler, port = smtp_server
+    mail_queue = MailQueue(make_mailer(port))
+    future = mail_queue.submit(OutgoingMail("bot@example.com", ["a@example.com"], "Hàng đợi", "..."))
+    assert future.result(timeout=10) is True
+    mail_queue.close()
+
+    failing = MailQueue(make_mailer(free_port(), retries=0))
+    future = failing.submit(OutgoingMail("bot@example.com", ["a@example.com"], "Lỗi", "..."))
+    with pytest.raises(OSError):
+        future.result(timeout=10)
+    failing.close()
+
+
+def test_missing_attachment_fails_before_mail_from(smtp_server, tmp_path):
+    handler, port = smtp_server
+    mailer = make_mailer(port)
+    with pytest.raises(FileNotFoundError):
+        mailer.send(OutgoingMail("bot@example.com", ["a@example.com"], "Lỗi", "...", [str(tmp_path / "thiếu.docx")]))
+    started = time.monotonic()
+    mailer.send(OutgoingMail("bot@example.com", ["a@example.com"], "Sau", "..."))
+    assert time.monotonic() - started < 2
+    mailer.close()
+
+    assert [parse(envelope)["Subject"] for _, envelope in handler.received] == ["Sau"]
+
+
+def test_error_during_data_drops_connection(smtp_server, tmp_path, monkeypatch):
+    handler, port = smtp_server
+    path = tmp_path / "report.docx"
+    path.write_bytes(os.urandom(CHUNK_BYTES * 2))
+
+    def failing_chunks(mail, files):
+        yield b"Subject: partial\r\n\r\n"
+        raise PermissionError("không đọc được file")
+
+    mailer = make_mailer(port)
+    monkeypatch.setattr(smtp_sender, "iter_message_chunks", failing_chunks)
+    with pytest.raises(PermissionError):
+        mailer.send(OutgoingMail("bot@example.com", ["a@example.com"], "Lỗi", "...", [str(path)]))
+    monkeypatch.undo()
+
+    # Email kế tiếp đi qua kết nối mới ngay, không phải chờ hết timeout của kết nối kẹt giữa DATA
+    started = time.monotonic()
+    mailer.send(OutgoingMail("bot@example.com", ["a@example.com"], "Sau", "..."))
+    assert time.monotonic() - started < 2
+    mailer.close()
+
+    assert [parse(envelope)["Subject"] for _, envelope in handler.received] == ["Sau"]
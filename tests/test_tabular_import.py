@@ -0,0 +1,74 @@
+import pandas as pd
+import pytest
+
+from utils.importers.tabular import iter_invoice_batches, iter_invoices, parse_datetime, parse_number
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('150.000', 150000),
+    ('1.250.000', 1250000),
+    ('150,000', 150000),
+    ('1,250,000.5', 1250000.5),
+    ('1.250,5', 1250.5),
+    ('12.345.678,25', 12345678.25),
+    ('2,5', 2.5),
+    ('0,75', 0.75),
+    ('150000đ', 150000),
+    (' 1 250 000 VND', 1250000),
+    ('45.000 ₫', 45000),
+    ('-1.500', -1500),
+    (3.0, 3.0),
+    ('', None),
+    (None, None),
+])
+def test_parse_number(text, expected):
+    assert parse_number(text) == expected
+
+
+def test_parse_number_rejects_text():
+    with pytest.raises(ValueError):
+        parse_number('miễn phí')
+
+
+@pytest.mark.parametrize('value, time_value, expected', [
+    ('05/03/2025 14:30', None, '2025-03-05 14:30'),
+    ('05/03/2025', '09:15', '2025-03-05 09:15'),
+    ('13-03-2025 08:00:00', None, '2025-03-13 08:00'),
+    ('2025-03-05 14:30:00', None, '2025-03-05 14:30'),
+    (pd.Timestamp('2025-03-05').to_pydatetime(), '18:45:10', '2025-03-05 18:45:10'),
+])
+def test_parse_datetime_day_first(value, time_value, expected):
+    assert parse_datetime(value, time_value) == pd.Timestamp(expected)
+
+
+def test_csv_export_with_vietnamese_formats(tmp_path):
+    path = tmp_path / 'export.csv'
+    path.write_text(
+        'Mã hóa đơn;Ngày;Giờ;Tên hàng;SL;Đơn giá;Thành tiền;Tổng tiền\n'
+        'HD001;05/03/2025;07:30;Cà phê sữa đá;2;25.000;50.000;80.000\n'
+        'HD001;05/03/2025;07:30;Bánh mì;1;30.000;30.000;80.000\n'
+        'HD002;06/03/2025;12:10;Trà đào;1,5;20.000;30.000;1.030,5\n'
+        'HD003;xx;;Phở;1;50.000;50.000;50.000\n',
+        encoding='utf-8')
+
+    invoices = list(iter_invoices(str(path)))
+    assert [invoice['id_hoa_don'] for invoice in invoices] == ['HD001', 'HD002']
+    first, second = invoices
+    assert first['datetime'] == '2025-03-05 07:30:00'
+    assert [item['ten_hang'] for item in first['chi_tiet']] == ['Cà phê sữa đá', 'Bánh mì']
+    assert first['chi_tiet'][0]['don_gia'] == 25000 and first['tong_tien_hoa_don'] == 80000
+    assert second['datetime'] == '2025-03-06 12:10:00'
+    assert second['chi_tiet'][0]['so_luong'] == 1.5
+    assert second['tong_tien_hoa_don'] == 1030.5
+
+
+def test_batches_cover_every_invoice(tmp_path):
+    path = tmp_path / 'export.csv'
+    rows = ['ma_hoa_don,ngay,ten_hang,so_luong,don_gia']
+    rows += [f'HD{i},0{1 + i % 9}/03/2025 10:00,Món {i % 3},1,"15,000"' for i in range(25)]
+    path.write_text('\n'.join(rows) + '\n', encoding='utf-8')
+
+    batches = list(iter_invoice_batches(str(path), batch_size=10))
+    assert [len(batch) for batch in batches] == [10, 10, 5]
+    assert batches[0]['datetime'].iloc[1] == pd.Timestamp('2025-03-02 10:00')
+    assert batches[0]['tong_tien_hoa_don'].iloc[0] == 15000
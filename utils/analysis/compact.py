@@ -0,0 +1,28 @@
+"""
+Bố cục DataFrame gọn cho bảng hóa đơn và bảng chi tiết:
+- tên sản phẩm, nhóm, loại là categorical (mỗi dòng chỉ giữ mã số nguyên, chuỗi lưu một lần);
+- cột số nguyên được thu về kiểu nhỏ nhất đủ chứa (so_luong thường là int8, thanh_tien int32).
+Cột số thực giữ nguyên float64 để tổng doanh thu không mất chính xác.
+"""
+import pandas as pd
+
+CATEGORY_COLUMNS = ('ten_hang', 'nhom', 'loai')
+INTEGER_COLUMNS = ('so_luong', 'don_gia', 'thanh_tien', 'tong_tien_hoa_don')
+
+
+def _downcast(series: pd.Series) -> pd.Series:
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return pd.to_numeric(series, downcast='integer')
+    return series
+
+
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Chuyển tại chỗ các cột chuỗi lặp lại sang categorical và thu nhỏ cột số nguyên; trả về chính df."""
+    for column in CATEGORY_COLUMNS:
+        if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype('category')
+    for column in INTEGER_COLUMNS:
+        if column in df.columns:
+            df[column] = _downcast(df[column])
+    return df
+
@@ -0,0 +1,93 @@
+import pandas as pd
+from typing import Any, Dict, List, Optional
+
+CUBE_KEYS = ['nhom', 'loai', 'ten_hang', 'day']
+
+
+class ProductCube:
+    """
+    Khối tổng hợp số lượng và doanh thu theo (nhom, loai, ten_hang, day), dựng bằng một lần groupby.
+    Các truy vấn phân cấp sản phẩm, phân bố theo loại và top-N chỉ gộp lại các ô của khối
+    (số ô nhỏ hơn rất nhiều so với số dòng chi tiết) cho bất kỳ khoảng ngày và N nào.
+    """
+
+    def __init__(self, cells: pd.DataFrame):
+        self.cells = cells
+
+    @classmethod
+    def from_items(cls, items_df: pd.DataFrame) -> 'ProductCube':
+        """Dựng khối từ bảng chi tiết đã làm phẳng (cần các cột trong CUBE_KEYS trừ 'day', cùng 'datetime')."""
+        items = items_df[['nhom', 'loai', 'ten_hang', 'so_luong', 'thanh_tien']].assign(
+            day=items_df['datetime'].dt.normalize()
+        )
+        # dropna=False để tổng của cấp trên vẫn tính cả các dòng thiếu loai/ten_hang như trước;
+        # observed=True để khóa categorical chỉ sinh các tổ hợp có thật
+        cells = items.groupby(CUBE_KEYS, dropna=False, observed=True)[['so_luong', 'thanh_tien']].sum().reset_index()
+        # Khối đã nhỏ: trả khóa về kiểu chuỗi thường để gộp/lọc các khối không phụ thuộc tập categories
+        for column in CUBE_KEYS:
+            if isinstance(cells[column].dtype, pd.CategoricalDtype):
+                cells[column] = cells[column].astype(cells[column].cat.categories.dtype)
+        return cls(cells)
+
+    @classmethod
+    def combine(cls, cubes: List['ProductCube']) -> 'ProductCube':
+        """Khối cộng dồn các ô của nhiều khối (ví dụ của từng cửa hàng) bằng một lần groupby."""
+        cells = pd.concat([cube.cells for cube in cubes], ignore_index=True)
+        cells = cells.groupby(CUBE_KEYS, dropna=False)[['so_luong', 'thanh_tien']].sum().reset_index()
+        return cls(cells)
+
+    def merge(self, other: 'ProductCube') -> 'ProductCube':
+        """Khối mới cộng dồn các ô của hai khối (dùng khi nạp thêm hóa đơn)."""
+        return ProductCube.combine([self, other])
+
+    def _slice(self, start: Optional[Any] = None, end: Optional[Any] = None) -> pd.DataFrame:
+        """Lọc các ô trong khoảng ngày [start, end] (tính cả hai đầu)."""
+        cells = self.cells
+        if start is None and end is None:
+            return cells
+        mask = pd.Series(True, index=cells.index)
+        if start is not None:
+            mask &= cells['day'] >= pd.Timestamp(start).normalize()
+        if end is not None:
+            mask &= cells['day'] <= pd.Timestamp(end).normalize()
+        return cells[mask]
+
+    def product_summary(self, start: Optional[Any] = None, end: Optional[Any] = None) -> pd.DataFrame:
+        """Tổng số lượng và doanh thu của từng sản phẩm, sắp xếp giảm dần theo doanh thu."""
+        summary = self._slice(start, end).groupby('ten_hang').agg(
+            total_quantity=('so_luong', 'sum'),
+            total_revenue=('thanh_tien', 'sum')
+        ).reset_index().sort_values(by='total_revenue', ascending=False)
+        summary['total_quantity'] = summary['total_quantity'].astype(int)
+        summary['total_revenue'] = summary['total_revenue'].astype(int)
+        return summary
+
+    def item_distribution(self, start: Optional[Any] = None, end: Optional[Any] = None) -> pd.Series:
+        """Doanh thu theo loại sản phẩm."""
+        return self._slice(start, end).groupby('loai')['thanh_tien'].sum()
+
+    def top_products(self, top: int = 5, start: Optional[Any] = None, end: Optional[Any] = None) -> pd.DataFrame:
+        """
+        Top-N sản phẩm theo doanh thu trong từng (nhom, loai).
+        Khi bằng doanh thu, giữ thứ tự tên sản phẩm như nlargest(keep='first').
+        """
+        by_product = self._slice(start, end).groupby(['nhom', 'loai', 'ten_hang'])['thanh_tien'].sum().reset_index()
+        by_product = by_product.sort_values(
+            ['nhom', 'loai', 'thanh_tien', 'ten_hang'], ascending=[True, True, False, True], kind='stable'
+        )
+        return by_product.groupby(['nhom', 'loai'], sort=False).head(top)
+
+    def hierarchy(self, top: int = 5, start: Optional[Any] = None, end: Optional[Any] = None) -> Dict[str, Any]:
+        """Cây nhom → loai → top sản phẩm, cùng định dạng với 'product_hierarchy' của analyze_data."""
+        cells = self._slice(start, end)
+        product_hierarchy = {}
+        for nhom_name, total in cells.groupby('nhom')['thanh_tien'].sum().items():
+            product_hierarchy[nhom_name] = {'total_revenue': int(total), 'categories': {}}
+        for (nhom_name, loai_name), total in cells.groupby(['nhom', 'loai'])['thanh_tien'].sum().items():
+            product_hierarchy[nhom_name]['categories'][loai_name] = {
+                'total_revenue': int(total),
+                'top_products': {}
+            }
+        for row in self.top_products(top, start, end).itertuples(index=False):
+            product_hierarchy[row.nhom]['categories'][row.loai]['top_products'][row.ten_hang] = int(row.thanh_tien)
+        return product_hierarchy
@@ -0,0 +1,89 @@
+import bisect
+import unicodedata
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+SORT_FIELDS = ('total_revenue', 'total_quantity', 'ten_hang')
+DEFAULT_SORT = '-total_revenue'
+SORT_OPTIONS = SORT_FIELDS + tuple('-' + field for field in SORT_FIELDS)
+
+
+def normalize_text(text: Any) -> str:
+    """Chữ thường, bỏ dấu tiếng Việt để 'ca phe' khớp với 'Cà Phê'."""
+    text = unicodedata.normalize('NFD', str(text or '').lower())
+    text = ''.join(ch for ch in text if unicodedata.category(ch) != 'Mn')
+    return text.replace('đ', 'd')
+
+
+def _trigrams(text: str):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class ProductIndex:
+    """
+    Chỉ mục trên danh sách product_analysis để phân trang, sắp xếp và tìm kiếm phía server.
+    - Mỗi kiểu sắp xếp có sẵn một mảng thứ tự (argsort) được tính một lần.
+    - Tìm kiếm: truy vấn ngắn (< 3 ký tự) dùng tiền tố của từng từ trong tên (bisect trên danh sách đã sắp xếp),
+      truy vấn dài hơn dùng chỉ mục trigram rồi kiểm tra lại chuỗi con.
+    """
+
+    def __init__(self, records: List[Dict[str, Any]]):
+        self.records = records
+        self.names = [normalize_text(r.get('ten_hang')) for r in records]
+
+        self._orders: Dict[str, np.ndarray] = {}
+        for field in SORT_FIELDS:
+            values = [r.get(field) for r in records]
+            if field == 'ten_hang':
+                ascending = np.array(sorted(range(len(records)), key=lambda i: self.names[i]), dtype=np.int64)
+            else:
+                ascending = np.argsort(np.array(values, dtype=np.float64), kind='stable')
+            self._orders[field] = ascending
+            self._orders['-' + field] = ascending[::-1].copy()
+        # Giữ nguyên thứ tự gốc (doanh thu giảm dần, như analyze_data) cho sắp xếp mặc định
+        self._orders[DEFAULT_SORT] = np.arange(len(records), dtype=np.int64)
+
+        words = sorted((word, i) for i, name in enumerate(self.names) for word in name.split())
+        self._word_keys = [word for word, _ in words]
+        self._word_ids = [i for _, i in words]
+
+        trigram_ids: Dict[str, set] = {}
+        for i, name in enumerate(self.names):
+            for gram in _trigrams(name):
+                trigram_ids.setdefault(gram, set()).add(i)
+        self._trigrams = {gram: np.fromiter(sorted(ids), dtype=np.int64) for gram, ids in trigram_ids.items()}
+
+    def _search(self, query: str) -> Optional[np.ndarray]:
+        """Id các sản phẩm khớp truy vấn; None nghĩa là không lọc."""
+        query = normalize_text(query).strip()
+        if not query:
+            return None
+        if len(query) < 3:
+            lo = bisect.bisect_left(self._word_keys, query)
+            hi = bisect.bisect_left(self._word_keys, query + '\uffff')
+            return np.unique(np.array(self._word_ids[lo:hi], dtype=np.int64))
+        candidates = None
+        for gram in _trigrams(query):
+            ids = self._trigrams.get(gram)
+            if ids is None:
+                return np.empty(0, dtype=np.int64)
+            candidates = ids if candidates is None else np.intersect1d(candidates, ids, assume_unique=True)
+        return np.array([i for i in candidates if query in self.names[i]], dtype=np.int64)
+
+    def query(self, limit: Optional[int] = None, offset: int = 0, sort: str = DEFAULT_SORT,
+              q: Optional[str] = None) -> Dict[str, Any]:
+        if sort not in SORT_OPTIONS:
+            raise ValueError(f"sort phải là một trong: {', '.join(SORT_OPTIONS)}")
+        order = self._orders[sort]
+        matches = self._search(q) if q else None
+        if matches is not None:
+            order = order[np.isin(order, matches, assume_unique=True)]
+        end = len(order) if limit is None else offset + limit
+        return {
+            'total': int(len(order)),
+            'offset': offset,
+            'limit': limit,
+            'sort': sort,
+            'items': [self.records[i] for i in order[offset:end]],
+        }
@@ -0,0 +1,135 @@
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from analyse import AnalysisSections, flatten_items
+from utils.analysis.product_cube import ProductCube
+from utils.analysis.time_buckets import TimeBucketIndex
+from utils.importers.tabular import BATCH_INVOICES, TABULAR_EXTENSIONS, ImportStats, iter_invoice_batches
+
+# Mỗi cửa hàng/chi nhánh là một tệp <mã cửa hàng>.json (hoặc tệp xuất POS .xlsx/.xls/.csv) trong thư mục này
+STORES_DIR = os.getenv('STORES_DIR', 'stores')
+
+
+def find_store_paths(stores_dir: str = STORES_DIR) -> Dict[str, str]:
+    """{mã cửa hàng: đường dẫn tệp hóa đơn}, sắp xếp theo mã."""
+    paths = sorted(path for extension in ('.json',) + TABULAR_EXTENSIONS
+                   for path in glob.glob(os.path.join(stores_dir, f'*{extension}')))
+    return {os.path.splitext(os.path.basename(path))[0]: path for path in paths}
+
+
+class ShardPartial:
+    """
+    Kết quả tổng hợp từng phần của một tập hóa đơn (một cửa hàng), có thể cộng dồn:
+    TimeBucketIndex (doanh thu/số hóa đơn theo ngày-giờ), ProductCube và hai tổng đếm.
+    Mọi mục phân tích của cửa hàng hay cả chuỗi đều suy ra được từ đây mà không đọc lại dữ liệu thô.
+    """
+
+    def __init__(self, time_index: TimeBucketIndex, product_cube: ProductCube,
+                 total_invoices: int, total_revenue: float):
+        self.time_index = time_index
+        self.product_cube = product_cube
+        self.total_invoices = total_invoices
+        self.total_revenue = total_revenue
+
+    @classmethod
+    def from_invoices(cls, invoices_df: pd.DataFrame) -> 'ShardPartial':
+        return cls(
+            TimeBucketIndex.from_invoices(invoices_df),
+            ProductCube.from_items(flatten_items(invoices_df)),
+            int(len(invoices_df)),
+            float(invoices_df['tong_tien_hoa_don'].sum()) if len(invoices_df) else 0.0,
+        )
+
+    @classmethod
+    def combine(cls, partials: List['ShardPartial']) -> 'ShardPartial':
+        time_index = partials[0].time_index
+        for partial in partials[1:]:
+            time_index = time_index.merge(partial.time_index)
+        return cls(
+            time_index,
+            ProductCube.combine([partial.product_cube for partial in partials]),
+            sum(partial.total_invoices for partial in partials),
+            sum(partial.total_revenue for partial in partials),
+        )
+
+
+def _empty_invoices() -> pd.DataFrame:
+    return pd.DataFrame({'datetime': pd.to_datetime([]), 'chi_tiet': [], 'tong_tien_hoa_don': []})
+
+
+def load_tabular_shard(path: str, batch_size: int = BATCH_INVOICES) -> ShardPartial:
+    """
+    Tổng hợp tệp xuất POS (.xlsx/.xls/.csv) theo từng lô batch_size hóa đơn: mỗi lô được cộng dồn
+    vào ShardPartial rồi bỏ đi, nên bộ nhớ chỉ phụ thuộc kích thước lô và các bảng tổng hợp.
+    """
+    stats = ImportStats()
+    partial = None
+    for batch in iter_invoice_batches(path, batch_size, stats):
+        batch_partial = ShardPartial.from_invoices(batch)
+        partial = batch_partial if partial is None else ShardPartial.combine([partial, batch_partial])
+    if partial is None:
+        partial = ShardPartial.from_invoices(_empty_invoices())
+    print(f"Đã nhập {stats.invoices:,} hóa đơn ({stats.rows:,} dòng) từ {path}")
+    if stats.skipped_invoices:
+        print(f"⚠️ Bỏ qua {stats.skipped_invoices:,} hóa đơn không hợp lệ, ví dụ: {'; '.join(stats.errors[:3])}")
+    return partial
+
+
+def load_shard(path: str) -> ShardPartial:
+    """Đọc tệp hóa đơn của một cửa hàng và tổng hợp (chạy trong tiến trình con)."""
+    if path.lower().endswith(TABULAR_EXTENSIONS):
+        return load_tabular_shard(path)
+    invoices_df = pd.read_json(path)
+    if invoices_df.empty:
+        invoices_df = _empty_invoices()
+    invoices_df['datetime'] = pd.to_datetime(invoices_df['datetime'])
+    return ShardPartial.from_invoices(invoices_df)
+
+
+class PartialAnalysis(AnalysisSections):
+    """
+    AnalysisSections dựng từ một ShardPartial thay vì bảng hóa đơn (chỉ đọc).
+    Với cả chuỗi, stores chứa PartialAnalysis của từng cửa hàng.
+    """
+
+    def __init__(self, partial: ShardPartial, stores: Optional[Dict[str, 'PartialAnalysis']] = None):
+        super().__init__(None, product_cube=partial.product_cube, time_index=partial.time_index)
+        self.partial = partial
+        self.stores = stores or {}
+        self._empty = partial.total_invoices == 0
+
+    def invoice_count(self):
+        return self.partial.total_invoices
+
+    def apply_batch(self, batch_df):
+        """Cộng một lô hóa đơn mới vào phần tổng hợp (chỉ dùng cho một cửa hàng, không phải cả chuỗi)."""
+        if batch_df.empty:
+            return
+        with self._lock:
+            self.partial = ShardPartial.combine([self.partial, ShardPartial.from_invoices(batch_df)])
+            self._product_cube, self._time_index = self.partial.product_cube, self.partial.time_index
+            self._sections = {}
+            self._product_index = None
+            self._empty = False
+
+    def _compute_overall_metrics(self):
+        return {
+            "total_invoices": int(self.partial.total_invoices),
+            "total_revenue": int(self.partial.total_revenue),
+            "current_month_revenue": self.time_index.month_to_date_revenue()
+        }
+
+
+def analyze_stores(store_paths: Dict[str, str], max_workers: Optional[int] = None) -> PartialAnalysis:
+    """
+    Tổng hợp song song từng cửa hàng trong một process pool (map), rồi cộng dồn các phần
+    thành số liệu cả chuỗi (reduce). Trả về phân tích cả chuỗi, phân tích từng cửa hàng nằm trong .stores.
+    """
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        partials = dict(zip(store_paths, pool.map(load_shard, store_paths.values())))
+    stores = {store_id: PartialAnalysis(partial) for store_id, partial in partials.items()}
+    return PartialAnalysis(ShardPartial.combine(list(partials.values())), stores=stores)
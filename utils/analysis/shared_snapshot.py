@@ -0,0 +1,185 @@
+import json
+import struct
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from analyse import AnalysisSections
+from utils.analysis.product_cube import ProductCube
+from utils.analysis.time_buckets import TimeBucketIndex
+from utils.api.response_cache import CachedPayload, dumps
+
+# Tên shared memory được truyền cho các worker qua biến môi trường này
+SNAPSHOT_ENV = 'ANALYSIS_SNAPSHOT_SHM'
+# Số sản phẩm đầu của product_analysis được lưu riêng (luồng SSE, số liệu cho LLM) để không phải parse cả danh sách
+HEAD_PRODUCTS = 50
+
+_HEADER = struct.Struct('<Q')
+_ALIGN = 64
+
+
+def _align(offset: int) -> int:
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _store_prefix(store_id: str) -> str:
+    return f"stores/{store_id}/"
+
+
+def _analysis_blobs(analysis: AnalysisSections, prefix: str, blobs: Dict[str, bytes]) -> Dict[str, Any]:
+    """
+    Thêm các khối của một phân tích vào blobs (tên có tiền tố prefix) và trả về mô tả của nó:
+    mỗi mục đã tuần tự hóa giống hệt ResponseCache (cùng bytes, cùng ETag) kèm các bản nén sẵn,
+    ProductCube (Arrow IPC) và hai mảng của TimeBucketIndex.
+    """
+    if not analysis:
+        return {'empty': True}
+    etags = {}
+    for key in AnalysisSections.SECTIONS:
+        payload = CachedPayload(dumps(analysis[key]))
+        etags[key] = payload.etags
+        for encoding, body in payload.bodies.items():
+            blobs[f"{prefix}{key}.{encoding}"] = body
+    blobs[f"{prefix}head"] = dumps(analysis['product_analysis'][:HEAD_PRODUCTS])
+
+    sink = pa.BufferOutputStream()
+    table = pa.Table.from_pandas(analysis.product_cube.cells, preserve_index=False)
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    blobs[f"{prefix}cube"] = sink.getvalue().to_pybytes()
+
+    time_index = analysis.time_index
+    blobs[f"{prefix}revenue"] = np.ascontiguousarray(time_index.revenue).tobytes()
+    blobs[f"{prefix}counts"] = np.ascontiguousarray(time_index.counts).tobytes()
+    return {
+        'empty': False,
+        'etags': etags,
+        'origin': time_index.origin.isoformat(),
+        'shape': list(time_index.revenue.shape),
+        'revenue_dtype': time_index.revenue.dtype.str,
+        'counts_dtype': time_index.counts.dtype.str,
+    }
+
+
+def publish_snapshot(analysis: AnalysisSections) -> shared_memory.SharedMemory:
+    """
+    Ghi snapshot phân tích vào một vùng shared memory:
+    [độ dài manifest][manifest JSON][các khối dữ liệu căn lề 64 byte].
+    Gồm phân tích cả chuỗi và phân tích từng cửa hàng (analysis.stores) nếu có.
+    Tiến trình tạo ra vùng nhớ chịu trách nhiệm close() và unlink() khi dừng.
+    """
+    blobs: Dict[str, bytes] = {}
+    manifest = {
+        'analysis': _analysis_blobs(analysis, '', blobs),
+        'stores': {store_id: _analysis_blobs(store, _store_prefix(store_id), blobs)
+                   for store_id, store in getattr(analysis, 'stores', {}).items()},
+        'blobs': {},
+    }
+    # Manifest chứa vị trí các khối nên phải tính trước kích thước của chính nó
+    offset = 0
+    for name, blob in blobs.items():
+        manifest['blobs'][name] = [offset, len(blob)]
+        offset = _align(offset + len(blob))
+    manifest_bytes = json.dumps(manifest).encode('utf-8')
+    data_start = _align(_HEADER.size + len(manifest_bytes))
+
+    shm = shared_memory.SharedMemory(create=True, size=max(data_start + offset, 1))
+    _HEADER.pack_into(shm.buf, 0, len(manifest_bytes))
+    shm.buf[_HEADER.size:_HEADER.size + len(manifest_bytes)] = manifest_bytes
+    for name, blob in blobs.items():
+        start = data_start + manifest['blobs'][name][0]
+        shm.buf[start:start + len(blob)] = blob
+    return shm
+
+
+def _open_untracked(name: str) -> shared_memory.SharedMemory:
+    """Mở vùng nhớ có sẵn mà không đăng ký với resource_tracker, để worker thoát không xóa vùng nhớ của master."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args, **kwargs: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+class SharedAnalysis(AnalysisSections):
+    """
+    AnalysisSections chỉ đọc trên một phân tích trong snapshot dùng chung. Các mục nằm trong shared
+    memory dưới dạng JSON đã tuần tự hóa và nén sẵn: endpoint trả nguyên một mục gửi thẳng các bytes
+    đó qua shared_payload(); mục chỉ được parse (và ghi nhớ trong worker) khi cần đọc nội dung.
+    ProductCube cũng chỉ được dựng ở lần dùng đầu tiên.
+    """
+
+    def __init__(self, blob: Callable[[str], memoryview], prefix: str, meta: Dict[str, Any],
+                 stores: Dict[str, 'SharedAnalysis'] = None):
+        time_index = None
+        if not meta['empty']:
+            time_index = TimeBucketIndex(
+                pd.Timestamp(meta['origin']),
+                self._array(blob(f"{prefix}revenue"), meta['revenue_dtype'], meta['shape']),
+                self._array(blob(f"{prefix}counts"), meta['counts_dtype'], meta['shape']),
+            )
+        super().__init__(None, time_index=time_index)
+        self._blob = lambda name: blob(prefix + name)
+        self._meta = meta
+        self._empty = meta['empty']
+        self.stores = stores or {}
+
+    @staticmethod
+    def _array(buffer: memoryview, dtype: str, shape: List[int]) -> np.ndarray:
+        values = np.frombuffer(buffer, dtype=np.dtype(dtype)).reshape(shape)
+        values.flags.writeable = False
+        return values
+
+    def __getitem__(self, key):
+        if self._empty or key not in self.SECTIONS:
+            raise KeyError(key)
+        with self._lock:
+            if key not in self._sections:
+                self._sections[key] = json.loads(bytes(self._blob(f"{key}.identity")))
+            return self._sections[key]
+
+    @property
+    def product_cube(self):
+        with self._lock:
+            if self._product_cube is None:
+                table = pa.ipc.open_stream(pa.py_buffer(self._blob('cube'))).read_all()
+                self._product_cube = ProductCube(table.to_pandas())
+            return self._product_cube
+
+    def top_products(self, n: int):
+        if n <= HEAD_PRODUCTS and not self._empty and 'product_analysis' not in self._sections:
+            return json.loads(bytes(self._blob('head')))[:n]
+        return super().top_products(n)
+
+    def shared_payload(self, key: str) -> CachedPayload:
+        """Payload của một mục với các body là memoryview trỏ thẳng vào shared memory."""
+        etags = self._meta['etags'][key]
+        return CachedPayload.from_parts({encoding: self._blob(f"{key}.{encoding}") for encoding in etags}, etags)
+
+
+def attach_snapshot(name: str) -> Tuple[AnalysisSections, shared_memory.SharedMemory]:
+    """
+    Gắn vào snapshot do publish_snapshot tạo. Các mục đã tuần tự hóa và các mảng theo (ngày, giờ)
+    đều được đọc thẳng từ shared memory, nên bộ nhớ không tăng theo số worker.
+    Giữ lại đối tượng SharedMemory trả về chừng nào còn dùng phân tích.
+    """
+    shm = _open_untracked(name)
+
+    (manifest_len,) = _HEADER.unpack_from(shm.buf, 0)
+    manifest = json.loads(bytes(shm.buf[_HEADER.size:_HEADER.size + manifest_len]))
+    data_start = _align(_HEADER.size + manifest_len)
+
+    def blob(key):
+        start, length = manifest['blobs'][key]
+        return shm.buf[data_start + start:data_start + start + length]
+
+    stores = {store_id: SharedAnalysis(blob, _store_prefix(store_id), meta)
+              for store_id, meta in manifest['stores'].items()}
+    return SharedAnalysis(blob, '', manifest['analysis'], stores=stores), shm
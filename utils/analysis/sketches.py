@@ -0,0 +1,194 @@
+"""
+Sketch xác suất có bộ nhớ cố định, cộng dồn được giữa các khối dữ liệu và các cửa hàng.
+
+- HyperLogLog(p): đếm số phần tử phân biệt với m = 2**p thanh ghi 1 byte.
+  Sai số tương đối chuẩn ≈ 1.04 / sqrt(m): p=12 (4 KB) ≈ 1.6%, p=10 (1 KB) ≈ 3.3%.
+  Phần tử mới được gom trong một set tối đa sparse_limit (mặc định m/8) phần tử rồi mới băm vào
+  thanh ghi: khi chưa vượt ngưỡng lần nào thì đếm chính xác và chưa cấp phát thanh ghi.
+  Với số lượng nhỏ (< 2.5m) dùng linear counting nên vẫn gần như chính xác.
+- SpaceSaving(k): top-k theo trọng số (số lượng, doanh thu) với k bộ đếm.
+  Với tổng trọng số W: mọi phần tử có trọng số thật > W/k chắc chắn có mặt, và
+  true <= count <= true + error với error <= W/k. Chỉ nhận trọng số dương.
+- CountMinSketch(width, depth): ước lượng trọng số của một phần tử bất kỳ;
+  true <= estimate <= true + e*W/width với xác suất >= 1 - exp(-depth).
+
+Hàm băm dựa trên hash() của Python (str được băm ngẫu nhiên theo tiến trình), nên chỉ gộp các sketch
+dựng trong cùng một tiến trình. So sánh với kết quả chính xác: tests/test_sketches.py.
+"""
+import math
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+_MASK64 = (1 << 64) - 1
+_GOLDEN, _MIX1, _MIX2 = 0x9E3779B97F4A7C15, 0xBF58476D1CE4E5B9, 0x94D049BB133111EB
+
+
+def _hash64(value: Any, seed: int = 0) -> int:
+    """hash() (được str lưu sẵn) trộn bằng bước cuối của splitmix64 để các bit phân bố đều."""
+    h = (hash(value) + seed * _GOLDEN) & _MASK64
+    h = ((h ^ (h >> 30)) * _MIX1) & _MASK64
+    h = ((h ^ (h >> 27)) * _MIX2) & _MASK64
+    return h ^ (h >> 31)
+
+
+def _hash64_array(values: Iterable[Any], count: int) -> np.ndarray:
+    """_hash64 của cả một lô phần tử (seed 0): hash() chạy trong map, phần trộn bit bằng numpy."""
+    h = np.fromiter(map(hash, values), dtype=np.int64, count=count).view(np.uint64)
+    with np.errstate(over='ignore'):
+        h = (h ^ (h >> np.uint64(30))) * np.uint64(_MIX1)
+        h = (h ^ (h >> np.uint64(27))) * np.uint64(_MIX2)
+    return h ^ (h >> np.uint64(31))
+
+
+class HyperLogLog:
+    """Đếm số phần tử phân biệt (đơn hàng, sản phẩm) thay cho một set."""
+
+    def __init__(self, p: int = 12, sparse_limit: Optional[int] = None):
+        if not 4 <= p <= 16:
+            raise ValueError("p phải trong khoảng 4-16")
+        self.p = p
+        self.m = 1 << p
+        self.sparse_limit = self.m // 8 if sparse_limit is None else sparse_limit
+        # Các phần tử chưa được băm vào thanh ghi; registers là None khi chưa vượt ngưỡng lần nào
+        self.values: set = set()
+        self.registers: Optional[np.ndarray] = None
+
+    def add(self, value: Any):
+        # Thêm vào set rất rẻ và loại sẵn phần tử lặp lại (nhiều dòng của cùng một đơn); chỉ băm khi set đầy
+        values = self.values
+        values.add(value)
+        if len(values) > self.sparse_limit:
+            self._flush()
+
+    def _add_values(self, registers: np.ndarray, values: set):
+        if not values:
+            return
+        h = _hash64_array(values, len(values))
+        width = 64 - self.p
+        index = (h >> np.uint64(width)).astype(np.intp)
+        # Vị trí bit 1 đầu tiên của phần còn lại; frexp trả đúng bit_length vì giá trị < 2**53 đổi sang float không sai
+        _, bit_length = np.frexp((h & np.uint64((1 << width) - 1)).astype(np.float64))
+        np.maximum.at(registers, index, (width - bit_length + 1).astype(np.uint8))
+
+    def _flush(self):
+        if self.registers is None:
+            self.registers = np.zeros(self.m, dtype=np.uint8)
+        self._add_values(self.registers, self.values)
+        self.values.clear()
+
+    def _dense_registers(self) -> np.ndarray:
+        """Thanh ghi gồm cả các phần tử đang chờ, không làm thay đổi sketch."""
+        registers = np.zeros(self.m, dtype=np.uint8) if self.registers is None else self.registers.copy()
+        self._add_values(registers, self.values)
+        return registers
+
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        """Hợp của hai tập (cùng p)."""
+        if other.p != self.p:
+            raise ValueError("Chỉ gộp được HyperLogLog cùng p")
+        merged = HyperLogLog(self.p, self.sparse_limit)
+        if self.registers is None and other.registers is None:
+            merged.values = self.values | other.values
+            if len(merged.values) > merged.sparse_limit:
+                merged._flush()
+        else:
+            merged.registers = np.maximum(self._dense_registers(), other._dense_registers())
+        return merged
+
+    def count(self) -> int:
+        if self.registers is None:
+            return len(self.values)
+        self._flush()
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m) if m >= 128 else {16: 0.673, 32: 0.697, 64: 0.709}[m]
+        estimate = alpha * m * m / float(np.ldexp(1.0, -self.registers.astype(np.int32)).sum())
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def __len__(self) -> int:
+        return self.count()
+
+
+class SpaceSaving:
+    """Top-k phần tử nặng nhất của một luồng có trọng số, dùng k bộ đếm."""
+
+    def __init__(self, k: int = 64):
+        self.k = k
+        self.counters: Dict[Hashable, List[float]] = {}  # phần tử -> [count, error]
+        self.total = 0.0
+
+    def add(self, item: Hashable, weight: float = 1):
+        if weight <= 0:
+            return
+        self.total += weight
+        counter = self.counters.get(item)
+        if counter is not None:
+            counter[0] += weight
+        elif len(self.counters) < self.k:
+            self.counters[item] = [weight, 0]
+        else:
+            victim = min(self.counters, key=lambda key: self.counters[key][0])
+            floor = self.counters.pop(victim)[0]
+            self.counters[item] = [floor + weight, floor]
+
+    def _floor(self) -> float:
+        """Chặn trên của trọng số một phần tử không có trong sketch."""
+        if len(self.counters) < self.k:
+            return 0
+        return min(count for count, _ in self.counters.values())
+
+    def merge(self, other: 'SpaceSaving') -> 'SpaceSaving':
+        """Gộp hai sketch (ví dụ của hai khối dữ liệu); giữ nguyên cận sai số W/k."""
+        merged = SpaceSaving(max(self.k, other.k))
+        floor_self, floor_other = self._floor(), other._floor()
+        combined = {}
+        for item in set(self.counters) | set(other.counters):
+            count_a, error_a = self.counters.get(item, (floor_self, floor_self))
+            count_b, error_b = other.counters.get(item, (floor_other, floor_other))
+            combined[item] = [count_a + count_b, error_a + error_b]
+        top = sorted(combined.items(), key=lambda kv: kv[1][0], reverse=True)[:merged.k]
+        merged.counters = {item: counter for item, counter in top}
+        merged.total = self.total + other.total
+        return merged
+
+    def top(self, n: int) -> List[Tuple[Hashable, float, float]]:
+        """n phần tử nặng nhất: (phần tử, trọng số ước lượng, sai số tối đa)."""
+        ranked = sorted(self.counters.items(), key=lambda kv: kv[1][0], reverse=True)[:n]
+        return [(item, count, error) for item, (count, error) in ranked]
+
+
+class CountMinSketch:
+    """Ước lượng trọng số (doanh thu, số lượng, số dòng) của từng phần tử với bộ nhớ depth × width."""
+
+    def __init__(self, width: int = 2048, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self.table = [[0.0] * width for _ in range(depth)]
+        self.total = 0.0
+
+    def _columns(self, item: Hashable):
+        # Mỗi hàng một seed riêng; double hashing (h1 + i*h2) chỉ dùng vài bit thấp khi width là lũy thừa của 2,
+        # nên hai phần tử dễ trùng cột ở mọi hàng cùng lúc
+        return [_hash64(item, row) % self.width for row in range(self.depth)]
+
+    def add(self, item: Hashable, weight: float = 1):
+        if weight <= 0:
+            return
+        self.total += weight
+        for row, column in zip(self.table, self._columns(item)):
+            row[column] += weight
+
+    def estimate(self, item: Hashable) -> float:
+        return min(row[column] for row, column in zip(self.table, self._columns(item)))
+
+    def merge(self, other: 'CountMinSketch') -> 'CountMinSketch':
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Chỉ gộp được CountMinSketch cùng kích thước")
+        merged = CountMinSketch(self.width, self.depth)
+        merged.table = [[a + b for a, b in zip(row_a, row_b)] for row_a, row_b in zip(self.table, other.table)]
+        merged.total = self.total + other.total
+        return merged
+
@@ -0,0 +1,305 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from analyse import DAY_ORDER_VIETNAMESE, AnalysisSections
+from utils.analysis.product_cube import CUBE_KEYS, ProductCube
+from utils.analysis.time_buckets import HOURS_PER_DAY, TimeBucketIndex
+from utils.importers.tabular import TABULAR_EXTENSIONS, iter_invoice_batches
+
+# strftime('%w') của SQLite: 0 = Chủ Nhật
+SQLITE_WEEKDAYS = ['Chủ Nhật', 'Thứ Hai', 'Thứ Ba', 'Thứ Tư', 'Thứ Năm', 'Thứ Sáu', 'Thứ Bảy']
+INSERT_CHUNK = 10_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoices (
+    id INTEGER PRIMARY KEY,
+    id_hoa_don,
+    datetime TEXT,
+    tong_tien_hoa_don NUMERIC
+);
+CREATE TABLE IF NOT EXISTS items (
+    invoice_id INTEGER NOT NULL REFERENCES invoices(id),
+    datetime TEXT,
+    ten_hang TEXT,
+    so_luong NUMERIC,
+    don_gia NUMERIC,
+    thanh_tien NUMERIC,
+    nhom TEXT,
+    loai TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_invoices_datetime ON invoices(datetime);
+CREATE INDEX IF NOT EXISTS idx_items_datetime ON items(datetime);
+CREATE INDEX IF NOT EXISTS idx_items_ten_hang ON items(ten_hang);
+CREATE INDEX IF NOT EXISTS idx_items_nhom_loai ON items(nhom, loai);
+CREATE INDEX IF NOT EXISTS idx_items_loai ON items(loai);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _sql_datetime(value: Any) -> Optional[str]:
+    """Thời điểm dạng 'YYYY-MM-DD HH:MM:SS[.ffffff]' để so sánh chuỗi đúng thứ tự thời gian."""
+    if pd.isna(value):
+        return None
+    value = pd.Timestamp(value)
+    return value.isoformat(sep=' ', timespec='microseconds' if value.microsecond else 'seconds')
+
+
+def _sql_value(value: Any) -> Any:
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+
+class SQLiteEngine:
+    """
+    Lưu hóa đơn và từng dòng chi tiết trong một tệp SQLite (có chỉ mục theo datetime, ten_hang,
+    nhom, loai) và tính các bảng tổng hợp bằng truy vấn GROUP BY. Bộ nhớ chỉ phụ thuộc kích thước
+    kết quả tổng hợp (số ngày × 24 giờ, số ô sản phẩm × ngày) chứ không phụ thuộc số hóa đơn.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._lock = threading.Lock()
+
+    def close(self):
+        # Chờ truy vấn đang chạy (nếu có) xong rồi mới đóng
+        with self._lock:
+            self._conn.close()
+
+    def query(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def invoice_count(self) -> int:
+        return self.query("SELECT COUNT(*) FROM invoices")[0][0]
+
+    def meta(self, key: str) -> Optional[str]:
+        rows = self.query("SELECT value FROM meta WHERE key = ?", (key,))
+        return rows[0][0] if rows else None
+
+    def _set_meta(self, key: str, value: str):
+        self._conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
+
+    def insert_invoices(self, invoices_df: pd.DataFrame):
+        """Ghi thêm hóa đơn (cùng định dạng với load_and_prepare_data) và các dòng chi tiết."""
+        with self._lock, self._conn:
+            self._insert(invoices_df)
+            # Đã có lô nạp thêm sau lần nhập gần nhất, tức log đã được phát lại (xem replace_invoices)
+            self._set_meta('log_pending', '0')
+
+    def replace_invoices(self, batches: Iterable[pd.DataFrame], source: str):
+        """
+        Thay toàn bộ dữ liệu bằng các lô từ tệp nguồn trong một giao dịch (kết nối khác vẫn đọc dữ liệu cũ
+        cho tới khi xong) và ghi lại chữ ký của tệp nguồn. Các hóa đơn nạp qua API bị xóa theo, nên
+        log_pending được bật cho tới khi log được phát lại vào cơ sở dữ liệu.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM items")
+            self._conn.execute("DELETE FROM invoices")
+            for batch in batches:
+                self._insert(batch)
+            self._set_meta('source', source)
+            self._set_meta('log_pending', '1')
+
+    def _insert(self, invoices_df: pd.DataFrame):
+        details_column = invoices_df['chi_tiet'] if 'chi_tiet' in invoices_df.columns else [None] * len(invoices_df)
+        ids = invoices_df['id_hoa_don'] if 'id_hoa_don' in invoices_df.columns else [None] * len(invoices_df)
+        next_id = self._conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM invoices").fetchone()[0]
+        invoice_rows, item_rows = [], []
+        for invoice_id, id_hoa_don, invoice_datetime, total, details in zip(
+                range(next_id, next_id + len(invoices_df)), ids, invoices_df['datetime'],
+                invoices_df['tong_tien_hoa_don'], details_column):
+            sql_datetime = _sql_datetime(invoice_datetime)
+            invoice_rows.append((invoice_id, _sql_value(id_hoa_don), sql_datetime, _sql_value(total)))
+            # Điền giá trị mặc định giống flatten_items
+            for item in details if isinstance(details, list) else []:
+                item_rows.append((
+                    invoice_id, sql_datetime, item.get('ten_hang'),
+                    _sql_value(item.get('so_luong', 0)), _sql_value(item.get('don_gia')),
+                    _sql_value(item.get('thanh_tien', 0)),
+                    item.get('nhom', 'Không xác định'), item.get('loai', 'Chưa phân loại')
+                ))
+            if len(item_rows) >= INSERT_CHUNK:
+                self._write(invoice_rows, item_rows)
+                invoice_rows, item_rows = [], []
+        self._write(invoice_rows, item_rows)
+
+    def _write(self, invoice_rows: list, item_rows: list):
+        self._conn.executemany("INSERT INTO invoices VALUES (?, ?, ?, ?)", invoice_rows)
+        self._conn.executemany("INSERT INTO items VALUES (?, ?, ?, ?, ?, ?, ?, ?)", item_rows)
+
+    # --- Các bảng tổng hợp ---
+    def time_index(self) -> TimeBucketIndex:
+        rows = self.query(
+            "SELECT date(datetime) AS day, CAST(strftime('%H', datetime) AS INTEGER) AS hour,"
+            " TOTAL(tong_tien_hoa_don), COUNT(*)"
+            " FROM invoices WHERE datetime IS NOT NULL GROUP BY day, hour"
+        )
+        if not rows:
+            empty = np.zeros((0, HOURS_PER_DAY))
+            return TimeBucketIndex(pd.Timestamp.now().normalize(), empty, empty.astype(np.int64))
+        buckets = pd.DataFrame(rows, columns=['day', 'hour', 'revenue', 'count'])
+        days = pd.to_datetime(buckets['day'])
+        origin = days.min()
+        day_offsets = ((days - origin) // pd.Timedelta(days=1)).to_numpy(dtype=np.int64)
+        hours = buckets['hour'].to_numpy(dtype=np.int64)
+        revenue = np.zeros((int(day_offsets.max()) + 1, HOURS_PER_DAY))
+        counts = np.zeros(revenue.shape, dtype=np.int64)
+        revenue[day_offsets, hours] = buckets['revenue'].to_numpy(dtype=np.float64)
+        counts[day_offsets, hours] = buckets['count'].to_numpy(dtype=np.int64)
+        return TimeBucketIndex(origin, revenue, counts)
+
+    def product_cube(self) -> ProductCube:
+        rows = self.query(
+            "SELECT nhom, loai, ten_hang, date(datetime) AS day, TOTAL(so_luong), TOTAL(thanh_tien)"
+            " FROM items GROUP BY nhom, loai, ten_hang, day"
+        )
+        cells = pd.DataFrame(rows, columns=CUBE_KEYS + ['so_luong', 'thanh_tien'])
+        cells['day'] = pd.to_datetime(cells['day'])
+        # Gộp lại bằng pandas (đã nhỏ) để thứ tự và cách xử lý giá trị thiếu giống hệt ProductCube.from_items
+        cells = cells.groupby(CUBE_KEYS, dropna=False)[['so_luong', 'thanh_tien']].sum().reset_index()
+        return ProductCube(cells)
+
+    def overall_metrics(self) -> Dict[str, int]:
+        total_invoices, total_revenue, latest = self.query(
+            "SELECT COUNT(*), TOTAL(tong_tien_hoa_don), MAX(datetime) FROM invoices"
+        )[0]
+        current_month_revenue = 0
+        if latest is not None:
+            current_month_revenue = self.query(
+                "SELECT TOTAL(tong_tien_hoa_don) FROM invoices WHERE datetime >= ?", (latest[:7] + '-01',)
+            )[0][0]
+        return {
+            "total_invoices": int(total_invoices),
+            "total_revenue": int(total_revenue),
+            "current_month_revenue": int(current_month_revenue)
+        }
+
+    def weekday_sales(self) -> Dict[str, int]:
+        totals = dict(self.query(
+            "SELECT CAST(strftime('%w', datetime) AS INTEGER) AS weekday, TOTAL(tong_tien_hoa_don)"
+            " FROM invoices WHERE datetime IS NOT NULL GROUP BY weekday"
+        ))
+        by_name = {SQLITE_WEEKDAYS[weekday]: total for weekday, total in totals.items()}
+        return {day: int(by_name.get(day, 0)) for day in DAY_ORDER_VIETNAMESE}
+
+    def monthly_sales(self) -> Dict[str, int]:
+        rows = self.query(
+            "SELECT strftime('%Y-%m', datetime) AS month, TOTAL(tong_tien_hoa_don)"
+            " FROM invoices WHERE datetime IS NOT NULL GROUP BY month ORDER BY month"
+        )
+        return {month: int(total) for month, total in rows}
+
+
+class SQLiteAnalysis(AnalysisSections):
+    """
+    Cùng giao diện và cùng kết quả với AnalysisSections nhưng đọc từ SQLiteEngine:
+    TimeBucketIndex, ProductCube và các chỉ số tổng quan/báo cáo đều được tính bằng SQL,
+    không nạp toàn bộ hóa đơn vào bộ nhớ. apply_batch() ghi lô mới vào cơ sở dữ liệu.
+    """
+
+    def __init__(self, engine: SQLiteEngine):
+        super().__init__(None)
+        self.engine = engine
+        self._empty = engine.invoice_count() == 0
+
+    @property
+    def persistent(self):
+        """Các lô đã nạp nằm sẵn trong tệp SQLite, trừ khi dữ liệu vừa được nhập lại và log chưa được phát lại."""
+        return self.engine.meta('log_pending') != '1'
+
+    def close(self):
+        self.engine.close()
+
+    @property
+    def invoices_df(self):
+        """Toàn bộ bảng hóa đơn (không có chi_tiet); chỉ dùng khi thực sự cần dữ liệu thô."""
+        rows = self.engine.query("SELECT id_hoa_don, datetime, tong_tien_hoa_don FROM invoices ORDER BY id")
+        df = pd.DataFrame(rows, columns=['id_hoa_don', 'datetime', 'tong_tien_hoa_don'])
+        df['datetime'] = pd.to_datetime(df['datetime'])
+        return df
+
+    @property
+    def items_df(self):
+        rows = self.engine.query("SELECT datetime, ten_hang, so_luong, thanh_tien, nhom, loai FROM items")
+        items_df = pd.DataFrame(rows, columns=['datetime', 'ten_hang', 'so_luong', 'thanh_tien', 'nhom', 'loai'])
+        items_df['datetime'] = pd.to_datetime(items_df['datetime'])
+        return items_df
+
+    @property
+    def product_cube(self):
+        with self._lock:
+            if self._product_cube is None:
+                self._product_cube = self.engine.product_cube()
+            return self._product_cube
+
+    @property
+    def time_index(self):
+        with self._lock:
+            if self._time_index is None:
+                self._time_index = self.engine.time_index()
+            return self._time_index
+
+    def invoice_count(self):
+        return self.engine.invoice_count()
+
+    def apply_batch(self, batch_df):
+        if batch_df.empty:
+            return
+        with self._lock:
+            self.engine.insert_invoices(batch_df)
+            self._empty = False
+            self._merge_batch(batch_df)
+
+    def _compute_overall_metrics(self):
+        return self.engine.overall_metrics()
+
+    def _compute_reports_analysis(self):
+        return {
+            'weekday_sales': self.engine.weekday_sales(),
+            'monthly_sales': self.engine.monthly_sales(),
+            'item_distribution': self.product_cube.item_distribution().astype(int).to_dict()
+        }
+
+
+def source_signature(path: str) -> str:
+    """Chữ ký của tệp nguồn (đường dẫn, mtime, kích thước) để biết khi nào cần nhập lại."""
+    stat = os.stat(path)
+    return json.dumps([os.path.abspath(path), stat.st_mtime_ns, stat.st_size])
+
+
+def _source_batches(invoice_path: str) -> Iterable[pd.DataFrame]:
+    if invoice_path.lower().endswith(TABULAR_EXTENSIONS):
+        yield from iter_invoice_batches(invoice_path)
+        return
+    df = pd.read_json(invoice_path)
+    df['datetime'] = pd.to_datetime(df['datetime'])
+    yield df
+
+
+def open_sqlite_analysis(db_path: str, invoice_path: Optional[str] = None) -> SQLiteAnalysis:
+    """
+    Mở (hoặc tạo) tệp SQLite. Dữ liệu được nhập lại từ tệp hóa đơn JSON hoặc Excel/CSV khi tệp đó
+    khác với lần nhập trước (lần đầu, hoặc mtime/kích thước đã đổi).
+    """
+    engine = SQLiteEngine(db_path)
+    if invoice_path and os.path.exists(invoice_path):
+        signature = source_signature(invoice_path)
+        if engine.meta('source') != signature:
+            print(f"Đang nhập {invoice_path} vào {db_path}")
+            engine.replace_invoices(_source_batches(invoice_path), signature)
+    return SQLiteAnalysis(engine)
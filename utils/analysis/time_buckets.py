@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+from datetime import timedelta
+from typing import Any, Dict
+
+HOURS_PER_DAY = 24
+
+
+class TimeBucketIndex:
+    """
+    Mảng NumPy dày chứa doanh thu và số hóa đơn theo (ngày, giờ), dựng một lần từ bảng hóa đơn.
+    Hàng i ứng với ngày origin + i. Mọi khoảng thời gian (hôm nay, 7 ngày, 30 ngày, tuần trước...)
+    chỉ là một phép cắt mảng và cộng, chi phí không phụ thuộc số hóa đơn.
+    """
+
+    def __init__(self, origin: pd.Timestamp, revenue: np.ndarray, counts: np.ndarray):
+        self.origin = origin
+        self.revenue = revenue
+        self.counts = counts
+
+    @classmethod
+    def from_invoices(cls, invoices_df: pd.DataFrame, value_column: str = 'tong_tien_hoa_don') -> 'TimeBucketIndex':
+        valid = invoices_df['datetime'].notna()
+        datetimes = invoices_df.loc[valid, 'datetime']
+        if datetimes.empty:
+            empty = np.zeros((0, HOURS_PER_DAY))
+            return cls(pd.Timestamp.now().normalize(), empty, empty.astype(np.int64))
+        days = datetimes.dt.normalize()
+        origin = days.min()
+        day_offsets = ((days - origin) // pd.Timedelta(days=1)).to_numpy(dtype=np.int64)
+        buckets = day_offsets * HOURS_PER_DAY + datetimes.dt.hour.to_numpy(dtype=np.int64)
+        # Bỏ qua giá trị thiếu giống như pandas .sum()
+        values = invoices_df.loc[valid, value_column].fillna(0).to_numpy(dtype=np.float64)
+        size = (int(day_offsets.max()) + 1) * HOURS_PER_DAY
+        revenue = np.bincount(buckets, weights=values, minlength=size).reshape(-1, HOURS_PER_DAY)
+        counts = np.bincount(buckets, minlength=size).reshape(-1, HOURS_PER_DAY)
+        return cls(origin, revenue, counts)
+
+    def merge(self, other: 'TimeBucketIndex') -> 'TimeBucketIndex':
+        """Chỉ mục mới bằng tổng của hai chỉ mục, mở rộng khoảng ngày nếu cần (dùng khi nạp thêm hóa đơn)."""
+        if other.num_days == 0:
+            return self
+        if self.num_days == 0:
+            return other
+        origin = min(self.origin, other.origin)
+        end = max(self.day_offset(self.last_day), self.day_offset(other.last_day)) - self.day_offset(origin) + 1
+        revenue = np.zeros((end, HOURS_PER_DAY), dtype=np.result_type(self.revenue, other.revenue))
+        counts = np.zeros((end, HOURS_PER_DAY), dtype=np.result_type(self.counts, other.counts))
+        for index in (self, other):
+            start = (index.origin - origin).days
+            revenue[start:start + index.num_days] += index.revenue
+            counts[start:start + index.num_days] += index.counts
+        return TimeBucketIndex(origin, revenue, counts)
+
+    @property
+    def num_days(self) -> int:
+        return self.revenue.shape[0]
+
+    @property
+    def last_day(self) -> pd.Timestamp:
+        """Ngày mới nhất có dữ liệu (hàng cuối của mảng)."""
+        return self.origin + pd.Timedelta(days=max(self.num_days - 1, 0))
+
+    def day_offset(self, day: Any) -> int:
+        """Vị trí hàng của một ngày trong mảng (có thể âm hoặc vượt quá num_days)."""
+        return (pd.Timestamp(day).normalize() - self.origin).days
+
+    def _window(self, array: np.ndarray, start_day: Any, num_days: int) -> np.ndarray:
+        """Cắt num_days hàng bắt đầu từ start_day; các ngày nằm ngoài dữ liệu được điền 0."""
+        start = self.day_offset(start_day)
+        window = np.zeros((num_days, HOURS_PER_DAY), dtype=array.dtype)
+        lo, hi = max(start, 0), min(start + num_days, self.num_days)
+        if lo < hi:
+            window[lo - start:hi - start] = array[lo:hi]
+        return window
+
+    def period(self, start_day: Any, num_days: int) -> Dict[str, Any]:
+        """Doanh thu của num_days ngày bắt đầu từ start_day: tổng, theo giờ và theo ngày."""
+        window = self._window(self.revenue, start_day, num_days)
+        start_day = pd.Timestamp(start_day).normalize()
+        by_day = window.sum(axis=1)
+        return {
+            'total': int(by_day.sum()),
+            'byHour': [int(v) for v in window.sum(axis=0)],
+            'byDay': {
+                (start_day + timedelta(days=i)).strftime('%Y-%m-%d'): int(by_day[i])
+                for i in range(num_days)
+            }
+        }
+
+    def revenue_total(self, start_day: Any, num_days: int) -> int:
+        return int(self._window(self.revenue, start_day, num_days).sum())
+
+    def invoice_count(self, start_day: Any, num_days: int) -> int:
+        return int(self._window(self.counts, start_day, num_days).sum())
+
+    def month_to_date_revenue(self) -> int:
+        """Doanh thu từ đầu tháng của ngày mới nhất đến hết ngày đó."""
+        month_start = self.last_day.replace(day=1)
+        return self.revenue_total(month_start, self.day_offset(self.last_day) - self.day_offset(month_start) + 1)
+
+    def weekday_totals(self) -> np.ndarray:
+        """Tổng doanh thu theo thứ trong tuần (0 = Thứ Hai ... 6 = Chủ Nhật)."""
+        weekdays = (self.origin.dayofweek + np.arange(self.num_days)) % 7
+        return np.bincount(weekdays, weights=self.revenue.sum(axis=1), minlength=7)
+
+    def monthly_totals(self) -> Dict[str, float]:
+        """Tổng doanh thu theo tháng 'YYYY-MM', chỉ gồm các tháng có hóa đơn."""
+        months = (self.origin + pd.to_timedelta(np.arange(self.num_days), unit='D')).strftime('%Y-%m')
+        by_month = pd.DataFrame({
+            'month': months,
+            'revenue': self.revenue.sum(axis=1),
+            'count': self.counts.sum(axis=1),
+        }).groupby('month')[['revenue', 'count']].sum()
+        return by_month.loc[by_month['count'] > 0, 'revenue'].to_dict()
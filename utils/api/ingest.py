@@ -0,0 +1,228 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Set, Tuple
+
+import pandas as pd
+
+from utils.api.response_cache import dumps, orjson
+
+INVOICE_COLUMNS = ['id_hoa_don', 'datetime', 'chi_tiet', 'tong_tien_hoa_don']
+
+
+def _number(value: Any, field: str) -> Any:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"'{field}' phải là số")
+    return value
+
+
+def normalize_invoice(raw: Any) -> Dict[str, Any]:
+    """
+    Kiểm tra và chuẩn hóa một hóa đơn theo định dạng 'chi_tiet' của invoices.json.
+    thanh_tien mặc định là so_luong * don_gia, tong_tien_hoa_don mặc định là tổng thanh_tien;
+    nhom/loai thiếu được điền như khi phân tích. Báo ValueError nếu dữ liệu không hợp lệ.
+    """
+    if not isinstance(raw, dict):
+        raise ValueError("Mỗi hóa đơn phải là một object JSON")
+    if raw.get('id_hoa_don') in (None, ''):
+        raise ValueError("Thiếu 'id_hoa_don'")
+    try:
+        invoice_datetime = pd.Timestamp(raw.get('datetime'))
+    except (TypeError, ValueError):
+        raise ValueError(f"'datetime' không hợp lệ: {raw.get('datetime')!r}")
+    if pd.isna(invoice_datetime):
+        raise ValueError("Thiếu 'datetime'")
+    details = raw.get('chi_tiet')
+    if not isinstance(details, list) or not details:
+        raise ValueError("'chi_tiet' phải là danh sách mặt hàng không rỗng")
+
+    items = []
+    for item in details:
+        if not isinstance(item, dict) or not item.get('ten_hang'):
+            raise ValueError("Mỗi mặt hàng trong 'chi_tiet' cần có 'ten_hang'")
+        so_luong = _number(item.get('so_luong', 0), 'so_luong')
+        don_gia = _number(item.get('don_gia', 0), 'don_gia')
+        thanh_tien = item.get('thanh_tien')
+        thanh_tien = so_luong * don_gia if thanh_tien is None else _number(thanh_tien, 'thanh_tien')
+        items.append({
+            'ten_hang': str(item['ten_hang']),
+            'so_luong': so_luong,
+            'don_gia': don_gia,
+            'thanh_tien': thanh_tien,
+            'nhom': item.get('nhom') or 'Không xác định',
+            'loai': item.get('loai') or 'Chưa phân loại',
+        })
+    total = raw.get('tong_tien_hoa_don')
+    return {
+        'id_hoa_don': raw['id_hoa_don'],
+        'datetime': invoice_datetime.strftime('%Y-%m-%d %H:%M:%S'),
+        'chi_tiet': items,
+        'tong_tien_hoa_don': sum(item['thanh_tien'] for item in items) if total is None else _number(total, 'tong_tien_hoa_don'),
+    }
+
+
+def invoices_frame(invoices: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Bảng hóa đơn cùng định dạng với load_and_prepare_data."""
+    df = pd.DataFrame(invoices, columns=INVOICE_COLUMNS)
+    df['datetime'] = pd.to_datetime(df['datetime'])
+    return df
+
+
+def _loads(line: bytes) -> Any:
+    return orjson.loads(line) if orjson is not None else json.loads(line)
+
+
+def read_log(log_path: str) -> pd.DataFrame:
+    """Đọc lại các hóa đơn đã nạp; bỏ qua dòng cuối bị ghi dở nếu tiến trình dừng giữa chừng."""
+    invoices = []
+    if os.path.exists(log_path):
+        with open(log_path, 'rb') as f:
+            for line in f:
+                try:
+                    invoices.append(_loads(line))
+                except ValueError:
+                    print(f"Bỏ qua dòng hỏng trong {log_path}")
+    return invoices_frame(invoices)
+
+
+def open_log(log_path: str) -> Tuple[BinaryIO, Set[str]]:
+    """
+    Mở log để ghi tiếp và trả về kèm id các hóa đơn đã có trong log.
+    Dòng cuối bị ghi dở (tiến trình dừng giữa lúc ghi, lô đó chưa được xác nhận với client)
+    được cắt bỏ, để bản ghi kế tiếp không bị nối vào nó rồi bị bỏ qua khi đọc lại.
+    """
+    ids, valid_size = set(), 0
+    if os.path.exists(log_path):
+        with open(log_path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                valid_size += len(line)
+                try:
+                    ids.add(str(_loads(line)['id_hoa_don']))
+                except (ValueError, KeyError, TypeError):
+                    pass
+    log = open(log_path, 'ab')
+    if log.tell() > valid_size:
+        print(f"Cắt bỏ {log.tell() - valid_size:,} byte ghi dở ở cuối {log_path}")
+        log.truncate(valid_size)
+        os.fsync(log.fileno())
+    return log, ids
+
+
+class InvoiceIngestor:
+    """
+    Gom các hóa đơn gửi tới thành lô nhỏ: mỗi lô gồm mọi hóa đơn đến trong lúc lô trước đang được
+    xử lý (có thể chờ thêm tối đa max_delay giây cho đủ max_batch), ghi lô vào log JSONL
+    (fsync một lần cho cả lô) rồi gọi apply(batch_df) để gộp vào các bảng tổng hợp.
+    Future trả về từ submit() hoàn tất khi lô chứa nó đã được ghi bền vững vào log, với kết quả là số
+    hóa đơn mới; hóa đơn có id_hoa_don đã có trong log được bỏ qua, nên client gửi lại an toàn.
+    Giữ self.lock khi cần thay dữ liệu nền để không lô nào bị gộp hai lần hoặc bị mất.
+    """
+
+    def __init__(self, log_path: str, apply: Callable[[pd.DataFrame], None],
+                 max_batch: int = 1000, max_delay: float = 0.0):
+        self.log_path = log_path
+        self.apply = apply
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.accepted = 0
+        self.batches = 0
+        self.lock = threading.RLock()
+        self._pending: List[tuple] = []
+        self._pending_count = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        log_dir = os.path.dirname(log_path)
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+        self._log, self._ids = open_log(log_path)
+        self._thread = threading.Thread(target=self._worker, name="invoice-ingestor", daemon=True)
+        self._thread.start()
+
+    def submit(self, invoices: List[Dict[str, Any]]) -> Future:
+        """Đưa các hóa đơn đã chuẩn hóa vào lô kế tiếp."""
+        future: Future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Bộ nạp hóa đơn đã dừng")
+            self._pending.append((invoices, future))
+            self._pending_count += len(invoices)
+            self._cond.notify_all()
+        return future
+
+    def _take_batch(self) -> Optional[List[tuple]]:
+        with self._cond:
+            self._cond.wait_for(lambda: self._pending or self._closed)
+            if not self._pending:
+                return None
+            deadline = time.monotonic() + self.max_delay
+            while self._pending_count < self.max_batch and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch, self._pending, self._pending_count = self._pending, [], 0
+            return batch
+
+    def _worker(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                break
+            added, invoices = [], []
+            with self.lock:
+                # Bỏ các hóa đơn đã có trong log (client gửi lại) hoặc trùng trong cùng lô
+                seen = set()
+                for entry, _ in batch:
+                    count = 0
+                    for invoice in entry:
+                        invoice_id = str(invoice['id_hoa_don'])
+                        if invoice_id in self._ids or invoice_id in seen:
+                            continue
+                        seen.add(invoice_id)
+                        invoices.append(invoice)
+                        count += 1
+                    added.append(count)
+                try:
+                    self._append(invoices)
+                except Exception as e:
+                    print(f"❌ Lỗi khi ghi lô {len(invoices)} hóa đơn vào log: {e}")
+                    for _, future in batch:
+                        future.set_exception(e)
+                    continue
+                self._ids.update(seen)
+                # Lô đã nằm trong log (sẽ được nạp lại khi tải dữ liệu) nên lỗi gộp không làm hỏng kết quả với client
+                try:
+                    if invoices:
+                        self.apply(invoices_frame(invoices))
+                except Exception as e:
+                    print(f"❌ Lỗi khi gộp lô {len(invoices)} hóa đơn (đã ghi log, sẽ có ở lần tải lại): {e}")
+            self.accepted += len(invoices)
+            self.batches += 1
+            for (_, future), count in zip(batch, added):
+                future.set_result(count)
+
+    def _append(self, invoices: List[Dict[str, Any]]):
+        """Ghi lô vào log và fsync; nếu lỗi thì cắt phần ghi dở để log luôn kết thúc bằng một dòng trọn vẹn."""
+        if not invoices:
+            return
+        size = self._log.tell()
+        try:
+            self._log.write(b''.join(dumps(invoice) + b'\n' for invoice in invoices))
+            self._log.flush()
+            os.fsync(self._log.fileno())
+        except Exception:
+            self._log.truncate(size)
+            raise
+
+    def close(self, wait: bool = True):
+        """Dừng sau khi ghi hết các lô đang chờ."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if wait:
+            self._thread.join()
+        self._log.close()
@@ -0,0 +1,106 @@
+import threading
+from collections import deque
+from typing import Any, Iterator, Optional
+
+from utils.api.response_cache import dumps
+
+_UNCHANGED = object()
+
+
+def diff(old: Any, new: Any) -> Any:
+    """
+    Phần thay đổi để biến old thành new, dùng cho các sự kiện 'delta':
+    - dict có cùng tập khóa: dict con chỉ chứa các khóa đã đổi (áp dụng đệ quy);
+    - list cùng độ dài: {"$items": {chỉ_số: giá_trị_mới}};
+    - trường hợp khác (khóa thêm/bớt, đổi kiểu, đổi độ dài): {"$set": new}, hoặc giá trị mới nếu là kiểu đơn.
+    Trả về _UNCHANGED nếu không có gì thay đổi.
+    """
+    if isinstance(old, dict) and isinstance(new, dict):
+        if old.keys() != new.keys():
+            return {"$set": new}
+        patch = {}
+        for key, value in new.items():
+            change = diff(old[key], value)
+            if change is not _UNCHANGED:
+                patch[key] = change
+        return patch if patch else _UNCHANGED
+    if isinstance(old, list) and isinstance(new, list):
+        if len(old) != len(new):
+            return {"$set": new}
+        items = {str(i): value for i, (before, value) in enumerate(zip(old, new)) if before != value}
+        return {"$items": items} if items else _UNCHANGED
+    if type(old) is type(new) and old == new:
+        return _UNCHANGED
+    if isinstance(new, (dict, list)):
+        return {"$set": new}
+    return new
+
+
+def format_event(event: str, data: Any, event_id: Optional[int] = None) -> str:
+    """Một sự kiện SSE với dữ liệu JSON (một dòng)."""
+    prefix = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{prefix}event: {event}\ndata: {dumps(data).decode('utf-8')}\n\n"
+
+
+def _event(event: str, version: int, data: Any) -> str:
+    return format_event(event, data, version)
+
+
+class LiveFeed:
+    """
+    Nguồn Server-Sent Events cho dashboard. Mỗi lần publish() một trạng thái mới, feed chỉ gửi
+    phần thay đổi (delta) tới các kết nối đang mở. Client kết nối lại với Last-Event-ID được gửi
+    bù các delta còn trong lịch sử; nếu quá cũ thì nhận lại toàn bộ trạng thái (snapshot).
+    """
+
+    def __init__(self, history: int = 100, keepalive_seconds: float = 15):
+        self.version = 0
+        self.state: Any = None
+        self.keepalive_seconds = keepalive_seconds
+        self._deltas: "deque" = deque(maxlen=history)
+        self._cond = threading.Condition()
+
+    def publish(self, state: Any) -> bool:
+        """Cập nhật trạng thái; trả về False nếu không có gì thay đổi."""
+        with self._cond:
+            if self.state is None:
+                self._deltas.clear()
+            else:
+                patch = diff(self.state, state)
+                if patch is _UNCHANGED:
+                    return False
+                self._deltas.append((self.version + 1, patch))
+            self.state = state
+            self.version += 1
+            self._cond.notify_all()
+            return True
+
+    def _catch_up(self, since: int) -> Optional[list]:
+        """Các delta sau phiên bản since, hoặc None nếu lịch sử không còn đủ."""
+        pending = [(version, patch) for version, patch in self._deltas if version > since]
+        if not pending or pending[0][0] != since + 1:
+            return None
+        return pending
+
+    def events(self, last_event_id: Optional[str] = None) -> Iterator[str]:
+        """Luồng sự kiện SSE vô hạn cho một client."""
+        try:
+            seen = int(last_event_id) if last_event_id else None
+        except ValueError:
+            seen = None
+
+        while True:
+            with self._cond:
+                if seen is not None and not self._cond.wait_for(lambda: self.version != seen,
+                                                                timeout=self.keepalive_seconds):
+                    messages = [": keepalive\n\n"]
+                else:
+                    pending = self._catch_up(seen) if seen is not None and seen < self.version else None
+                    if pending is not None:
+                        messages = [_event("delta", version, patch) for version, patch in pending]
+                    elif self.state is not None:
+                        messages = [_event("snapshot", self.version, self.state)]
+                    else:
+                        messages = []
+                    seen = self.version
+            yield from messages
@@ -0,0 +1,145 @@
+"""
+Số liệu vận hành theo định dạng văn bản của Prometheus (exposition format 0.0.4), không cần
+prometheus_client: histogram độ trễ và kích thước phản hồi theo route, cùng các hàm định dạng
+gauge/counter cho những giá trị được đọc tại thời điểm scrape.
+
+Mỗi tiến trình giữ số liệu riêng; khi chạy nhiều worker (serve.py) mỗi lần scrape chỉ thấy
+số liệu của worker nhận request đó.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from flask import Flask, g, request
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+UNMATCHED_ROUTE = '<unmatched>'
+PROCESS_START_TIME = time.time()
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def family(name: str, metric_type: str, help_text: str,
+           samples: Iterable[Tuple[Labels, float]]) -> List[str]:
+    """Các dòng # HELP/# TYPE và mẫu của một metric; samples là (labels, giá trị)."""
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} {metric_type}']
+    lines.extend(f'{name}{_format_labels(labels)} {_format_value(value)}' for labels, value in samples)
+    return lines
+
+
+def gauge(name: str, help_text: str, value: Optional[float]) -> List[str]:
+    """Gauge không nhãn; bỏ qua nếu chưa có giá trị."""
+    return [] if value is None else family(name, 'gauge', help_text, [((), value)])
+
+
+class Histogram:
+    """Histogram có nhãn với các bucket cố định (lũy tích khi xuất, như Prometheus)."""
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float]):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        # nhãn -> [số đếm theo bucket (không lũy tích, phần tử cuối là +Inf), tổng, số lần]
+        self._series: Dict[Labels, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(sorted(labels.items()))
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in sorted(self._series.items())]
+        for key, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = key + (('le', _format_value(float(bound))),)
+                lines.append(f'{self.name}_bucket{_format_labels(labels)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(key)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(key)} {count}')
+        return lines
+
+
+class RequestMetrics:
+    """Đo độ trễ và kích thước phản hồi của mọi request Flask, gắn nhãn theo route (không theo URL thật)."""
+
+    def __init__(self, app: Optional[Flask] = None):
+        self.latency = Histogram('http_request_duration_seconds',
+                                 'Thời gian xử lý request (tới khi trả header) theo route.', LATENCY_BUCKETS)
+        self.size = Histogram('http_response_size_bytes',
+                              'Kích thước thân phản hồi (sau nén) theo route.', SIZE_BUCKETS)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+    @staticmethod
+    def _start():
+        g.metrics_start = time.perf_counter()
+
+    def _finish(self, response):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return response
+        route = request.url_rule.rule if request.url_rule is not None else UNMATCHED_ROUTE
+        self.latency.observe(time.perf_counter() - start, route=route, method=request.method,
+                             status=str(response.status_code))
+        # Luồng (SSE, stream_with_context) không có độ dài biết trước
+        if not response.is_streamed:
+            self.size.observe(response.calculate_content_length() or 0, route=route)
+        return response
+
+    def render(self) -> List[str]:
+        return self.latency.render() + self.size.render()
+
+
+def process_metrics() -> List[str]:
+    """RSS, thời gian CPU và thời điểm khởi động của tiến trình (RSS đọc từ /proc, chỉ có trên Linux)."""
+    lines = []
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        lines += gauge('process_resident_memory_bytes', 'Bộ nhớ thường trú (RSS) của tiến trình.',
+                       resident_pages * os.sysconf('SC_PAGE_SIZE'))
+    except (OSError, ValueError, IndexError):
+        pass
+    times = os.times()
+    lines += family('process_cpu_seconds_total', 'counter', 'Tổng thời gian CPU (user + system).',
+                    [((), times.user + times.system)])
+    lines += gauge('process_start_time_seconds', 'Thời điểm khởi động tiến trình (Unix time).', PROCESS_START_TIME)
+    return lines
+
+
+def render(lines: Iterable[str]) -> str:
+    return '\n'.join(lines) + '\n'
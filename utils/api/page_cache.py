@@ -0,0 +1,76 @@
+import os
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+from utils.api.response_cache import CachedPayload
+
+SIDEBAR_PLACEHOLDERS = {'sales': '{{ sales_active }}', 'products': '{{ products_active }}', 'reports': '{{ reports_active }}'}
+
+
+def _mtime(path: str) -> Optional[float]:
+    try:
+        return os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+class PageCache:
+    """
+    Bộ nhớ đệm cho các trang HTML: sidebar được đọc và điền sẵn một lần cho mỗi trang đang active,
+    trang hoàn chỉnh được render, nén và gắn ETag một lần. Cả hai tự làm mới khi mtime của
+    _sidebar.html hoặc template trang thay đổi.
+    """
+
+    def __init__(self, template_folder: str = 'templates', sidebar_name: str = '_sidebar.html'):
+        self.template_folder = template_folder
+        self.sidebar_path = os.path.join(template_folder, sidebar_name)
+        self.hits = 0
+        self.misses = 0
+        self._sidebar_mtime: Optional[float] = None
+        self._sidebar_variants: Dict[str, str] = {}
+        self._pages: Dict[Tuple[str, str], Tuple[Tuple, CachedPayload]] = {}
+        self._lock = threading.Lock()
+
+    def _load_sidebar(self, mtime: float):
+        with open(self.sidebar_path, 'r', encoding='utf-8') as f:
+            template = f.read()
+        variants = {}
+        for active_page in list(SIDEBAR_PLACEHOLDERS) + ['']:
+            content = template
+            for page, placeholder in SIDEBAR_PLACEHOLDERS.items():
+                content = content.replace(placeholder, 'active' if page == active_page else '')
+            variants[active_page] = content
+        self._sidebar_variants = variants
+        self._sidebar_mtime = mtime
+
+    def sidebar(self, active_page: str = '') -> Optional[str]:
+        """HTML sidebar với mục active_page được đánh dấu; None nếu không có file sidebar."""
+        mtime = _mtime(self.sidebar_path)
+        if mtime is None:
+            return None
+        with self._lock:
+            if mtime != self._sidebar_mtime:
+                self._load_sidebar(mtime)
+            if active_page not in self._sidebar_variants:
+                active_page = ''
+            return self._sidebar_variants[active_page]
+
+    def page(self, template_name: str, active_page: str, render: Callable[[str], str]) -> CachedPayload:
+        """
+        Trang đã render sẵn cho (template, active_page). render nhận HTML sidebar và trả về HTML trang.
+        """
+        key = (template_name, active_page)
+        version = (_mtime(os.path.join(self.template_folder, template_name)), _mtime(self.sidebar_path))
+        with self._lock:
+            cached = self._pages.get(key)
+            if cached is not None and cached[0] == version:
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+        sidebar = self.sidebar(active_page)
+        if sidebar is None:
+            sidebar = "<p>Error: Sidebar template not found.</p>"
+        payload = CachedPayload(render(sidebar).encode('utf-8'))
+        with self._lock:
+            self._pages[key] = (version, payload)
+        return payload
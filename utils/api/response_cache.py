@@ -0,0 +1,136 @@
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from flask import Response, request
+
+# orjson và brotli là tùy chọn: thiếu thì dùng json chuẩn và chỉ nén gzip
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIN_COMPRESS_SIZE = 512
+MAX_ENTRIES = 256
+# Kích thước mỗi khối khi gửi body nằm trong shared memory
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+def dumps(data: Any) -> bytes:
+    """Tuần tự hóa JSON nhanh, khóa được sắp xếp để cùng dữ liệu luôn ra cùng bytes (và cùng ETag)."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(',', ':'), default=str).encode('utf-8')
+
+
+class CachedPayload:
+    """Một payload JSON đã tuần tự hóa cùng các bản nén sẵn và ETag cho từng bản."""
+
+    def __init__(self, body: bytes):
+        digest = hashlib.sha1(body).hexdigest()
+        self.bodies: Dict[str, bytes] = {'identity': body}
+        self.etags: Dict[str, str] = {'identity': digest}
+        if len(body) >= MIN_COMPRESS_SIZE:
+            self.bodies['gzip'] = gzip.compress(body, compresslevel=9, mtime=0)
+            self.etags['gzip'] = f"{digest}-gzip"
+            if brotli is not None:
+                self.bodies['br'] = brotli.compress(body, quality=9)
+                self.etags['br'] = f"{digest}-br"
+
+    @classmethod
+    def from_parts(cls, bodies: Dict[str, Any], etags: Dict[str, str]) -> 'CachedPayload':
+        """Payload từ các bản đã tuần tự hóa/nén sẵn (ví dụ memoryview trỏ vào shared memory)."""
+        payload = cls.__new__(cls)
+        payload.bodies = bodies
+        payload.etags = etags
+        return payload
+
+    def choose_encoding(self) -> str:
+        accepted = request.accept_encodings
+        for encoding in ('br', 'gzip'):
+            if encoding in self.bodies and accepted[encoding]:
+                return encoding
+        return 'identity'
+
+
+class ResponseCache:
+    """
+    Bộ nhớ đệm phản hồi cho các endpoint /api theo từng snapshot dữ liệu.
+    Mỗi payload chỉ được tuần tự hóa và nén một lần; các lần gọi sau trả bytes có sẵn,
+    hoặc 304 nếu trình duyệt gửi If-None-Match khớp ETag.
+    Gọi invalidate() mỗi khi dữ liệu phân tích thay đổi.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.snapshot = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, CachedPayload]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self.snapshot += 1
+            self._entries.clear()
+
+    def get(self, key: str, producer: Callable[[], Any]) -> CachedPayload:
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return payload
+            self.misses += 1
+            snapshot = self.snapshot
+        payload = CachedPayload(dumps(producer()))
+        with self._lock:
+            # Dữ liệu đã đổi trong lúc tính: vẫn trả cho request này nhưng không lưu dưới snapshot mới
+            if self.snapshot != snapshot:
+                return payload
+            self._entries[key] = payload
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return payload
+
+    def respond(self, producer: Callable[[], Any], key: Optional[str] = None) -> Response:
+        """Trả phản hồi JSON cho request hiện tại; khóa mặc định là đường dẫn kèm query string."""
+        payload = self.get(key or request.full_path, producer)
+        # Luôn hỏi lại server, nhưng nếu dữ liệu chưa đổi thì chỉ tốn một phản hồi 304 rỗng
+        return payload_response(payload, 'application/json', 'no-cache')
+
+
+def payload_response(payload: CachedPayload, mimetype: str, cache_control: str) -> Response:
+    """Dựng phản hồi từ payload có sẵn: chọn bản nén phù hợp, trả 304 nếu If-None-Match khớp ETag."""
+    encoding = payload.choose_encoding()
+    etag = payload.etags[encoding]
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        body = payload.bodies[encoding]
+        if isinstance(body, memoryview):
+            # Body nằm trong shared memory: gửi từng khối thay vì chép cả body vào bộ nhớ của worker
+            response = Response(_chunks(body), mimetype=mimetype)
+            response.content_length = len(body)
+        else:
+            response = Response(body, mimetype=mimetype)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def _chunks(body: memoryview):
+    for start in range(0, len(body), STREAM_CHUNK_BYTES):
+        yield bytes(body[start:start + STREAM_CHUNK_BYTES])
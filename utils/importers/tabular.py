@@ -0,0 +1,271 @@
+"""
+Nhập hóa đơn từ tệp xuất của máy POS (.xlsx, .xls, .csv) theo luồng, bộ nhớ không phụ thuộc kích thước tệp.
+
+Mỗi dòng của tệp là một mặt hàng; các cột được nhận theo tên (có dấu hoặc không, tiếng Việt hoặc
+tiếng Anh, xem COLUMN_ALIASES) và các dòng liền nhau cùng mã hóa đơn được gộp thành một hóa đơn
+định dạng 'chi_tiet' như invoices.json. Tệp POS luôn xuất các dòng của một hóa đơn liền nhau;
+nếu một mã hóa đơn xuất hiện lại ở chỗ khác, phần đó được tính là một hóa đơn riêng.
+
+- .xlsx: openpyxl ở chế độ read_only, đọc từng dòng;
+- .xls: xlrd (định dạng cũ tối đa 65.536 dòng nên đọc cả sheet);
+- .csv: bảng mã được dò một lần từ mẫu đầu tệp bằng chardet, dấu phân cách bằng csv.Sniffer.
+"""
+import csv
+import re
+import unicodedata
+from datetime import date, datetime, time
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import pandas as pd
+
+from utils.api.ingest import invoices_frame, normalize_invoice
+
+# chardet là tùy chọn: thiếu thì thử utf-8 rồi cp1258 (Windows tiếng Việt)
+try:
+    import chardet
+except ImportError:
+    chardet = None
+
+TABULAR_EXTENSIONS = ('.xlsx', '.xlsm', '.xls', '.csv')
+ENCODING_SAMPLE_BYTES = 64 * 1024
+BATCH_INVOICES = 10_000
+
+# Tên cột đã chuẩn hóa (bỏ dấu, chữ thường, nối bằng '_') -> trường của hóa đơn/mặt hàng
+COLUMN_ALIASES = {
+    'id_hoa_don': ('id_hoa_don', 'ma_hoa_don', 'so_hoa_don', 'ma_hd', 'so_hd', 'hoa_don', 'ma_don', 'ma_don_hang',
+                   'so_chung_tu',
+                   'invoice_id', 'invoice', 'order_id', 'order'),
+    'datetime': ('datetime', 'thoi_gian', 'ngay_gio', 'thoi_diem', 'ngay', 'ngay_ban', 'ngay_tao',
+                 'date', 'created_at', 'created_date_time'),
+    'time': ('gio', 'gio_ban', 'time'),
+    'ten_hang': ('ten_hang', 'ten_hang_hoa', 'hang_hoa', 'san_pham', 'ten_san_pham', 'mon', 'ten_mon',
+                 'product', 'product_name', 'item', 'item_name'),
+    'so_luong': ('so_luong', 'sl', 'quantity', 'qty'),
+    'don_gia': ('don_gia', 'gia', 'gia_ban', 'price', 'unit_price'),
+    'thanh_tien': ('thanh_tien', 'line_total', 'amount'),
+    'nhom': ('nhom', 'nhom_hang', 'group'),
+    'loai': ('loai', 'loai_hang', 'danh_muc', 'category'),
+    'tong_tien_hoa_don': ('tong_tien_hoa_don', 'tong_tien', 'tong_cong', 'khach_can_tra', 'invoice_total',
+                          'order_total', 'calc_total_money'),
+}
+REQUIRED_FIELDS = ('id_hoa_don', 'datetime', 'ten_hang')
+ITEM_FIELDS = ('ten_hang', 'so_luong', 'don_gia', 'thanh_tien', 'nhom', 'loai')
+NUMBER_FIELDS = ('so_luong', 'don_gia', 'thanh_tien', 'tong_tien_hoa_don')
+
+# "150.000" hay "1.250.000": dấu chấm phân cách hàng nghìn kiểu Việt Nam
+DOT_THOUSANDS = re.compile(r'^-?\d{1,3}(\.\d{3})+$')
+# Dấu phẩy thập phân: "1.250,5" (kèm chấm hàng nghìn) hoặc "2,5" (phẩy không đứng trước đúng 3 chữ số)
+DECIMAL_COMMA = re.compile(r'^-?(\d{1,3}(\.\d{3})+,\d+|\d+,\d{1,2})$')
+ISO_DATE = re.compile(r'^\d{4}[-/]')
+
+
+def normalize_header(name: Any) -> str:
+    text = unicodedata.normalize('NFKD', str(name or '')).replace('đ', 'd').replace('Đ', 'D')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    return re.sub(r'[^a-z0-9]+', '_', text).strip('_')
+
+
+def map_columns(header: Sequence[Any]) -> Dict[str, int]:
+    """{trường: vị trí cột} theo dòng tiêu đề; báo ValueError nếu thiếu cột bắt buộc."""
+    positions = {normalize_header(name): index for index, name in reversed(list(enumerate(header)))}
+    columns = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in positions:
+                columns[field] = positions[alias]
+                break
+    missing = [field for field in REQUIRED_FIELDS if field not in columns]
+    if missing:
+        raise ValueError(f"Thiếu cột {', '.join(missing)} (tiêu đề: {list(header)})")
+    return columns
+
+
+def detect_encoding(path: str, sample_bytes: int = ENCODING_SAMPLE_BYTES) -> str:
+    """Bảng mã của tệp văn bản, dò một lần từ sample_bytes đầu tệp."""
+    with open(path, 'rb') as f:
+        sample = f.read(sample_bytes)
+    if sample.startswith(b'\xef\xbb\xbf'):
+        return 'utf-8-sig'
+    candidates = ['utf-8', 'cp1258']
+    if chardet is not None:
+        detected = chardet.detect(sample)
+        if detected.get('encoding'):
+            encoding = detected['encoding'].lower()
+            candidates.insert(0, 'utf-8' if encoding == 'ascii' else encoding)
+    for encoding in candidates:
+        try:
+            # Mẫu có thể cắt ngang một ký tự nhiều byte ở cuối
+            sample.decode(encoding) if len(sample) < sample_bytes else sample[:-4].decode(encoding)
+            return encoding
+        except (UnicodeDecodeError, LookupError):
+            continue
+    return 'latin-1'
+
+
+def _iter_csv_rows(path: str) -> Iterator[Sequence[Any]]:
+    encoding = detect_encoding(path)
+    with open(path, 'r', encoding=encoding, newline='') as f:
+        sample = f.read(ENCODING_SAMPLE_BYTES)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t|')
+        except csv.Error:
+            dialect = csv.excel
+        yield from csv.reader(f, dialect)
+
+
+def _iter_xlsx_rows(path: str) -> Iterator[Sequence[Any]]:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield from workbook.worksheets[0].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _iter_xls_rows(path: str) -> Iterator[Sequence[Any]]:
+    import xlrd
+
+    workbook = xlrd.open_workbook(path, on_demand=True)
+    try:
+        sheet = workbook.sheet_by_index(0)
+        for row in sheet.get_rows():
+            yield [xlrd.xldate_as_datetime(cell.value, workbook.datemode) if cell.ctype == xlrd.XL_CELL_DATE
+                   else cell.value for cell in row]
+    finally:
+        workbook.release_resources()
+
+
+def iter_rows(path: str) -> Iterator[Sequence[Any]]:
+    """Các dòng của sheet đầu tiên / tệp CSV, dòng tiêu đề trước."""
+    extension = path.lower().rsplit('.', 1)[-1]
+    if extension == 'csv':
+        return _iter_csv_rows(path)
+    if extension in ('xlsx', 'xlsm'):
+        return _iter_xlsx_rows(path)
+    if extension == 'xls':
+        return _iter_xls_rows(path)
+    raise ValueError(f"Không hỗ trợ định dạng tệp: {path}")
+
+
+def _blank(value: Any) -> bool:
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def parse_number(value: Any) -> Optional[float]:
+    """Số từ ô Excel/CSV: '150,000', '150.000', '1.250,5', '2,5', '150000đ', ' 1 250 000 VND'; None nếu ô trống."""
+    if _blank(value):
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    text = re.sub(r'(?i)\s|đ|₫|vnd', '', str(value))
+    if DOT_THOUSANDS.match(text):
+        text = text.replace('.', '')
+    elif DECIMAL_COMMA.match(text):
+        text = text.replace('.', '').replace(',', '.')
+    else:
+        text = text.replace(',', '')
+    number = float(text)
+    return int(number) if number.is_integer() else number
+
+
+def parse_datetime(value: Any, time_value: Any = None) -> pd.Timestamp:
+    """Thời điểm từ ô Excel (datetime) hoặc chuỗi dd/mm/yyyy [HH:MM] / ISO; ghép thêm cột giờ nếu có."""
+    if isinstance(value, (datetime, date)):
+        timestamp = pd.Timestamp(value)
+    else:
+        text = str(value).strip()
+        timestamp = pd.Timestamp(text) if ISO_DATE.match(text) else pd.to_datetime(text, dayfirst=True)
+    if not _blank(time_value):
+        clock = time_value if isinstance(time_value, time) else pd.Timestamp(str(time_value).strip()).time()
+        timestamp = timestamp.normalize() + pd.Timedelta(hours=clock.hour, minutes=clock.minute, seconds=clock.second)
+    return timestamp
+
+
+class ImportStats:
+    def __init__(self):
+        self.rows = 0
+        self.invoices = 0
+        self.skipped_invoices = 0
+        self.errors: List[str] = []
+
+    def skip(self, invoice_id: Any, error: Exception):
+        self.skipped_invoices += 1
+        if len(self.errors) < 10:
+            self.errors.append(f"{invoice_id}: {error}")
+
+
+def iter_invoices(path: str, stats: Optional[ImportStats] = None) -> Iterator[Dict[str, Any]]:
+    """Các hóa đơn định dạng 'chi_tiet' (đã qua normalize_invoice); hóa đơn lỗi được bỏ qua và đếm vào stats."""
+    stats = stats if stats is not None else ImportStats()
+    rows = iter_rows(path)
+    header = next((row for row in rows if row and not all(_blank(cell) for cell in row)), None)
+    if header is None:
+        return
+    columns = map_columns(header)
+
+    def cell(row, field):
+        index = columns.get(field)
+        return row[index] if index is not None and index < len(row) else None
+
+    current_id, raw = None, None
+
+    def finish():
+        try:
+            if raw.get('error'):
+                raise ValueError(raw['error'])
+            invoice = normalize_invoice(raw)
+        except ValueError as e:
+            stats.skip(raw['id_hoa_don'], e)
+            return None
+        stats.invoices += 1
+        return invoice
+
+    for row in rows:
+        if not row or all(_blank(value) for value in row):
+            continue
+        stats.rows += 1
+        invoice_id = cell(row, 'id_hoa_don')
+        if _blank(invoice_id):
+            stats.skip(f"dòng {stats.rows}", ValueError("thiếu mã hóa đơn"))
+            continue
+        # Excel lưu mã số dạng float (1001.0)
+        invoice_id = str(int(invoice_id) if isinstance(invoice_id, float) and invoice_id.is_integer() else invoice_id).strip()
+        if invoice_id != current_id:
+            if raw is not None and (invoice := finish()) is not None:
+                yield invoice
+            current_id, raw = invoice_id, {'id_hoa_don': invoice_id, 'chi_tiet': []}
+            try:
+                raw['datetime'] = parse_datetime(cell(row, 'datetime'), cell(row, 'time'))
+                raw['tong_tien_hoa_don'] = parse_number(cell(row, 'tong_tien_hoa_don'))
+            except (TypeError, ValueError) as e:
+                raw['error'] = f"thời gian/tổng tiền không hợp lệ ({e})"
+        item = {}
+        for field in ITEM_FIELDS:
+            value = cell(row, field)
+            try:
+                value = parse_number(value) if field in NUMBER_FIELDS else value
+            except ValueError:
+                raw['error'] = f"'{field}' không phải số: {value!r}"
+            if isinstance(value, str):
+                # cp1258 ghi dấu thanh bằng ký tự tổ hợp: đưa về dạng dựng sẵn như invoices.json
+                value = unicodedata.normalize('NFC', value.strip())
+            if not _blank(value):
+                item[field] = value
+        raw['chi_tiet'].append(item)
+    if raw is not None and (invoice := finish()) is not None:
+        yield invoice
+
+
+def iter_invoice_batches(path: str, batch_size: int = BATCH_INVOICES,
+                         stats: Optional[ImportStats] = None) -> Iterator[pd.DataFrame]:
+    """Bảng hóa đơn (cùng định dạng với load_and_prepare_data) theo từng lô batch_size hóa đơn."""
+    batch = []
+    for invoice in iter_invoices(path, stats):
+        batch.append(invoice)
+        if len(batch) >= batch_size:
+            yield invoices_frame(batch)
+            batch = []
+    if batch:
+        yield invoices_frame(batch)
@@ -0,0 +1,227 @@
+"""
+Kiểm tra nhanh (không gọi LLM) các số liệu trong bản phân tích markdown của analyst so với
+calculations đã tính sẵn, chạy trước LLM critic để bản nháp sai số liệu bị trả lại ngay.
+
+Các quy tắc chỉ báo lỗi khi chắc chắn:
+- dòng nói về tổng doanh thu / tổng số đơn / giá trị đơn trung bình mà không con số nào sau cụm đó
+  khớp với revenue_summary (số viết kiểu 8.085.000, 8,085,000, 8,1 triệu, 250k, 97.500đ đều được hiểu,
+  tỷ lệ phần trăm bị bỏ qua);
+  nếu dòng nói về một ngày/giờ/buổi cụ thể thì chỉ cần khớp một số liệu bất kỳ đã tính;
+- mục "Top ... theo số lượng/doanh thu": sản phẩm được liệt kê không có trong top 5 tương ứng,
+  hoặc con số đi kèm không khớp số lượng/doanh thu của sản phẩm đó;
+- mục giờ cao điểm / đông khách: giờ được nêu đầu tiên không phải giờ có nhiều đơn nhất.
+Dòng không có con số, mục không nhận ra tiêu đề hay số liệu không có trong calculations đều bỏ qua.
+"""
+import re
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+TOLERANCE = 0.005          # Sai lệch tương đối chấp nhận khi số được viết đầy đủ
+ROUNDED_TOLERANCE = 0.05   # Khi số được làm tròn theo đơn vị (8,1 triệu, 250k)
+
+UNITS = {'tỷ': 1e9, 'ty': 1e9, 'triệu': 1e6, 'trieu': 1e6, 'tr': 1e6, 'nghìn': 1e3, 'ngàn': 1e3, 'k': 1e3}
+# Nhóm hàng nghìn không bắt đầu bằng 0 ("0,195 triệu" là 0,195); số phải được đọc trọn (không lùi về "97" trong
+# "97.500đ"), phần của ngày/giờ (22/08, 14:30) không tính; đơn vị tiền (đ, ₫, VNĐ, đồng) được bỏ qua;
+# "%" được bắt riêng để loại tỷ lệ phần trăm
+NUMBER = re.compile(r'(?<![\w.,/:])([1-9]\d{0,2}(?:([.,])\d{3})(?:\2\d{3})*|\d+(?:[.,]\d+)?)(?![.,]?\d|[/:]\d)'
+                    r'\s*(%|tỷ|ty|triệu|trieu|tr|nghìn|ngàn|k)?\s*(?:đồng|vnđ|vnd|đ|₫)?(?!\w)',
+                    re.IGNORECASE)
+LIST_MARKER = re.compile(r'^\s*(?:[-*+•]|\d{1,2}[.)])\s+')
+HEADING = re.compile(r'^\s*(?:#{1,6}\s+(.+?)\s*#*\s*|\*\*([^*]+)\*\*:?\s*)$')
+# "14h", "14:00", "giờ 14", "lúc 14 giờ" (không bắt "2 giờ cao điểm" hay "24 giờ")
+HOUR = re.compile(r'\bgiờ\s+(\d{1,2})\b|\b(\d{1,2})(?:h\b|:00\b)|(?:lúc|từ|vào)\s+(\d{1,2})\s*giờ\b', re.IGNORECASE)
+
+TOTAL_REVENUE = re.compile(r'tổng doanh thu|doanh thu tổng')
+TOTAL_ORDERS = re.compile(r'tổng (?:số )?(?:hóa )?đơn(?! vị| giá)|số lượng đơn hàng')
+AVERAGE_ORDER = re.compile(r'trung bình (?:mỗi |trên mỗi |một )?đơn|giá trị (?:đơn hàng )?trung bình|\baov\b')
+# Dòng nói về một phần dữ liệu (một ngày, một khung giờ, ...) chứ không phải toàn kỳ
+SCOPED = re.compile(r'\bngày\b|\bgiờ\b|buổi|khung|tuần|tháng|sáng|trưa|chiều|tối|\d{1,2}/\d{1,2}')
+
+
+def _normalize(text: str) -> str:
+    return unicodedata.normalize('NFC', text).casefold()
+
+
+def _strip_markdown(text: str) -> str:
+    return re.sub(r'[*_`|]', ' ', text)
+
+
+def parse_numbers(text: str) -> List[Tuple[float, bool]]:
+    """Các số trong một dòng: (giá trị, có làm tròn theo đơn vị hay không); bỏ qua tỷ lệ phần trăm."""
+    numbers = []
+    for match in NUMBER.finditer(text):
+        digits, separator, unit = match.groups()
+        if unit == '%':
+            continue
+        if separator:
+            value = float(digits.replace(separator, ''))
+        else:
+            value = float(digits.replace(',', '.'))
+        if unit:
+            numbers.append((value * UNITS[unit.lower()], True))
+        else:
+            numbers.append((value, False))
+    return numbers
+
+
+def _matches(numbers: Iterable[Tuple[float, bool]], expected: Iterable[float], tolerance: float) -> bool:
+    for value, rounded in numbers:
+        for target in expected:
+            allowed = max(abs(target) * (max(tolerance, ROUNDED_TOLERANCE) if rounded else tolerance), 1)
+            if abs(value - target) <= allowed:
+                return True
+    return False
+
+
+def split_sections(report: str) -> List[Tuple[str, List[str]]]:
+    """(tiêu đề đã chuẩn hóa, các dòng) theo tiêu đề markdown (#) hoặc dòng in đậm đứng riêng."""
+    sections, title, lines = [], '', []
+    for line in report.splitlines():
+        match = HEADING.match(line)
+        if match:
+            sections.append((title, lines))
+            title, lines = _normalize(match.group(1) or match.group(2)), []
+        else:
+            lines.append(line)
+    sections.append((title, lines))
+    return sections
+
+
+def _find_product(line: str, products: Dict[str, Dict[str, Any]]) -> Optional[str]:
+    """Sản phẩm (trong số đã biết) được nhắc tới ở dòng, ưu tiên tên dài nhất."""
+    text = _normalize(line)
+    found = [name for name in products if name and name in text]
+    return max(found, key=len) if found else None
+
+
+def _item_name(line: str) -> str:
+    """Tên sản phẩm của một mục danh sách: phần trước ':', ' - ', '(' hoặc con số đầu tiên."""
+    text = _strip_markdown(LIST_MARKER.sub('', line)).strip()
+    text = re.split(r':| - | – |\(|\d', text, maxsplit=1)[0]
+    return _normalize(text).strip(' .,')
+
+
+def known_figures(calculations: Dict[str, Any]) -> Dict[str, List[float]]:
+    """Mọi doanh thu / số đơn đã tính (theo ngày, giờ, buổi, sản phẩm) để đối chiếu các dòng nói về một phần dữ liệu."""
+    revenues, orders = [], []
+    breakdowns = [(calculations.get('daily_breakdown') or {}).values()]
+    time_analysis = calculations.get('time_analysis') or {}
+    breakdowns.append((time_analysis.get('hourly_breakdown') or {}).values())
+    breakdowns.append((time_analysis.get('time_period_breakdown') or {}).values())
+    product_analysis = calculations.get('product_analysis') or {}
+    breakdowns += [product_analysis.get('top_products_by_quantity', []), product_analysis.get('top_products_by_revenue', [])]
+    for stats in (stats for breakdown in breakdowns for stats in breakdown):
+        if isinstance(stats, dict):
+            revenues.append(stats.get('total_revenue'))
+            orders.append(stats.get('order_count'))
+    return {'revenue': [v for v in revenues if v is not None], 'orders': [v for v in orders if v is not None]}
+
+
+def check_totals(report: str, calculations: Dict[str, Any], tolerance: float) -> List[str]:
+    summary = calculations.get('revenue_summary') or {}
+    figures = known_figures(calculations)
+    issues = []
+    checks = [
+        (AVERAGE_ORDER, 'average_order_value', None, "Giá trị đơn hàng trung bình", lambda v: f"{v:,.0f} VNĐ"),
+        (TOTAL_REVENUE, 'total_revenue', 'revenue', "Tổng doanh thu", lambda v: f"{v:,.0f} VNĐ"),
+        (TOTAL_ORDERS, 'total_orders', 'orders', "Tổng số đơn hàng", lambda v: f"{v:,}"),
+    ]
+    for line in report.splitlines():
+        text = _normalize(_strip_markdown(LIST_MARKER.sub('', line)))
+        for pattern, key, scoped_figures, label, fmt in checks:
+            match = pattern.search(text)
+            if summary.get(key) is None or not match:
+                continue
+            # Chỉ các số đứng sau cụm từ: "chiếm 3% tổng doanh thu" không phải là câu nêu tổng doanh thu
+            numbers = parse_numbers(text[match.end():])
+            expected = [summary[key]]
+            if SCOPED.search(text) and scoped_figures:
+                expected += figures[scoped_figures]
+            if numbers and not _matches(numbers, expected, tolerance):
+                issues.append(f"{label} sai: \"{line.strip()}\" (đúng là {fmt(summary[key])}).")
+            break  # Mỗi dòng chỉ đối chiếu với chỉ số cụ thể nhất khớp được
+    return issues
+
+
+def field_label(field: str) -> str:
+    return 'số lượng' if field == 'total_quantity' else 'doanh thu'
+
+
+def check_top_products(report: str, product_analysis: Dict[str, Any], tolerance: float) -> List[str]:
+    issues = []
+    rankings = {
+        'số lượng': ('top_products_by_quantity', 'total_quantity'),
+        'doanh thu': ('top_products_by_revenue', 'total_revenue'),
+    }
+    known = {}
+    for key, _ in rankings.values():
+        for entry in product_analysis.get(key, []):
+            known[_normalize(str(entry['product_name']))] = entry
+    for title, lines in split_sections(report):
+        if 'top' not in title and 'bán chạy' not in title:
+            continue
+        ranking = [value for label, value in rankings.items() if label in title]
+        if len(ranking) != 1 or not product_analysis.get(ranking[0][0]):
+            continue
+        key, field = ranking[0]
+        top = {_normalize(str(entry['product_name'])): entry for entry in product_analysis[key]}
+        expected = ', '.join(str(entry['product_name']) for entry in product_analysis[key])
+        for line in lines:
+            if not LIST_MARKER.match(line):
+                continue
+            name = _find_product(line, known)
+            if name is None:
+                # Chỉ mục đánh số (1., 2., ...) mới chắc chắn là một sản phẩm trong bảng xếp hạng
+                listed = _item_name(line) if re.match(r'^\s*\d{1,2}[.)]', line) else ''
+                if listed:
+                    issues.append(f"\"{listed}\" không nằm trong top {len(top)} theo {field_label(field)} "
+                                  f"(đúng là: {expected}).")
+                continue
+            if name not in top:
+                issues.append(f"\"{known[name]['product_name']}\" không nằm trong top {len(top)} theo "
+                              f"{field_label(field)} (đúng là: {expected}).")
+                continue
+            entry = top[name]
+            numbers = parse_numbers(_strip_markdown(LIST_MARKER.sub('', line)).replace(str(entry['product_name']), ''))
+            targets = [entry.get('total_quantity'), entry.get('total_revenue'), entry.get('order_count')]
+            if numbers and not _matches(numbers, [t for t in targets if t is not None], tolerance):
+                issues.append(f"Số liệu của \"{entry['product_name']}\" sai: \"{line.strip()}\" "
+                              f"(số lượng {entry.get('total_quantity', 0):,}, doanh thu {entry.get('total_revenue', 0):,.0f} VNĐ).")
+    return issues
+
+
+def check_busiest_hours(report: str, time_analysis: Dict[str, Any]) -> List[str]:
+    hourly = time_analysis.get('hourly_breakdown') or {}
+    if not hourly:
+        return []
+    peak = max(stats.get('order_count', 0) for stats in hourly.values())
+    busiest = sorted(int(hour) for hour, stats in hourly.items() if stats.get('order_count', 0) == peak)
+    for title, lines in split_sections(report):
+        if not any(word in title for word in ('cao điểm', 'đông khách', 'khung giờ', 'theo giờ')):
+            continue
+        for line in lines:
+            match = HOUR.search(_normalize(line))
+            if match:
+                hour = int(next(group for group in match.groups() if group))
+                if hour not in busiest:
+                    return [f"Giờ đông khách nhất không phải {hour}h mà là "
+                            f"{', '.join(f'{h}h' for h in busiest)} ({peak:,} đơn)."]
+                break
+    return []
+
+
+def check_report(report: str, calculations: Dict[str, Any], tolerance: float = TOLERANCE) -> List[str]:
+    """Các lỗi số liệu tìm thấy trong bản phân tích (rỗng nếu không thấy sai sót)."""
+    if not isinstance(report, str) or not report.strip():
+        return ["Bản phân tích rỗng."]
+    issues = []
+    issues += check_totals(report, calculations, tolerance)
+    issues += check_top_products(report, calculations.get('product_analysis') or {}, tolerance)
+    issues += check_busiest_hours(report, calculations.get('time_analysis') or {})
+    return issues
+
+
+def critique_from_issues(issues: List[str]) -> str:
+    """Phản hồi gửi lại analyst khi bản nháp sai số liệu."""
+    return ("Bản phân tích có số liệu không khớp với kết quả tính toán. Sửa các lỗi sau, "
+            "chỉ dùng đúng số liệu đã cung cấp:\n" + "\n".join(f"- {issue}" for issue in issues))
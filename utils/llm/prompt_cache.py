@@ -0,0 +1,125 @@
+"""
+Bộ nhớ đệm bền (tệp SQLite) cho câu trả lời của LLM, khớp chính xác theo lời gọi.
+
+Khóa là SHA-256 của model, temperature, model_kwargs và toàn bộ messages (loại + nội dung), nên
+chạy lại cùng payload (cùng số liệu, kiến thức và câu hỏi) trả ngay câu trả lời đã lưu thay vì
+gọi lại Gemini. Mục quá ttl_seconds bị coi như không có; khi tổng kích thước vượt max_bytes,
+các mục lâu không dùng nhất bị xóa trước (LRU).
+
+Cấu hình qua biến môi trường:
+- LLM_CACHE_PATH: tệp SQLite (mặc định llm_cache.db), rỗng thì tắt bộ nhớ đệm;
+- LLM_CACHE_TTL_SECONDS (mặc định 7 ngày), LLM_CACHE_MAX_BYTES (mặc định 50 MB);
+- LLM_CACHE_BYPASS=1: luôn gọi LLM (không đọc bộ nhớ đệm) nhưng vẫn ghi câu trả lời mới.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, List, Optional
+
+LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', 'llm_cache.db')
+LLM_CACHE_TTL_SECONDS = float(os.getenv('LLM_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+LLM_CACHE_MAX_BYTES = int(os.getenv('LLM_CACHE_MAX_BYTES', 50 * 1024 * 1024))
+LLM_CACHE_BYPASS = os.getenv('LLM_CACHE_BYPASS', '0') == '1'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses(last_used_at);
+"""
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def model_name(llm: Any) -> str:
+    """Tên model của đối tượng chat (mô hình giả trong thử nghiệm không có thuộc tính model)."""
+    return str(getattr(llm, 'model', None) or getattr(llm, 'model_name', None) or type(llm).__name__)
+
+
+def prompt_key(llm: Any, messages: List[Any]) -> str:
+    """Khóa của một lời gọi: cùng model, tham số sinh và messages thì cùng khóa."""
+    payload = {
+        'model': model_name(llm),
+        'temperature': getattr(llm, 'temperature', None),
+        'model_kwargs': getattr(llm, 'model_kwargs', None),
+        'messages': [[getattr(m, 'type', type(m).__name__), m.content] for m in messages],
+    }
+    text = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class PromptCache:
+    """Bảng key -> câu trả lời (message của langchain dạng JSON) trong một tệp SQLite, dùng được từ nhiều luồng."""
+
+    def __init__(self, path: str, ttl_seconds: float = LLM_CACHE_TTL_SECONDS, max_bytes: int = LLM_CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        self._conn.close()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Câu trả lời đã lưu (AIMessage), hoặc None nếu chưa có/đã hết hạn."""
+        from langchain_core.messages import messages_from_dict
+
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ? AND created_at >= ?",
+                                     (key, now - self.ttl_seconds)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE responses SET last_used_at = ?, hits = hits + 1 WHERE key = ?", (now, key))
+        return messages_from_dict([json.loads(row[0])])[0]
+
+    def put(self, key: str, response: Any, model: Optional[str] = None):
+        """Lưu câu trả lời, rồi xóa mục hết hạn và các mục cũ nhất cho tới khi tổng kích thước <= max_bytes."""
+        from langchain_core.messages import message_to_dict
+
+        text = json.dumps(message_to_dict(response), ensure_ascii=False, default=str)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created_at, last_used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)", (key, model, text, len(text.encode('utf-8')), now, now))
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+            self._conn.execute("""
+                DELETE FROM responses WHERE key IN (
+                    SELECT key FROM (
+                        SELECT key, SUM(size) OVER (ORDER BY last_used_at DESC, key) AS running FROM responses
+                    ) WHERE running > ?
+                )""", (self.max_bytes,))
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size, hits = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(hits), 0) FROM responses").fetchone()
+        return {'entries': entries, 'bytes': size, 'hits': hits}
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses")
+
+
+def get_prompt_cache() -> Optional[PromptCache]:
+    """Bộ nhớ đệm dùng chung của tiến trình theo LLM_CACHE_PATH; None nếu bị tắt."""
+    global _cache
+    if not LLM_CACHE_PATH:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = PromptCache(LLM_CACHE_PATH)
+        return _cache
@@ -0,0 +1,248 @@
+import base64
+import contextvars
+import os
+import queue
+import smtplib
+import threading
+import uuid
+from concurrent.futures import Future
+from contextlib import ExitStack
+from email.header import Header
+from email.utils import encode_rfc2231, formatdate, make_msgid
+from typing import BinaryIO, Iterator, List, Optional
+
+from utils.tracing.tracer import span
+
+# Đọc file đính kèm theo từng khối; 57 byte nhị phân = 76 ký tự base64 = một dòng MIME
+LINE_BYTES = 57
+CHUNK_BYTES = LINE_BYTES * 1024
+
+
+class OutgoingMail:
+    def __init__(self, sender: str, recipients: List[str], subject: str, body: str,
+                 attachments: Optional[List[str]] = None):
+        self.sender = sender
+        self.recipients = recipients
+        self.subject = subject
+        self.body = body
+        self.attachments = attachments or []
+
+
+def _encode_lines(data: bytes) -> bytes:
+    """Mã hóa base64, ngắt dòng 76 ký tự theo chuẩn MIME."""
+    lines = []
+    for i in range(0, len(data), LINE_BYTES):
+        lines.append(base64.b64encode(data[i:i + LINE_BYTES]))
+    return b"\r\n".join(lines) + b"\r\n" if lines else b""
+
+
+def iter_message_chunks(mail: OutgoingMail, files: List[BinaryIO]) -> Iterator[bytes]:
+    """
+    Sinh nội dung MIME theo từng khối để gửi thẳng qua lệnh DATA.
+    files là các file đính kèm đã mở sẵn (cùng thứ tự với mail.attachments), được đọc từ đầu và
+    mã hóa base64 từng khối, không nạp cả file vào bộ nhớ.
+    Mọi phần thân đều là base64 nên không có dòng nào bắt đầu bằng '.', không cần dot-stuffing.
+    """
+    boundary = f"=={uuid.uuid4().hex}"
+    headers = [
+        f"From: {mail.sender}",
+        f"To: {', '.join(mail.recipients)}",
+        f"Subject: {Header(mail.subject, 'utf-8').encode()}",
+        f"Date: {formatdate(localtime=True)}",
+        f"Message-ID: {make_msgid()}",
+        "MIME-Version: 1.0",
+        f'Content-Type: multipart/mixed; boundary="{boundary}"',
+        "",
+        f"--{boundary}",
+        'Content-Type: text/plain; charset="utf-8"',
+        "Content-Transfer-Encoding: base64",
+        "",
+        "",
+    ]
+    yield "\r\n".join(headers).encode("ascii")
+    yield _encode_lines(mail.body.encode("utf-8"))
+
+    for path, f in zip(mail.attachments, files):
+        filename = encode_rfc2231(os.path.basename(path), "utf-8")
+        part_headers = [
+            f"--{boundary}",
+            "Content-Type: application/octet-stream",
+            "Content-Transfer-Encoding: base64",
+            f"Content-Disposition: attachment; filename*={filename}",
+            "",
+            "",
+        ]
+        yield "\r\n".join(part_headers).encode("ascii")
+        f.seek(0)
+        while True:
+            chunk = f.read(CHUNK_BYTES)
+            if not chunk:
+                break
+            yield _encode_lines(chunk)
+
+    yield f"--{boundary}--\r\n".encode("ascii")
+
+
+class SMTPMailer:
+    """
+    Giữ một kết nối SMTP đã xác thực để gửi nhiều email liên tiếp.
+    Tự kết nối lại khi server ngắt kết nối hoặc sau max_messages_per_connection email.
+    """
+
+    def __init__(self, host: str, port: int, user: str = "", password: str = "",
+                 use_starttls: bool = True, timeout: float = 30,
+                 max_messages_per_connection: int = 100, retries: int = 2):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.use_starttls = use_starttls
+        self.timeout = timeout
+        self.max_messages_per_connection = max_messages_per_connection
+        self.retries = retries
+        self._server: Optional[smtplib.SMTP] = None
+        self._sent_on_connection = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.use_starttls:
+            server.starttls()
+        if self.user and self.password:
+            server.login(self.user, self.password)
+        self._sent_on_connection = 0
+        return server
+
+    def _drop_connection(self, graceful: bool = True):
+        """Đóng kết nối hiện tại; graceful=False đóng socket luôn, không gửi QUIT (kết nối có thể đang giữa lệnh DATA)."""
+        if self._server is not None:
+            try:
+                if not graceful:
+                    raise OSError
+                self._server.quit()
+            except (smtplib.SMTPException, OSError):
+                try:
+                    self._server.close()
+                except OSError:
+                    pass
+        self._server = None
+
+    def _get_connection(self) -> smtplib.SMTP:
+        if self._server is not None and self._sent_on_connection >= self.max_messages_per_connection:
+            self._drop_connection()
+        if self._server is None:
+            self._server = self._connect()
+        return self._server
+
+    def _send_once(self, server: smtplib.SMTP, mail: OutgoingMail, files: List[BinaryIO]):
+        server.ehlo_or_helo_if_needed()
+        code, resp = server.mail(mail.sender)
+        if code != 250:
+            server.rset()
+            raise smtplib.SMTPSenderRefused(code, resp, mail.sender)
+        for recipient in mail.recipients:
+            code, resp = server.rcpt(recipient)
+            if code not in (250, 251):
+                server.rset()
+                raise smtplib.SMTPRecipientsRefused({recipient: (code, resp)})
+        code, resp = server.docmd("data")
+        if code != 354:
+            server.rset()
+            raise smtplib.SMTPDataError(code, resp)
+        for chunk in iter_message_chunks(mail, files):
+            server.send(chunk)
+        server.send(b".\r\n")
+        code, resp = server.getreply()
+        if code != 250:
+            raise smtplib.SMTPDataError(code, resp)
+
+    def send(self, mail: OutgoingMail):
+        """
+        Gửi một email, thử kết nối lại nếu kết nối hiện tại đã bị đóng.
+        Mọi file đính kèm được mở trước lệnh MAIL FROM: file thiếu hoặc không đọc được báo lỗi ngay,
+        không để kết nối dở dang giữa lệnh DATA.
+        """
+        with ExitStack() as stack:
+            files = [stack.enter_context(open(path, "rb")) for path in mail.attachments]
+            attachment_bytes = sum(os.fstat(f.fileno()).st_size for f in files)
+            with self._lock, span("smtp.send", host=self.host, recipients=len(mail.recipients),
+                                  attachments=len(mail.attachments), attachment_bytes=attachment_bytes) as s:
+                for attempt in range(self.retries + 1):
+                    try:
+                        server = self._get_connection()
+                        self._send_once(server, mail, files)
+                        self._sent_on_connection += 1
+                        s.set(attempts=attempt + 1)
+                        return
+                    except (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError) as e:
+                        self._drop_connection()
+                        if attempt == self.retries:
+                            raise
+                        print(f"⚠️ Mất kết nối SMTP ({e}), đang kết nối lại...")
+                    except Exception:
+                        # Không biết kết nối đang ở bước nào (có thể giữa lệnh DATA): bỏ nó, email sau dùng kết nối mới
+                        self._drop_connection(graceful=False)
+                        raise
+
+    def close(self):
+        with self._lock:
+            self._drop_connection()
+
+
+class MailQueue:
+    """
+    Hàng đợi gửi email chạy nền, dùng chung một SMTPMailer cho mọi email.
+    submit() trả về ngay một Future; nơi gọi chỉ chờ Future khi cần biết kết quả. Ví dụ send_email_node
+    chờ trong lượt có checkpoint để lỗi gửi làm dừng lượt đó và chạy lại được, còn lại thì gửi nền.
+    """
+
+    def __init__(self, mailer: SMTPMailer):
+        self.mailer = mailer
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(target=self._worker, name="mail-queue", daemon=True)
+        self._thread.start()
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                break
+            mail, future, context = item
+            try:
+                # Chạy trong context của nơi gọi submit() để span SMTP nằm dưới span của node gửi email
+                context.run(self.mailer.send, mail)
+                print(f"✅ Gửi email thành công: {mail.subject}")
+                future.set_result(True)
+            except Exception as e:
+                print(f"❌ Lỗi khi gửi email: {e}")
+                future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    def submit(self, mail: OutgoingMail) -> Future:
+        future: Future = Future()
+        self._queue.put((mail, future, contextvars.copy_context()))
+        return future
+
+    def close(self, wait: bool = True):
+        """Dừng hàng đợi sau khi gửi hết các email đang chờ rồi đóng kết nối."""
+        self._queue.put(None)
+        if wait:
+            self._thread.join()
+        self.mailer.close()
+
+
+def mailer_from_env() -> Optional[SMTPMailer]:
+    """Tạo SMTPMailer từ cấu hình trong .env; trả về None nếu thiếu thông tin đăng nhập."""
+    email_user = os.getenv("EMAIL_USER", "")
+    email_password = os.getenv("EMAIL_PASSWORD", "")
+    if not all([email_user, email_password]):
+        return None
+    return SMTPMailer(
+        host=os.getenv("SMTP_SERVER", "smtp.gmail.com"),
+        port=int(os.getenv("SMTP_PORT", "587")),
+        user=email_user,
+        password=email_password,
+        use_starttls=os.getenv("SMTP_STARTTLS", "1") != "0",
+    )
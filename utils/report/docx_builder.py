@@ -0,0 +1,197 @@
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from docx import Document
+from docx.shared import Inches
+from PIL import Image
+
+# --- Cấu hình ---
+TEMPLATE_PATH = os.path.join('templates', 'report_template.docx')
+IMAGE_WIDTH_INCHES = 6
+IMAGE_DPI = 150  # Độ phân giải đủ nét khi in, nhỏ hơn nhiều so với PNG 300 dpi gốc
+
+# Các đoạn giữ chỗ trong template, được thay bằng nội dung của từng báo cáo
+GENERATED_AT = '{{generated_at}}'
+OVERVIEW_BLOCK = '{{overview}}'
+PRODUCTS_BLOCK = '{{products}}'
+TIME_BLOCK = '{{time}}'
+CHARTS_BLOCK = '{{charts}}'
+
+_template_bytes: Optional[bytes] = None
+
+
+def build_template() -> bytes:
+    """
+    Dựng template báo cáo với các phần cố định và các đoạn giữ chỗ.
+    Dùng khi chưa có file template soạn sẵn.
+    """
+    doc = Document()
+
+    title = doc.add_heading("Báo Cáo Phân Tích Dữ Liệu F&B", 0)
+    title.alignment = 1  # Căn giữa
+
+    doc.add_paragraph(f"Ngày tạo: {GENERATED_AT}")
+    doc.add_paragraph("")
+
+    doc.add_heading("Tóm Tắt", level=1)
+    summary = doc.add_paragraph()
+    summary.add_run("Báo cáo này trình bày kết quả phân tích dữ liệu kinh doanh ngành F&B, bao gồm:")
+    summary.add_run("\n• Phân tích doanh thu và đơn hàng")
+    summary.add_run("\n• Top sản phẩm bán chạy")
+    summary.add_run("\n• Phân tích theo thời gian")
+    summary.add_run("\n• Các khuyến nghị kinh doanh")
+
+    doc.add_heading("Thống Kê Tổng Quan", level=1)
+    doc.add_paragraph(OVERVIEW_BLOCK)
+
+    doc.add_heading("Phân Tích Sản Phẩm", level=1)
+    doc.add_paragraph(PRODUCTS_BLOCK)
+
+    doc.add_heading("Phân Tích Theo Thời Gian", level=1)
+    doc.add_paragraph(TIME_BLOCK)
+
+    doc.add_paragraph(CHARTS_BLOCK)
+
+    doc.add_heading("Kết Luận & Khuyến Nghị", level=1)
+    doc.add_paragraph("Dựa trên phân tích dữ liệu, chúng tôi đưa ra các khuyến nghị sau:")
+    doc.add_paragraph("• Tập trung vào các sản phẩm bán chạy")
+    doc.add_paragraph("• Tối ưu hóa thời gian phục vụ trong giờ cao điểm")
+    doc.add_paragraph("• Phát triển chiến lược marketing cho các khung giờ thấp")
+
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def load_template(template_path: str = TEMPLATE_PATH) -> bytes:
+    """Tải template một lần cho mỗi tiến trình, các báo cáo sau dùng lại bản trong bộ nhớ."""
+    global _template_bytes
+    if _template_bytes is None:
+        if os.path.exists(template_path):
+            with open(template_path, 'rb') as f:
+                _template_bytes = f.read()
+        else:
+            _template_bytes = build_template()
+    return _template_bytes
+
+
+def downsample_image(image_path: str, width_inches: float = IMAGE_WIDTH_INCHES, dpi: int = IMAGE_DPI) -> io.BytesIO:
+    """Thu nhỏ ảnh về đúng kích thước hiển thị trước khi nhúng vào báo cáo."""
+    target_width = int(width_inches * dpi)
+    with Image.open(image_path) as img:
+        if img.width > target_width:
+            target_height = round(img.height * target_width / img.width)
+            img = img.resize((target_width, target_height), Image.LANCZOS)
+        stream = io.BytesIO()
+        img.save(stream, format='PNG', optimize=True)
+    stream.seek(0)
+    return stream
+
+
+def _find_placeholder(doc, marker: str):
+    for paragraph in doc.paragraphs:
+        if paragraph.text == marker:
+            return paragraph
+    return None
+
+
+def _fill_block(doc, marker: str, items: List[tuple]):
+    """
+    Thay đoạn giữ chỗ bằng danh sách (kiểu, nội dung).
+    Kiểu là tên style của template hoặc 'picture' để chèn ảnh.
+    """
+    placeholder = _find_placeholder(doc, marker)
+    if placeholder is None:
+        return
+    for kind, content in items:
+        if kind == 'picture':
+            paragraph = placeholder.insert_paragraph_before()
+            paragraph.add_run().add_picture(content, width=Inches(IMAGE_WIDTH_INCHES))
+        else:
+            placeholder.insert_paragraph_before(content, style=kind)
+    element = placeholder._element
+    element.getparent().remove(element)
+
+
+def render_report(calculations: Dict[str, Any], chart_paths: Dict[str, str], report_path: str,
+                  generated_at: Optional[datetime] = None) -> str:
+    """Điền template với số liệu của một báo cáo và lưu ra report_path."""
+    doc = Document(io.BytesIO(load_template()))
+    generated_at = generated_at or datetime.now()
+
+    for paragraph in doc.paragraphs:
+        if GENERATED_AT in paragraph.text:
+            for run in paragraph.runs:
+                run.text = run.text.replace(GENERATED_AT, generated_at.strftime('%d/%m/%Y %H:%M:%S'))
+            break
+
+    overview = []
+    if "revenue_summary" in calculations:
+        revenue_data = calculations["revenue_summary"]
+        overview.append(('Normal', f"• Tổng doanh thu: {revenue_data.get('total_revenue', 0):,.0f} VNĐ"))
+        overview.append(('Normal', f"• Tổng số đơn hàng: {revenue_data.get('total_orders', 0):,}"))
+        overview.append(('Normal', f"• Giá trị đơn hàng trung bình: {revenue_data.get('average_order_value', 0):,.0f} VNĐ"))
+    _fill_block(doc, OVERVIEW_BLOCK, overview)
+
+    products = []
+    if "product_analysis" in calculations:
+        product_data = calculations["product_analysis"]
+        products.append(('Heading 2', "Top 5 Sản Phẩm Theo Số Lượng"))
+        for i, product in enumerate(product_data.get("top_products_by_quantity", [])[:5], 1):
+            products.append(('Normal', f"{i}. {product['product_name']}: {product['total_quantity']:,} đơn vị"))
+        products.append(('Heading 2', "Top 5 Sản Phẩm Theo Doanh Thu"))
+        for i, product in enumerate(product_data.get("top_products_by_revenue", [])[:5], 1):
+            products.append(('Normal', f"{i}. {product['product_name']}: {product['total_revenue']:,.0f} VNĐ"))
+    _fill_block(doc, PRODUCTS_BLOCK, products)
+
+    time_items = []
+    if "time_analysis" in calculations:
+        time_items.append(('Heading 2', "Giờ Cao Điểm"))
+        for hour_data in calculations["time_analysis"].get("busiest_hours", [])[:5]:
+            time_items.append(('Normal', f"• Giờ {hour_data['hour']}: {hour_data['order_count']} đơn hàng"))
+    _fill_block(doc, TIME_BLOCK, time_items)
+
+    charts = []
+    if chart_paths:
+        charts.append(('Heading 1', "Biểu Đồ"))
+        for chart_name, chart_path in chart_paths.items():
+            if os.path.exists(chart_path):
+                charts.append(('picture', downsample_image(chart_path)))
+                charts.append(('Normal', f"*{chart_name.replace('_', ' ').title()}*"))
+    _fill_block(doc, CHARTS_BLOCK, charts)
+
+    doc.save(report_path)
+    return report_path
+
+
+def _render_job(job: Dict[str, Any]) -> str:
+    try:
+        return render_report(job["calculations"], job.get("chart_paths", {}), job["report_path"],
+                             job.get("generated_at"))
+    except Exception as e:
+        print(f"❌ Lỗi khi tạo báo cáo {job.get('report_path')}: {e}")
+        return ""
+
+
+def _init_worker(template_bytes: bytes):
+    global _template_bytes
+    _template_bytes = template_bytes
+
+
+def render_reports(jobs: List[Dict[str, Any]], max_workers: Optional[int] = None) -> List[str]:
+    """
+    Tạo nhiều báo cáo (ví dụ mỗi cửa hàng một báo cáo) song song trên nhiều tiến trình.
+    Mỗi job gồm 'calculations', 'chart_paths', 'report_path'. Trả về đường dẫn theo đúng thứ tự job,
+    chuỗi rỗng nếu job đó lỗi.
+    """
+    if not jobs:
+        return []
+    template_bytes = load_template()
+    if max_workers == 1 or len(jobs) == 1:
+        return [_render_job(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(template_bytes,)) as executor:
+        return list(executor.map(_render_job, jobs))
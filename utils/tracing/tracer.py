@@ -0,0 +1,179 @@
+"""
+Tracing nhẹ cho quy trình báo cáo: mỗi node của graph và mỗi lời gọi ra ngoài (n8n, LLM, SMTP)
+là một span lồng nhau, span cha được theo dõi bằng contextvars nên không phải truyền tay.
+
+    with span("fetch_data", from_date=from_date) as s:
+        ...
+        s.set(response_bytes=len(response.content))
+
+    @traced("node.preprocess")
+    def preprocess_node(state): ...
+
+Span kết thúc được ghi vào TRACE_FILE (JSONL, mỗi dòng một span, tên trường theo OpenTelemetry:
+trace_id, span_id, parent_span_id, start/end_time_unix_nano, attributes, status) và giữ trong
+bộ nhớ để summary_table() in bảng tổng hợp cuối lượt chạy. TRACE_FILE rỗng thì không ghi tệp.
+"""
+import functools
+import json
+import os
+import secrets
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+
+TRACE_FILE = os.getenv('TRACE_FILE', 'traces.jsonl')
+TOKEN_KEYS = ('input_tokens', 'output_tokens', 'total_tokens')
+
+_current_span: ContextVar[Optional['Span']] = ContextVar('current_span', default=None)
+
+
+def sizes(value: Any) -> Dict[str, int]:
+    """Kích thước nông của dữ liệu vào/ra: độ dài chuỗi, số phần tử list/dict (theo từng khóa nếu là dict)."""
+    if isinstance(value, dict):
+        return {str(key): len(item) for key, item in value.items() if isinstance(item, (str, bytes, list, dict))}
+    if isinstance(value, (str, bytes, list, tuple)):
+        return {'len': len(value)}
+    return {}
+
+
+class Span:
+    def __init__(self, name: str, parent: Optional['Span'], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent.span_id if parent else None
+        self.depth = parent.depth + 1 if parent else 0
+        self.attributes = dict(attributes)
+        self.status = 'ok'
+        self.start_ns = time.time_ns()
+        self._start = time.perf_counter()
+        self.duration = 0.0
+
+    def set(self, **attributes: Any):
+        self.attributes.update(attributes)
+
+    def set_sizes(self, prefix: str, value: Any):
+        for key, size in sizes(value).items():
+            self.attributes[f"{prefix}.{key}"] = size
+
+    def record_llm_usage(self, response: Any):
+        """Số token từ usage_metadata của AIMessage (langchain), nếu nhà cung cấp trả về."""
+        usage = getattr(response, 'usage_metadata', None) or {}
+        for key in TOKEN_KEYS:
+            if usage.get(key) is not None:
+                self.attributes[f"llm.{key}"] = int(usage[key])
+        content = getattr(response, 'content', None)
+        if isinstance(content, str):
+            self.attributes['llm.output_chars'] = len(content)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_span_id': self.parent_span_id,
+            'name': self.name,
+            'start_time_unix_nano': self.start_ns,
+            'end_time_unix_nano': self.start_ns + int(self.duration * 1e9),
+            'duration_ms': round(self.duration * 1000, 3),
+            'attributes': self.attributes,
+            'status': self.status,
+        }
+
+
+class Tracer:
+    def __init__(self, path: Optional[str] = TRACE_FILE):
+        self.path = path
+        self._finished: List[Span] = []
+        self._lock = threading.Lock()
+
+    def start(self, name: str, **attributes: Any) -> 'SpanScope':
+        return SpanScope(self, name, attributes)
+
+    def _export(self, finished: Span):
+        with self._lock:
+            self._finished.append(finished)
+            if self.path:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(finished.to_dict(), ensure_ascii=False, default=str) + '\n')
+
+    def collect(self, trace_id: str) -> List[Span]:
+        """Lấy (và bỏ khỏi bộ nhớ) các span đã kết thúc của một trace, theo thứ tự bắt đầu."""
+        with self._lock:
+            spans = [s for s in self._finished if s.trace_id == trace_id]
+            self._finished = [s for s in self._finished if s.trace_id != trace_id]
+        return sorted(spans, key=lambda s: s.start_ns)
+
+
+class SpanScope:
+    """Context manager mở một span con của span hiện tại (theo contextvars)."""
+
+    def __init__(self, tracer: Tracer, name: str, attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.span = Span(name, _current_span.get(), attributes)
+        self._token = None
+
+    def __enter__(self) -> Span:
+        self._token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        self.span.duration = time.perf_counter() - self.span._start
+        if exc is not None:
+            self.span.status = 'error'
+            self.span.attributes['error'] = f"{exc_type.__name__}: {exc}"
+        _current_span.reset(self._token)
+        self.tracer._export(self.span)
+        return False
+
+
+tracer = Tracer()
+
+
+def span(name: str, **attributes: Any) -> SpanScope:
+    return tracer.start(name, **attributes)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """Decorator: chạy hàm trong một span, ghi kích thước đối số đầu tiên (state) và giá trị trả về."""
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name) as s:
+                if args:
+                    s.set_sizes('input', args[0])
+                result = func(*args, **kwargs)
+                s.set_sizes('output', result)
+                return result
+        return wrapper
+    return decorator
+
+
+def summary_table(spans: List[Span]) -> str:
+    """Bảng tổng hợp theo tên span (số lần, tổng/lớn nhất ms, % thời gian của span gốc, token LLM)."""
+    if not spans:
+        return "(không có span nào)"
+    root_duration = max((s.duration for s in spans if s.parent_span_id is None), default=0.0)
+    groups: Dict[str, Dict[str, Any]] = {}
+    for s in spans:
+        group = groups.setdefault(s.name, {'depth': s.depth, 'count': 0, 'total': 0.0, 'max': 0.0,
+                                           'tokens': 0, 'errors': 0})
+        group['count'] += 1
+        group['total'] += s.duration
+        group['max'] = max(group['max'], s.duration)
+        group['tokens'] += s.attributes.get('llm.total_tokens', 0)
+        group['errors'] += s.status == 'error'
+
+    lines = [f"{'Span':<40} {'Lần':>4} {'Tổng ms':>11} {'Max ms':>11} {'%':>6} {'Token':>8} {'Lỗi':>4}"]
+    for name, group in groups.items():
+        share = group['total'] / root_duration * 100 if root_duration else 0.0
+        label = ('  ' * group['depth'] + name)[:40]
+        lines.append(f"{label:<40} {group['count']:>4} {group['total'] * 1000:>11.1f} {group['max'] * 1000:>11.1f}"
+                     f" {share:>6.1f} {group['tokens'] or '':>8} {group['errors'] or '':>4}")
+    return '\n'.join(lines)